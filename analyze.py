@@ -0,0 +1,361 @@
+import argparse
+import json
+import math
+import os
+import sys
+from datetime import datetime
+
+from zhejing.metrics import NAN, RequestColumns, column_value, format_ms, mean_difference, request_tokens, summarize
+from zhejing.phases import in_window
+from zhejing.results_writer import load_all_results
+
+# 每个请求的向量化列，缺失值为 NaN；e2e/tpot/completion_tokens 只对完整完成的请求记录
+COLUMNS = ("start_time", "success", "e2e", "ttft", "tpot", "prompt_tokens", "completion_tokens")
+# 参与回归判定的延迟指标（逐请求样本，越小越好）
+LATENCY_METRICS = {"e2e": "端到端", "ttft": "TTFT", "tpot": "TPOT"}
+# 参与回归判定的吞吐指标（逐次运行样本，越大越好）
+THROUGHPUT_METRICS = {"requests_per_second": "QPS", "output_tokens_per_second": "输出tok/s"}
+
+
+class ResultColumns(RequestColumns):
+    """
+    按列保存结果文件中每个请求的时间和 token 数（见 RequestColumns），filenames 为对应的数据集文件名
+    """
+
+    COLUMNS = COLUMNS
+
+    def __init__(self):
+        super().__init__()
+        self.filenames = []
+
+    def record_result(self, result):
+        success = result["success"]
+        complete = success and not result.get("aborted")
+        timing = result.get("timing") or {}
+        prompt_tokens, completion_tokens, _ = request_tokens(result) if success else (None, None, None)
+
+        columns = self.columns
+        columns["start_time"].append(column_value(result.get("start_time")))
+        columns["success"].append(1.0 if success else 0.0)
+        columns["e2e"].append(result["processing_time"] if complete else NAN)
+        columns["ttft"].append(column_value(timing.get("ttft")) if success else NAN)
+        columns["tpot"].append(column_value(timing.get("tpot")) if complete else NAN)
+        columns["prompt_tokens"].append(column_value(prompt_tokens))
+        columns["completion_tokens"].append(column_value(completion_tokens if complete else None))
+        self.filenames.append(result.get("filename"))
+
+    def merge(self, other):
+        super().merge(other)
+        self.filenames.extend(other.filenames)
+        return self
+
+    def values(self, name, rows=None):
+        """
+        取出一列中不为 NaN 的值，rows 为 None 时取全部请求
+        """
+        column = self.columns[name]
+        indices = range(len(column)) if rows is None else rows
+        return [column[i] for i in indices if not math.isnan(column[i])]
+
+
+def load_run(file_path):
+    """
+    读取一次运行的结果，支持 all_results_*.jsonl 和旧版的 all_results_*.json
+    """
+    if file_path.endswith(".jsonl"):
+        return load_all_results(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_window(all_results):
+    """
+    结果汇总中记录了稳态窗口时，返回以时间戳表示的窗口边界，否则返回 None
+    """
+    window_stats = all_results.get("window_stats")
+    if not window_stats:
+        return None
+    return {name: datetime.fromisoformat(window_stats[name]).timestamp() for name in ("steady_start", "steady_end")}
+
+
+def run_duration(results, window):
+    """
+    统计时长(秒): 有稳态窗口时为窗口长度，否则为第一个请求发出到最后一个请求完成的时间；结果没有 start_time 时为 None
+    """
+    if window:
+        return window["steady_end"] - window["steady_start"]
+    timed = [result for result in results if result.get("start_time") is not None]
+    if not timed:
+        return None
+    return max(result["start_time"] + result["processing_time"] for result in timed) - \
+        min(result["start_time"] for result in timed)
+
+
+def load_results(file_paths):
+    """
+    读取一组结果文件（同一构建的一次或多次运行），返回 (合并后的 ResultColumns, 每次运行的吞吐列表)
+
+    运行汇总中记录了稳态窗口（配置了预热/冷却）时，只统计在窗口内完成的请求
+    """
+    columns = ResultColumns()
+    runs = []
+    for file_path in file_paths:
+        all_results = load_run(file_path)
+        results = [result for result in all_results["results"] if not result.get("is_background")]
+        window = run_window(all_results)
+        if window:
+            results = [result for result in results if in_window(result, window)]
+
+        run_columns = ResultColumns()
+        for result in results:
+            run_columns.record_result(result)
+        columns.merge(run_columns)
+
+        duration = run_duration(results, window)
+        successful = sum(1 for result in results if result["success"])
+        runs.append({
+            "file": file_path,
+            "requests": len(results),
+            "successful": successful,
+            "duration": duration,
+            "windowed": window is not None,
+            "requests_per_second": successful / duration if duration else None,
+            "output_tokens_per_second": sum(run_columns.values("completion_tokens")) / duration if duration else None
+        })
+    return columns, runs
+
+
+def summarize_rows(columns, rows=None):
+    """
+    汇总一组请求的数量、失败数和延迟分布
+    """
+    indices = range(len(columns)) if rows is None else rows
+    success = columns.columns["success"]
+    requests = len(indices)
+    failed = sum(1 for i in indices if not success[i])
+    summary = {
+        "requests": requests,
+        "failed": failed,
+        "success_rate": (requests - failed) / requests * 100 if requests else 0
+    }
+    for name in LATENCY_METRICS:
+        summary[name] = summarize(columns.values(name, rows))
+    return summary
+
+
+def summarize_results(columns, runs):
+    """
+    汇总一组结果: 整体延迟分布、按所有运行总时长计算的吞吐和按数据集文件分组的统计
+    """
+    summary = summarize_rows(columns)
+    durations = [run["duration"] for run in runs]
+    duration = sum(durations) if None not in durations else None
+    summary["duration"] = duration
+    summary["requests_per_second"] = sum(run["successful"] for run in runs) / duration if duration else None
+    summary["output_tokens_per_second"] = sum(columns.values("completion_tokens")) / duration if duration else None
+
+    groups = {}
+    for i, filename in enumerate(columns.filenames):
+        groups.setdefault(filename, []).append(i)
+    summary["datasets"] = {filename: summarize_rows(columns, rows) for filename, rows in sorted(groups.items())}
+    return summary
+
+
+def relative_change(value, base):
+    if value is None or not base:
+        return None
+    return (value - base) / base
+
+
+def check_metric(name, samples, base_samples, higher_is_better, threshold):
+    """
+    比较一个指标: 均值差及其 95% 置信区间（Welch t 区间），变差幅度超过 threshold 且置信区间不包含 0 时判定为回归
+
+    样本不足 2 个无法计算置信区间时，吞吐指标只按幅度判定，延迟指标不判定
+    """
+    mean = sum(samples) / len(samples) if samples else None
+    base_mean = sum(base_samples) / len(base_samples) if base_samples else None
+    delta = mean_difference(samples, base_samples)
+    change = relative_change(mean, base_mean)
+
+    significant = None
+    if delta and delta[1] is not None:
+        significant = delta[1] > 0 or delta[2] < 0
+    worse = change is not None and (change < -threshold if higher_is_better else change > threshold)
+    if significant is None:
+        regressed = worse and higher_is_better
+    else:
+        regressed = worse and significant and (delta[0] < 0 if higher_is_better else delta[0] > 0)
+
+    return {
+        "metric": name,
+        "baseline": base_mean,
+        "candidate": mean,
+        "change": change,
+        "delta": delta,
+        "samples": len(samples),
+        "baseline_samples": len(base_samples),
+        "significant": significant,
+        "regressed": regressed
+    }
+
+
+def compare_results(candidate, baseline, latency_threshold, throughput_threshold):
+    """
+    对比候选与基线结果，返回 (整体指标对比行, 按数据集的端到端延迟对比行)
+
+    延迟指标以逐请求样本比较均值，吞吐以逐次运行的吞吐为样本（各自运行 2 次以上才有置信区间）；
+    按数据集的对比只用于定位，不参与回归判定
+    """
+    columns, runs = candidate
+    base_columns, base_runs = baseline
+
+    checks = [check_metric(name, columns.values(name), base_columns.values(name), False, latency_threshold)
+              for name in LATENCY_METRICS]
+    for name in THROUGHPUT_METRICS:
+        samples = [run[name] for run in runs if run[name] is not None]
+        base_samples = [run[name] for run in base_runs if run[name] is not None]
+        checks.append(check_metric(name, samples, base_samples, True, throughput_threshold))
+
+    def groups(result_columns):
+        rows = {}
+        for i, filename in enumerate(result_columns.filenames):
+            rows.setdefault(filename, []).append(i)
+        return rows
+
+    candidate_groups = groups(columns)
+    baseline_groups = groups(base_columns)
+    datasets = []
+    for filename in sorted(candidate_groups.keys() & baseline_groups.keys()):
+        row = check_metric("e2e", columns.values("e2e", candidate_groups[filename]),
+                           base_columns.values("e2e", baseline_groups[filename]), False, latency_threshold)
+        row["dataset"] = filename
+        datasets.append(row)
+    return checks, datasets
+
+
+def format_value(name, value):
+    if value is None:
+        return "-"
+    return format_ms(value) if name in LATENCY_METRICS else f"{value:.2f}"
+
+
+def format_summary(summary, label):
+    """
+    将 summarize_results 的结果格式化为控制台输出的文本行，延迟单位为毫秒
+    """
+    rate = summary["requests_per_second"]
+    tokens = summary["output_tokens_per_second"]
+    lines = [f"{label}: 请求 {summary['requests']}, 失败 {summary['failed']}, 成功率 {summary['success_rate']:.1f}%, "
+             f"QPS {f'{rate:.2f}' if rate is not None else '-'}, "
+             f"输出tok/s {f'{tokens:.1f}' if tokens is not None else '-'}"]
+    for name, title in LATENCY_METRICS.items():
+        stats = summary[name]
+        if stats["count"]:
+            lines.append(f"  {title}(ms) - 均值: {format_ms(stats['mean'])}, p50: {format_ms(stats['p50'])}, "
+                         f"p90: {format_ms(stats['p90'])}, p99: {format_ms(stats['p99'])}, 样本数: {stats['count']}")
+    lines.append(f"  {'数据集':<30} {'请求数':>4} {'失败':>4} {'E2E p50':>9} {'E2E p99':>9} {'TTFT p50':>9} {'TPOT p50':>9}")
+    for filename, stats in summary["datasets"].items():
+        lines.append(f"  {filename:<33} {stats['requests']:>7} {stats['failed']:>6} {format_ms(stats['e2e'].get('p50')):>9} "
+                     f"{format_ms(stats['e2e'].get('p99')):>9} {format_ms(stats['ttft'].get('p50')):>9} "
+                     f"{format_ms(stats['tpot'].get('p50')):>9}")
+    return lines
+
+
+def format_check(row, title):
+    change = f"{row['change'] * 100:+.1f}%" if row["change"] is not None else "-"
+    delta = row["delta"]
+    interval = "-"
+    if delta and delta[1] is not None:
+        scale = 1000 if row["metric"] in LATENCY_METRICS else 1
+        interval = f"[{delta[1] * scale:+.2f}, {delta[2] * scale:+.2f}]"
+    significant = {True: "显著", False: "不显著", None: "-"}[row["significant"]]
+    return (f"  {title:<30} {format_value(row['metric'], row['baseline']):>10} "
+            f"{format_value(row['metric'], row['candidate']):>10} {change:>8} {interval:>22} {significant:>4}"
+            f"{'  回归!' if row['regressed'] else ''}")
+
+
+def format_comparison(checks, datasets):
+    """
+    将 compare_results 的结果格式化为控制台输出的文本行
+    """
+    lines = ["与基线对比 (均值, 延迟单位 ms, 差值的 95% 置信区间):",
+             f"  {'指标':<28} {'基线':>8} {'候选':>8} {'变化':>6} {'置信区间':>18} {'显著性':>3}"]
+    for row in checks:
+        title = LATENCY_METRICS.get(row["metric"]) or THROUGHPUT_METRICS[row["metric"]]
+        lines.append(format_check(row, title))
+    if datasets:
+        lines.append("按数据集对比端到端延迟 (仅供定位，不参与回归判定):")
+        for row in datasets:
+            lines.append(format_check({**row, "regressed": False}, row["dataset"]))
+    return lines
+
+
+def expand_paths(paths):
+    """
+    展开参数中的目录为其中的 all_results_* 结果文件
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.startswith("all_results_") and name.endswith((".jsonl", ".json"))))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="结果分析: 汇总 all_results 结果文件的延迟和吞吐，"
+                                                     "指定基线时做显著性检验，回归时以非零状态退出")
+    arg_parser.add_argument("results", nargs="+", help="候选结果文件或目录，多个文件视为同一构建的多次运行")
+    arg_parser.add_argument("--baseline", nargs="+", help="基线结果文件或目录")
+    arg_parser.add_argument("--latency-threshold", type=float, default=0.1,
+                            help="延迟均值增加超过该比例且差异显著时视为回归")
+    arg_parser.add_argument("--throughput-threshold", type=float, default=0.1,
+                            help="吞吐下降超过该比例（运行次数不少于 2 次时还需差异显著）时视为回归")
+    arg_parser.add_argument("--output", help="把汇总和对比结果保存为 JSON")
+    args = arg_parser.parse_args()
+
+    candidate_files = expand_paths(args.results)
+    if not candidate_files:
+        print("未找到候选结果文件")
+        sys.exit(2)
+    candidate = load_results(candidate_files)
+    candidate_summary = summarize_results(*candidate)
+    report = {"candidate": {"files": candidate_files, **candidate_summary}}
+    for line in format_summary(candidate_summary, f"候选 ({len(candidate_files)} 个文件)"):
+        print(line)
+
+    regressions = 0
+    if args.baseline:
+        baseline_files = expand_paths(args.baseline)
+        if not baseline_files:
+            print("未找到基线结果文件")
+            sys.exit(2)
+        baseline = load_results(baseline_files)
+        baseline_summary = summarize_results(*baseline)
+        for line in format_summary(baseline_summary, f"基线 ({len(baseline_files)} 个文件)"):
+            print(line)
+
+        checks, datasets = compare_results(candidate, baseline, args.latency_threshold, args.throughput_threshold)
+        print()
+        for line in format_comparison(checks, datasets):
+            print(line)
+        regressions = sum(1 for row in checks if row["regressed"])
+        print(f"回归指标数: {regressions} (延迟阈值 {args.latency_threshold * 100:.0f}%, "
+              f"吞吐阈值 {args.throughput_threshold * 100:.0f}%)")
+        report.update({"baseline": {"files": baseline_files, **baseline_summary}, "checks": checks,
+                       "datasets": datasets, "regressions": regressions})
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"分析结果已保存到: {args.output}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import os
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from zhejing import send_reqs_with_pressure as pressure
+from zhejing.sse_parser import SSEStreamParser
+from zhejing.metrics import new_stream_timing
+from zhejing.open_loop import arrival_times
+from zhejing.phases import ramp_delay
+
+
+def raise_nofile_limit(required):
+    """
+    提高进程可打开的文件描述符上限，避免上万个并发连接因 fd 不足而失败
+    """
+    if resource is None:
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = required if hard == resource.RLIM_INFINITY else min(required, hard)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError):
+            print(f"警告: 无法将文件描述符上限提高到 {target}，当前为 {soft}")
+
+
+async def async_handle_stream_response(response, filename, timing=None, abort_after=None):
+    """
+    处理流式响应（asyncio 版本），数据到达即增量解析，不阻塞事件循环，timing、abort_after 的含义同 handle_stream_response
+    """
+    parser = SSEStreamParser(timing)
+
+    try:
+        # 按网络实际到达的数据块增量解析，每个数据块记录一次到达时间
+        async for data in response.content.iter_any():
+            if parser.feed(data, time.time()):
+                break
+            if abort_after and parser.token_chunks >= abort_after:
+                # 关闭连接而不是放回连接池，服务端据此停止生成
+                response.close()
+                return pressure.build_stream_response_data(parser.content, parser.reasoning_content,
+                                                           pressure.CLIENT_ABORT, parser.usage)
+        parser.close(time.time())
+
+        return pressure.build_stream_response_data(parser.content, parser.reasoning_content, parser.finish_reason,
+                                                   parser.usage)
+    except Exception as e:
+        raise Exception(f"处理流式响应时出错: {str(e)}")
+
+
+async def async_send_request(session, file_info, config, is_background=False, payload=None, entry=None):
+    """
+    发送请求到聊天接口（asyncio 版本），返回与 send_request 相同结构的结果字典
+
+    Args:
+        session: aiohttp.ClientSession
+        file_info: 文件信息元组 (file_path, filename)
+        config: 配置字典
+        is_background: 是否为后台压力测试请求
+        payload: 已构建好的请求体（如轨迹回放），为 None 时按数据集文件和配置构建
+        entry: 后台请求计划中的请求，见 send_request
+    """
+    file_path, filename = file_info
+    start_time = time.time()
+    pressure.record_request_start(is_background)
+
+    try:
+        url = f"http://{config['IP']}:{config['PORT']}/v1/chat/completions"
+        if payload is None:
+            messages = pressure.load_messages(file_path)
+            payload = pressure.build_payload(messages, config, is_background, entry)
+            body = pressure.encode_payload(file_path, payload)
+        else:
+            messages = payload["messages"]
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+        timing = None
+        async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as response:
+            response.raise_for_status()
+            if payload["stream"]:
+                timing = new_stream_timing(start_time)
+                response_data = await async_handle_stream_response(
+                    response, filename, timing, pressure.abort_after_tokens(config, is_background, True, entry))
+            else:
+                response_data = await response.json(content_type=None)
+
+        processing_time = time.time() - start_time
+        result = pressure.build_result(filename, config, is_background, processing_time, messages, response_data,
+                                       timing=timing, start_time=start_time, payload=payload)
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        processing_time = time.time() - start_time
+        # asyncio 超时异常的 str 为空，用 repr 保留异常类型
+        result = pressure.build_result(filename, config, is_background, processing_time, error=str(e) or repr(e),
+                                       start_time=start_time, payload=payload)
+
+    pressure.record_trace(start_time, payload, result)
+    return result
+
+
+async def background_worker(session, config, delay=0):
+    """
+    单个后台并发协程，等待爬坡延迟 delay 秒后循环随机选择文件发送请求，直到后台压力测试被停止
+    """
+    deadline = time.time() + delay
+    while pressure.background_active and time.time() < deadline:
+        await asyncio.sleep(min(deadline - time.time(), 0.5))
+
+    while pressure.background_active:
+        # 按序号领取计划中的下一个请求
+        entry = pressure.background_schedule.next()
+        file_path = entry["file_path"]
+        file_info = (file_path, os.path.basename(file_path))
+
+        try:
+            result = await async_send_request(session, file_info, config, is_background=True, entry=entry)
+            pressure.record_background_result(result)
+
+            # 随机延迟，模拟真实请求模式
+            think_time = entry["think_time"]
+            if think_time > 0:
+                await asyncio.sleep(think_time)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            pressure.record_background_exception(e)
+
+
+async def open_loop_request(session, config, entry, slots):
+    """
+    开环模式下发送后台请求计划中的单个请求，结束后释放在途名额
+    """
+    try:
+        file_info = (entry["file_path"], os.path.basename(entry["file_path"]))
+        result = await async_send_request(session, file_info, config, is_background=True, entry=entry)
+        pressure.record_background_result(result)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        pressure.record_background_exception(e)
+    finally:
+        slots.release()
+
+
+async def open_loop_dispatcher(session, config, duration=None):
+    """
+    开环调度: 按到达过程的计划时刻发送请求，不等待之前的请求返回
+
+    在途请求数达到 max_outstanding 时等待空出名额，此时的等待会体现为调度滞后（实际发送时刻 - 计划发送时刻），
+    用于判断客户端是否跟上了目标到达速率。
+
+    Returns:
+        仍在途的请求任务集合
+    """
+    arrival = config["arrival"]
+    slots = asyncio.Semaphore(arrival.get("max_outstanding", 10000))
+    tasks = set()
+    # 调度协程所在线程的统计对象，开环模式下所有请求都在这个线程中完成
+    stats = pressure.background_metrics.local()
+
+    start = time.monotonic()
+    schedule = pressure.background_schedule
+    for offset in arrival_times(arrival, schedule.arrival_rng()):
+        if duration and offset >= duration:
+            break
+
+        # 分段等待，保证长时间无请求（如突发的关闭期间）时也能及时响应停止
+        while pressure.background_active:
+            delay = start + offset - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(min(delay, 0.5))
+        if not pressure.background_active:
+            break
+
+        if slots.locked():
+            stats.increment("capped_requests")
+        await slots.acquire()
+
+        # 客户端跟不上计划速率时，按实际经过的时间结束，不延长测试
+        if duration and time.monotonic() - start >= duration:
+            slots.release()
+            break
+
+        stats.record("schedule_lag", time.monotonic() - start - offset)
+        task = asyncio.create_task(open_loop_request(session, config, schedule.next(), slots))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+        # 落后于计划时不会进入 sleep，主动让出事件循环，保证已发出的请求能被处理
+        await asyncio.sleep(0)
+
+    return tasks
+
+
+async def async_background_pressure_test(config, duration=None):
+    """
+    在单个事件循环中运行后台压力测试: 闭环模式运行 background_concurrent_workers 个并发协程，
+    开环模式按 arrival 配置的到达过程发送请求；请求内容来自 background_pressure_test 创建的后台请求计划
+
+    Args:
+        config: 配置字典
+        duration: 测试持续时间(秒)，如果为None则持续运行直到 background_active 被置为 False
+    """
+    workers = config["background_concurrent_workers"]
+    if config.get("background_mode", "closed") == "open":
+        workers = config["arrival"].get("max_outstanding", 10000)
+    raise_nofile_limit(workers + 1024)
+
+    # 连接池大小默认与并发数一致；keep_alive 关闭时每个请求使用新连接并在结束后关闭
+    connector = aiohttp.TCPConnector(limit=pressure.get_pool_size(config),
+                                     force_close=not config.get("keep_alive", True))
+    timeout = aiohttp.ClientTimeout(total=config["timeout"])
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        if config.get("background_mode", "closed") == "open":
+            tasks = await open_loop_dispatcher(session, config, duration)
+        else:
+            ramp_up = config.get("ramp_up_seconds", 0)
+            tasks = [asyncio.create_task(background_worker(session, config, ramp_delay(index, workers, ramp_up)))
+                     for index in range(workers)]
+
+            deadline = time.time() + duration if duration else None
+            while pressure.background_active and (deadline is None or time.time() < deadline):
+                await asyncio.sleep(0.5)
+
+        # 停止后台压力测试，排空阶段与线程引擎一致最多等待 drain_timeout 秒，剩余在途请求直接取消
+        pressure.background_active = False
+        if tasks:
+            drain_timeout = config.get("drain_timeout", 10)
+            done, pending = await asyncio.wait(tasks, timeout=drain_timeout)
+            if pending:
+                print(f"排空超时({drain_timeout}秒)，取消 {len(pending)} 个仍在进行的请求")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def run_async_background(config, duration=None):
+    """
+    同步入口，供 background_pressure_test 在当前线程中启动事件循环
+    """
+    asyncio.run(async_background_pressure_test(config, duration))
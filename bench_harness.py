@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import concurrent.futures
+import copy
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+#import send_reqs_with_pressure as pressure # ide run
+from zhejing import send_reqs_with_pressure as pressure
+from zhejing.stats import WorkerStats
+from zhejing.metrics import request_tokens
+from zhejing.dataset_cache import DatasetCache
+
+
+def start_mock_server(port, options):
+    """
+    在子进程中启动模拟服务，避免服务端与被测客户端争用同一个 GIL，返回 Popen 对象
+    """
+    command = [sys.executable, "-m", "zhejing.mock_server", "--port", str(port)]
+    for name, value in options.items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"模拟服务未能在端口 {port} 启动")
+
+
+def result_tokens(result):
+    """
+    单个请求的输出 token 数，取 usage.completion_tokens（流式请求由服务端在最后一个 chunk 返回）
+    """
+    if not result["success"]:
+        return 0
+    return request_tokens(result)[1] or 0
+
+
+def run_thread_level(config, file_info, concurrency, duration):
+    """
+    线程引擎: concurrency 个线程循环调用 send_request，持续 duration 秒，返回 (WorkerStats, 输出 token 数)
+    """
+    deadline = time.time() + duration
+
+    def worker():
+        stats = WorkerStats()
+        tokens = 0
+        while time.time() < deadline:
+            result = pressure.send_request(file_info, config)
+            stats.record_result(result)
+            tokens += result_tokens(result)
+        return stats, tokens
+
+    merged = WorkerStats()
+    total_tokens = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for stats, tokens in executor.map(lambda _: worker(), range(concurrency)):
+            merged.merge(stats)
+            total_tokens += tokens
+    return merged, total_tokens
+
+
+def run_async_level(config, file_info, concurrency, duration):
+    """
+    asyncio 引擎: 同一事件循环中 concurrency 个协程循环调用 async_send_request
+    """
+    from zhejing.async_engine import aiohttp, async_send_request
+
+    async def run():
+        stats = WorkerStats()
+        tokens = 0
+        deadline = time.time() + duration
+        connector = aiohttp.TCPConnector(limit=concurrency, force_close=not config.get("keep_alive", True))
+        timeout = aiohttp.ClientTimeout(total=config["timeout"])
+
+        async def worker():
+            nonlocal tokens
+            while time.time() < deadline:
+                result = await async_send_request(session, file_info, config)
+                stats.record_result(result)
+                tokens += result_tokens(result)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return stats, tokens
+
+    return asyncio.run(run())
+
+
+def bench_level(engine, config, file_info, concurrency, duration, ideal_latency):
+    config = copy.deepcopy(config)
+    config["test_concurrent_workers"] = concurrency
+    config["pool_size"] = concurrency
+
+    start = time.time()
+    run = run_async_level if engine == "asyncio" else run_thread_level
+    stats, tokens = run(config, file_info, concurrency, duration)
+    elapsed = time.time() - start
+
+    counters = stats.counters
+    e2e = stats.histograms["e2e"].summary()
+    requests_per_second = counters["successful_requests"] / elapsed
+    # 服务端每个请求的理论耗时已知，达到的 QPS 与 concurrency / 理论耗时 之比反映客户端是否成为瓶颈
+    ideal_rps = concurrency / ideal_latency if ideal_latency > 0 else None
+    return {
+        "engine": engine,
+        "concurrency": concurrency,
+        "requests": counters["total_requests"],
+        "failed": counters["failed_requests"],
+        "requests_per_second": requests_per_second,
+        "tokens_per_second": tokens / elapsed,
+        "efficiency": requests_per_second / ideal_rps if ideal_rps else None,
+        "e2e_p50": e2e.get("p50"),
+        "e2e_p99": e2e.get("p99")
+    }
+
+
+def print_level(level):
+    efficiency = f"{level['efficiency'] * 100:6.1f}%" if level["efficiency"] is not None else "     -"
+    p50 = f"{level['e2e_p50'] * 1000:8.1f}" if level["e2e_p50"] is not None else "       -"
+    p99 = f"{level['e2e_p99'] * 1000:8.1f}" if level["e2e_p99"] is not None else "       -"
+    print(f"  {level['engine']:<8} {level['concurrency']:>6} {level['requests_per_second']:>10.1f} "
+          f"{level['tokens_per_second']:>12.0f} {efficiency} {p50} {p99} {level['failed']:>6}")
+
+
+def compare_baseline(levels, baseline_path, tolerance):
+    """
+    与基线结果对比 requests/s，下降超过 tolerance 的并发级别视为回归，返回回归数
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(level["engine"], level["concurrency"]): level for level in json.load(f)["levels"]}
+
+    regressions = 0
+    print(f"\n与基线 {baseline_path} 对比 (容差 {tolerance * 100:.0f}%):")
+    for level in levels:
+        base = baseline.get((level["engine"], level["concurrency"]))
+        if not base or not base["requests_per_second"]:
+            continue
+        ratio = level["requests_per_second"] / base["requests_per_second"]
+        regressed = ratio < 1 - tolerance
+        regressions += regressed
+        print(f"  {level['engine']:<8} 并发 {level['concurrency']:>5}: {base['requests_per_second']:.1f} -> "
+              f"{level['requests_per_second']:.1f} req/s ({(ratio - 1) * 100:+.1f}%){'  回归!' if regressed else ''}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="客户端压测能力基准: 用本地模拟服务测量各并发下客户端可持续的 req/s 和 tok/s")
+    arg_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64], help="并发级别")
+    arg_parser.add_argument("--engines", nargs="+", default=["thread", "asyncio"], choices=["thread", "asyncio"])
+    arg_parser.add_argument("--duration", type=float, default=5, help="每个并发级别的持续时间(秒)")
+    arg_parser.add_argument("--port", type=int, default=18000, help="模拟服务端口")
+    arg_parser.add_argument("--stream", type=int, default=1, choices=[0, 1], help="是否流式请求")
+    arg_parser.add_argument("--ttft", type=float, default=0.02, help="模拟服务首 token 延迟(秒)")
+    arg_parser.add_argument("--token-delay", type=float, default=0.002, help="模拟服务 token 间隔(秒)")
+    arg_parser.add_argument("--output-tokens", type=int, default=64, help="模拟服务输出 token 数")
+    arg_parser.add_argument("--save", help="把结果保存为 JSON，作为之后对比的基线")
+    arg_parser.add_argument("--baseline", help="基线 JSON 文件，req/s 下降超过容差时以非零状态退出")
+    arg_parser.add_argument("--tolerance", type=float, default=0.1, help="回归容差比例")
+    args = arg_parser.parse_args()
+
+    mock_options = {"ttft": args.ttft, "token_delay": args.token_delay, "output_tokens": args.output_tokens}
+    ideal_latency = args.ttft + max(0, args.output_tokens - 1) * args.token_delay
+
+    dataset_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets")
+    file_path = sorted(glob.glob(os.path.join(dataset_dir, "*.txt")))[0]
+    file_info = (file_path, os.path.basename(file_path))
+    if pressure.CONFIG.get("dataset_cache", True):
+        pressure.dataset_cache = DatasetCache(pressure.read_txt_file)
+        pressure.dataset_cache.load([file_path])
+
+    config = copy.deepcopy(pressure.CONFIG)
+    config.update({"IP": "127.0.0.1", "PORT": str(args.port), "is_stream": bool(args.stream),
+                   "background_concurrent_workers": 0, "timeout": 60})
+
+    engines = list(args.engines)
+    if "asyncio" in engines:
+        from zhejing.async_engine import aiohttp
+        if aiohttp is None:
+            print("未安装 aiohttp，跳过 asyncio 引擎")
+            engines.remove("asyncio")
+
+    server = start_mock_server(args.port, mock_options)
+    levels = []
+    try:
+        print(f"模拟服务: {mock_options}，单请求理论耗时 {ideal_latency * 1000:.1f}ms，"
+              f"{'流式' if args.stream else '非流式'}")
+        print(f"  {'engine':<8} {'并发':>4} {'req/s':>10} {'tok/s':>12} {'效率':>5} {'p50(ms)':>8} {'p99(ms)':>8} {'失败':>4}")
+        for engine in engines:
+            for concurrency in args.concurrency:
+                level = bench_level(engine, config, file_info, concurrency, args.duration, ideal_latency)
+                print_level(level)
+                levels.append(level)
+    finally:
+        server.terminate()
+        server.wait()
+        pressure.close_sessions()
+
+    for engine in engines:
+        engine_levels = [level for level in levels if level["engine"] == engine]
+        best = max(engine_levels, key=lambda level: level["requests_per_second"])
+        print(f"{engine} 引擎最大吞吐: {best['requests_per_second']:.1f} req/s, {best['tokens_per_second']:.0f} tok/s "
+              f"(并发 {best['concurrency']})")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({"mock": mock_options, "stream": bool(args.stream), "duration": args.duration,
+                       "levels": levels}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.save}")
+
+    if args.baseline and compare_baseline(levels, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import json
+import time
+
+#from sse_parser import SSEStreamParser, orjson # ide run
+from zhejing.sse_parser import SSEStreamParser, orjson
+
+
+def build_stream(num_chunks, reasoning_ratio=0.3, read_size=4096):
+    """
+    构造与 vLLM 输出格式一致的 SSE 字节流，并按 read_size 切分成网络读取的数据块
+    """
+    events = []
+    reasoning_chunks = int(num_chunks * reasoning_ratio)
+    for i in range(num_chunks):
+        field = "reasoning_content" if i < reasoning_chunks else "content"
+        chunk = {
+            "id": "chatcmpl-0123456789abcdef",
+            "object": "chat.completion.chunk",
+            "created": 1760000000,
+            "model": "ds_r1",
+            "choices": [{"index": 0, "delta": {field: f"词{i}"}, "logprobs": None, "finish_reason": None}]
+        }
+        events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+    events.append(b"data: [DONE]\n\n")
+
+    stream = b"".join(events)
+    return [stream[i:i + read_size] for i in range(0, len(stream), read_size)]
+
+
+def iter_lines(blocks):
+    """
+    按 requests.Response.iter_lines 的方式把数据块切分成行
+    """
+    pending = None
+    for block in blocks:
+        if pending is not None:
+            block = pending + block
+        lines = block.splitlines()
+        if lines and lines[-1] and block and lines[-1][-1] == block[-1]:
+            pending = lines.pop()
+        else:
+            pending = None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+def legacy_parse(blocks):
+    """
+    原 handle_stream_response 的解析逻辑: 每行解码、完整 json.loads、字符串 += 拼接
+    """
+    full_content = ""
+    reasoning_content = ""
+
+    for line in iter_lines(blocks):
+        if line:
+            line = line.decode('utf-8')
+            if line.startswith('data: '):
+                data = line[6:]
+
+                if data == '[DONE]':
+                    break
+
+                try:
+                    chunk = json.loads(data)
+                    if 'choices' in chunk and len(chunk['choices']) > 0:
+                        delta = chunk['choices'][0].get('delta', {})
+                        if 'content' in delta:
+                            full_content += delta['content']
+                        if 'reasoning_content' in delta:
+                            reasoning_content += delta['reasoning_content']
+                except json.JSONDecodeError:
+                    continue
+
+    return full_content, reasoning_content
+
+
+def parser_parse(blocks, use_orjson):
+    """
+    SSEStreamParser 的解析逻辑，同时记录计时
+    """
+    timing = {"start_time": 0.0, "first_byte_time": None, "first_content_time": None,
+              "first_reasoning_time": None, "chunk_times": []}
+    parser = SSEStreamParser(timing, use_orjson=use_orjson)
+    now = time.time()
+    for block in blocks:
+        if parser.feed(block, now):
+            break
+    parser.close(now)
+    return parser.content, parser.reasoning_content
+
+
+def bench(name, func, blocks, num_chunks, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(blocks)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"  {name:<24} {best * 1000:10.2f} ms   {num_chunks / best:14,.0f} chunks/s")
+    return result, best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="SSE 流解析微基准: 对比原实现与 SSEStreamParser 的 chunks/s")
+    arg_parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 11000, 50000], help="每个响应的 chunk 数")
+    arg_parser.add_argument("--read-size", type=int, default=4096, help="模拟每次网络读取的字节数")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最快的一次")
+    args = arg_parser.parse_args()
+
+    print(f"orjson: {'已安装' if orjson is not None else '未安装'}")
+    for num_chunks in args.chunks:
+        blocks = build_stream(num_chunks, read_size=args.read_size)
+        print(f"\n{num_chunks} chunks, {sum(len(b) for b in blocks) / 1024:.0f} KiB:")
+
+        expected, legacy_time = bench("legacy", legacy_parse, blocks, num_chunks, args.repeat)
+        candidates = [("parser(json)", False)]
+        if orjson is not None:
+            candidates.append(("parser(orjson)", True))
+
+        for name, use_orjson in candidates:
+            result, elapsed = bench(name, lambda b: parser_parse(b, use_orjson), blocks, num_chunks, args.repeat)
+            assert result == expected, f"{name} 解析结果与原实现不一致"
+            print(f"  {'':<24} 加速比: {legacy_time / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,13 @@ CONFIG = {
     "think": True,              # 是否启用 think 模式, 仅 deepseek v3.1 支持
     "max_tokens": 131072,       # 最大输出 token 数, 支持范围(0，2147483647]
     "is_stream": False,         # 是否开启流式响应
+    "stream_usage": True,       # 流式请求是否要求服务端返回 usage
+    "tokenizer": "",            # 服务端不返回 usage 时统计 token 数的本地分词器路径, 为空时按 chunk 数估算
     "concurrent_workers": 50,   # 并发量
+    "ramp_up_seconds": 0,       # 并发爬坡时间(秒), 在途请求数在此时间内从 1 线性增加到并发量, 0 表示直接满并发
+    "warmup_seconds": 0,        # 预热时间(秒), 运行开始后这段时间内发出的请求照常发送但不计入延迟和吞吐统计
+    "cooldown_seconds": 0,      # 冷却时间(秒), 运行结束前这段时间内完成的请求（低并发收尾）不计入统计
+    "keep_alive": True,         # 是否复用连接, False 时每个请求新建连接
+    "pool_size": 0,             # 连接池大小, 0 表示与并发量一致
     "timeout": 600              # 请求超时时间
 }
\ No newline at end of file
@@ -14,10 +14,115 @@ CONFIG = {
     "think": False,                             # 是否开启 think, 仅对deepseek v3.1有效
     "max_tokens": 131072,                       # 最大输出 token 数
     "is_stream": True,                          # 是否开启流式响应
+    "stream_usage": True,                       # 流式请求是否要求服务端在最后一个 chunk 返回 usage (stream_options.include_usage)
+    "tokenizer": "",                            # 服务端不返回 usage 时用于统计 token 数的本地分词器路径, 为空时按 chunk 数估算
     "test_concurrent_workers": 0,               # 测试并发数量 (0表示只进行后台压力测试)
     "background_concurrent_workers": 1024,      # 后台并发数量
     "background_duration": 1000000,             # 后台压力测试持续时间(秒)
+    "background_stream": False,                 # 后台压力请求是否使用流式响应
+    "dataset_cache": True,                      # 启动时预解析数据集并缓存, 文件修改后自动重新加载
+    "engine": "asyncio",                        # 后台压力引擎: asyncio(单事件循环, 需安装 aiohttp) / thread(每个并发一个线程)
+    "background_mode": "closed",                # 后台模式: closed 闭环(每个并发收到响应后再发下一个) / open 开环(按到达过程发送, 需 asyncio 引擎)
+    "keep_alive": True,                         # 是否复用连接, False 时每个请求新建连接, 用于评估连接复用的影响
+    "pool_size": 0,                             # 每个目标的连接池大小, 0 表示与测试并发+后台并发之和一致
+    "think_time": [0.1, 0.5],                   # 闭环后台并发每个请求完成后的随机等待时间范围(秒), [0, 0] 表示不等待
+    "ramp_up_seconds": 0,                       # 并发爬坡时间(秒), 测试在途请求数从 1 线性增加到测试并发, 闭环后台并发在此时间内错开启动, 0 表示直接满并发
+    "warmup_seconds": 0,                        # 预热时间(秒), 这段时间内的请求照常发送但不计入延迟和吞吐统计, 建议不小于爬坡时间
+    "cooldown_seconds": 0,                      # 冷却时间(秒), 运行结束前这段时间内的请求（低并发收尾）不计入统计, 仅单进程模式
+    "report_interval": 10,                      # 后台压力测试状态报告间隔(秒)
+    "metrics_port": 0,                          # Prometheus 指标服务端口(GET /metrics), 0 表示不启动
+    "metrics_host": "0.0.0.0",                  # Prometheus 指标服务监听地址
+    "processes": 1,                             # 压测进程数, 大于1时测试并发、后台并发和开环 QPS 按进程均分, 由主进程合并统计
+    "role": "standalone",                       # 运行角色: standalone 单机 / coordinator 协调者(下发任务并汇总, 不发送请求) / agent 压测节点
+    "coordinator_host": "127.0.0.1",            # 协调者监听地址(coordinator) / 连接地址(agent)
+    "coordinator_port": 9527,                   # 协调者端口
+    "agents": 2,                                # 协调者等待连接的 agent 数, 测试文件、并发和开环 QPS 按 agent 均分
+    "start_delay": 3,                           # 所有 agent 连接后延迟多少秒同时开始(秒)
     "timeout": 600,                             # 请求超时时间, 建议和服务端的端到端超时时间保持一致
+    "drain_timeout": 10,                        # 停止后台压力后等待在途请求完成的时间(秒), 超时后断开剩余请求的连接
+
+    # 开环模式的到达过程
+    "arrival": {
+        "process": "poisson",                   # constant 固定间隔 / poisson 泊松 / bursty 开关突发
+        "qps": 50,                              # 目标 QPS, bursty 模式下为关闭期间的 QPS (0 表示不发送)
+        "burst_qps": 200,                       # bursty 开启期间的 QPS
+        "burst_on_seconds": 10,                 # bursty 开启期间时长(秒)
+        "burst_off_seconds": 20,                # bursty 关闭期间时长(秒)
+        "max_outstanding": 10000                # 在途请求上限
+    },
+
+    # 后台请求计划: 按种子预先生成每个后台请求的数据集文件、采样参数、max_tokens 和思考时间, 工作者按序号领取
+    # 相同种子(且同为 NumPy 或同为 random 模块生成)的两次运行发出相同的请求序列, 用于服务端优化前后的对比
+    "schedule": {
+        "seed": None,                           # 非负整数种子, None 表示每次随机选择(输出在配置信息中, 可用于复现)
+        "block_size": 4096                      # 每次向量化生成的请求数
+    },
+
+    # 客户端主动中断: 流式后台请求收到若干 token 后断开连接, 模拟用户中途放弃, 用于测量服务端回收被放弃生成的速度
+    # 中断的请求计入成功, 只统计 TTFT; 需开启 background_stream
+    "abort": {
+        "ratio": 0.0,                           # 主动中断的后台请求比例, 0 表示不中断
+        "after_tokens": 16                      # 收到多少个 token 后中断
+    },
+
+    # 输出长度控制: 每个请求的 max_tokens 按分布抽取, 配合 ignore_eos 得到确定的输出长度, 用于分别构造 prefill 为主和 decode 为主的负载
+    # 测试请求和后台请求都生效, 后台请求的输出长度由请求计划按种子生成
+    "output_length": {
+        "distribution": "",                     # 为空时不启用(使用 max_tokens) / fixed 固定 / uniform 均匀 / lognormal 对数正态 / histogram 经验直方图
+        "tokens": 256,                          # fixed 的输出长度
+        "min": 16,                              # uniform 的取值范围 [min, max], lognormal 的截断范围
+        "max": 2048,
+        "median": 256,                          # lognormal 的中位数
+        "sigma": 1.0,                           # lognormal 的对数标准差
+        "histogram_file": "",                   # histogram 的直方图文件, 每行 "输出长度,权重", # 之后为注释
+        "ignore_eos": True                      # 是否开启 ignore_eos, 开启时校验返回的输出 token 数是否等于 max_tokens
+    },
+
+    # 请求级 SLO: 成功且满足全部 SLO 的请求计入 goodput, 三项都为 0 时不统计
+    "slo": {
+        "ttft": 0,                              # 首 token 延迟上限(秒), 只检查流式请求, 0 表示不限制
+        "tpot": 0,                              # 每输出 token 耗时上限(秒), 只检查流式请求, 0 表示不限制
+        "e2e": 0,                               # 端到端延迟上限(秒), 0 表示不限制
+        "attainment": 0.99                      # 目标 SLO 达成率, 容量扫描中低于该值时停止
+    },
+
+    # 请求轨迹: 记录每个请求的发送时间、消息和采样参数, 或按记录的时间回放
+    "trace": {
+        "record": False,                        # 是否记录本次运行发出的请求 (results/trace_*.jsonl), 仅单进程模式
+        "replay": "",                           # 回放的轨迹文件路径, 不为空时只回放轨迹 (需 asyncio 引擎), 在途上限取 arrival.max_outstanding
+        "time_scale": 1.0,                      # 回放倍速, 2 表示按原时间间隔的 1/2 发送
+        "match_output_length": True             # 回放时按记录的输出 token 数设置 max_tokens 并开启 ignore_eos
+    },
+
+    # 共享前缀负载: 生成共享 system 前缀的请求, 分别统计可能命中前缀缓存(warm)和不可能命中(cold)的请求 (results/prefix_*.csv)
+    "prefix_workload": {
+        "enabled": False,                       # 是否运行共享前缀负载 (开启后不运行普通测试, 需 asyncio 引擎)
+        "pool_sizes": [16],                     # 前缀池大小, 多个值时依次运行, 用于观察前缀总量超过服务端缓存容量后的淘汰
+        "prefix_length": 2048,                  # 前缀长度(英文单词数, 约等于 token 数)
+        "suffix_length": 64,                    # 每个请求独有的后缀长度(英文单词数)
+        "reuse_ratio": 0.8,                     # 从前缀池中选择前缀的请求比例, 其余请求使用全新前缀
+        "concurrency": 16,                      # 闭环并发数
+        "duration": 60,                         # 每个前缀池大小的运行时长(秒)
+        "seed": 0                               # 前缀内容的随机种子
+    },
+
+    # 容量扫描: 逐级提高并发或 QPS，输出吞吐-延迟曲线 (results/sweep_*.csv)
+    "sweep": {
+        "enabled": False,                       # 是否运行容量扫描 (开启后不运行普通测试)
+        "mode": "concurrency",                  # concurrency 闭环并发 / qps 开环到达速率 (需 asyncio 引擎)
+        "start": 1,                             # 起始级别
+        "factor": 2,                            # 级别倍数
+        "max": 1024,                            # 最大级别
+        "warmup_seconds": 10,                   # 每级预热时长(秒), 不计入统计
+        "hold_seconds": 30,                     # 每级稳态统计时长(秒)
+        "max_error_rate": 0.01,                 # 错误率超过该值时停止
+        "max_ttft_p99": 10,                     # TTFT p99 超过该值(秒)时停止, 0 表示不检查
+        "max_tpot_p99": 0.5,                    # TPOT p99 超过该值(秒)时停止, 0 表示不检查
+        "max_e2e_p99": 0,                       # 端到端 p99 超过该值(秒)时停止, 0 表示不检查
+        "min_gain": 0.1                         # 吞吐增幅低于该比例的级别视为饱和(拐点)
+    },
+
+    "param_buckets": 4,                         # 后台请求按每个采样参数的取值范围等分的桶数, 结束时按桶输出吞吐和 TPOT, 0 表示不统计
 
     # 后台压力测试参数范围
     "background_param_ranges": {
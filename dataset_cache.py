@@ -0,0 +1,74 @@
+import json
+import os
+import time
+
+
+class DatasetCache:
+    """
+    数据集预解析缓存
+
+    启动时把每个数据集文件解析成消息列表，并预先编码成 JSON 片段。发送请求时只需把采样参数
+    拼接到预编码的消息之后，不再重复读文件、解析和序列化整个消息列表。文件的 mtime 变化后自动重新加载。
+    """
+
+    def __init__(self, loader, check_interval=1.0):
+        """
+        Args:
+            loader: 解析函数，输入文件路径返回消息列表，如 read_txt_file
+            check_interval: 同一文件两次检查 mtime 的最小间隔(秒)，避免每个请求都调用 stat
+        """
+        self.loader = loader
+        self.check_interval = check_interval
+        self._entries = {}
+
+    def load(self, file_paths):
+        """
+        预加载所有文件，返回加载的文件数
+        """
+        for file_path in file_paths:
+            self._load(file_path)
+        return len(self._entries)
+
+    def _load(self, file_path):
+        mtime = os.stat(file_path).st_mtime_ns
+        messages = self.loader(file_path)
+        entry = {
+            "mtime": mtime,
+            "checked_at": time.monotonic(),
+            "messages": messages,
+            "messages_json": json.dumps(messages, ensure_ascii=False).encode('utf-8')
+        }
+        # 整体替换条目，并发读取时不会看到加载到一半的数据
+        self._entries[file_path] = entry
+        return entry
+
+    def get(self, file_path):
+        """
+        获取文件的缓存条目，文件未缓存或 mtime 已变化时重新加载
+        """
+        entry = self._entries.get(file_path)
+        if entry is None:
+            return self._load(file_path)
+
+        now = time.monotonic()
+        if now - entry["checked_at"] >= self.check_interval:
+            entry["checked_at"] = now
+            if os.stat(file_path).st_mtime_ns != entry["mtime"]:
+                return self._load(file_path)
+        return entry
+
+    def get_messages(self, file_path):
+        """
+        获取文件的消息列表，返回的列表为缓存共享对象，调用方不能修改
+        """
+        return self.get(file_path)["messages"]
+
+    def encode_payload(self, file_path, payload):
+        """
+        把请求体编码为 JSON 字节串，messages 使用预编码的片段，其余字段（采样参数等）按请求单独编码
+        """
+        fields = {key: value for key, value in payload.items() if key != "messages"}
+        encoded_fields = json.dumps(fields, ensure_ascii=False).encode('utf-8')
+        if encoded_fields == b'{}':
+            return b'{"messages":' + self.get(file_path)["messages_json"] + b'}'
+        return b'{"messages":' + self.get(file_path)["messages_json"] + b',' + encoded_fields[1:]
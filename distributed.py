@@ -0,0 +1,261 @@
+import json
+import os
+import queue
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from zhejing import send_reqs_with_pressure as pressure
+from zhejing.dataset_cache import DatasetCache
+from zhejing.output_length import OutputLengths, output_length_enabled
+from zhejing.multiproc import assign_test_files, build_process_config, collect_worker_messages, stop_grace_period, \
+    worker_process
+from zhejing.stats import WorkerStats
+
+# 协调者/agent 分布式压测
+#
+# 协议: TCP 上每行一个 JSON 对象（UTF-8），type 字段区分消息类型
+#     agent -> 协调者  {"type": "hello", "time": agent 本地时间, "host": 主机名}
+#     协调者 -> agent  {"type": "start", "index": 序号, "config": 分配给该 agent 的配置,
+#                      "datasets": {文件名: 内容}, "test_files": [文件名], "start_at": agent 时钟下的开始时间}
+#     agent -> 协调者  {"type": "result", "payload": 测试结果}
+#                      {"type": "metrics", "payload": WorkerStats.to_dict()}   后台统计快照（累计值）
+#                      {"type": "done"}
+#     协调者 -> agent  {"type": "stop"}
+
+# agent 连接协调者的重试时长(秒)，允许先启动 agent 再启动协调者
+CONNECT_TIMEOUT = 60
+
+
+def send_message(stream, message):
+    stream.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b"\n")
+    stream.flush()
+
+
+def read_message(stream):
+    """
+    读取一条消息，连接关闭时返回 None
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class AgentChannel:
+    """
+    agent 端的消息通道，接口与 multiprocessing.Queue.put 一致，供 worker_process 使用
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def put(self, message):
+        kind, _, payload = message
+        if kind == "metrics":
+            payload = payload.to_dict()
+        # 测试结果和统计快照由不同线程发送，整行写入需要加锁
+        with self._lock:
+            send_message(self._stream, {"type": kind, "payload": payload})
+
+
+def read_agent_messages(index, stream, messages):
+    """
+    协调者端每个 agent 一个读取线程，把 agent 的消息转换为 worker_process 的消息格式放入队列
+    """
+    try:
+        while True:
+            message = read_message(stream)
+            if message is None:
+                return
+
+            kind = message["type"]
+            if kind == "metrics":
+                messages.put(("metrics", index, WorkerStats.from_dict(message["payload"])))
+            elif kind == "result":
+                messages.put(("result", index, message["payload"]))
+            elif kind == "done":
+                messages.put(("done", index, None))
+                return
+    except (OSError, ValueError) as e:
+        print(f"警告: agent {index} 连接异常: {e}")
+
+
+def run_coordinator(config, txt_files, results_dir):
+    """
+    协调者: 等待 config["agents"] 个 agent 连接，下发配置和数据集，统一开始时间，
+    汇总各 agent 的测试结果和后台统计后输出合并报告。协调者本身不发送请求。
+    """
+    agents = config["agents"]
+    host = config["coordinator_host"]
+    port = config["coordinator_port"]
+
+    server = socket.create_server((host, port))
+    print(f"协调者监听 {host}:{port}，等待 {agents} 个 agent 连接...")
+
+    connections = []
+    try:
+        while len(connections) < agents:
+            sock, address = server.accept()
+            reader = sock.makefile('rb')
+            writer = sock.makefile('wb')
+            hello = read_message(reader)
+            if not hello or hello.get("type") != "hello":
+                print(f"警告: 来自 {address[0]} 的连接不是 agent，已关闭")
+                sock.close()
+                continue
+
+            # 时钟偏差按收到 hello 的时刻估算，忽略单程网络延迟
+            offset = hello["time"] - time.time()
+            connections.append({"sock": sock, "reader": reader, "writer": writer, "offset": offset})
+            print(f"agent {len(connections)}/{agents} 已连接: {address[0]} ({hello.get('host')}), "
+                  f"时钟偏差: {offset * 1000:.1f}ms")
+    finally:
+        server.close()
+
+    datasets = {}
+    for file_path in txt_files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            datasets[os.path.basename(file_path)] = f.read()
+
+    test_files = assign_test_files(config, txt_files, agents)
+    start_at = time.time() + config.get("start_delay", 3)
+    for index, connection in enumerate(connections):
+        send_message(connection["writer"], {
+            "type": "start",
+            "index": index,
+            "config": build_process_config(config, agents, index),
+            "datasets": datasets,
+            "test_files": [os.path.basename(file_path) for file_path in test_files[index]],
+            "start_at": start_at + connection["offset"]
+        })
+
+    messages = queue.Queue()
+    stop_event = threading.Event()
+    readers = [
+        threading.Thread(target=read_agent_messages, args=(index, connection["reader"], messages), daemon=True)
+        for index, connection in enumerate(connections)
+    ]
+    for reader in readers:
+        reader.start()
+
+    def stop_agents():
+        stop_event.wait()
+        for connection in connections:
+            try:
+                send_message(connection["writer"], {"type": "stop"})
+            except OSError:
+                pass
+
+    threading.Thread(target=stop_agents, daemon=True).start()
+
+    print(f"分布式模式: {agents} 个 agent，{config.get('start_delay', 3)}秒后同时开始")
+    time.sleep(max(0, start_at - time.time()))
+
+    try:
+        collect_worker_messages(config, len(txt_files), results_dir, messages, stop_event,
+                                [reader.is_alive for reader in readers], f"{agents}个agent")
+    finally:
+        stop_event.set()
+        deadline = time.time() + stop_grace_period(config)
+        for reader in readers:
+            reader.join(timeout=max(0, deadline - time.time()))
+        for connection in connections:
+            connection["sock"].close()
+
+
+def wait_for_stop(stream, stop_event):
+    """
+    agent 端等待协调者的 stop 消息，协调者断开连接时同样停止
+    """
+    try:
+        while True:
+            message = read_message(stream)
+            if message is None or message.get("type") == "stop":
+                break
+    except (OSError, ValueError):
+        pass
+    stop_event.set()
+
+
+def run_agent(config):
+    """
+    agent: 连接协调者，接收配置和数据集，在约定时间开始运行分配到的测试请求和后台压力，
+    把测试结果和后台统计快照发回协调者
+    """
+    host = config["coordinator_host"]
+    port = config["coordinator_port"]
+    print(f"agent 正在连接协调者 {host}:{port}...")
+
+    deadline = time.time() + CONNECT_TIMEOUT
+    while True:
+        try:
+            sock = socket.create_connection((host, port))
+            break
+        except OSError as e:
+            if time.time() >= deadline:
+                print(f"错误: 无法连接协调者 {host}:{port}: {e}")
+                return
+            time.sleep(1)
+
+    reader = sock.makefile('rb')
+    writer = sock.makefile('wb')
+    send_message(writer, {"type": "hello", "time": time.time(), "host": socket.gethostname()})
+
+    start = read_message(reader)
+    if not start or start.get("type") != "start":
+        print("错误: 协调者未下发测试配置")
+        sock.close()
+        return
+
+    index = start["index"]
+    agent_config = start["config"]
+
+    # 数据集写入临时目录，agent 本机不需要 datasets 目录
+    dataset_dir = tempfile.mkdtemp(prefix="zhejing_agent_")
+    dataset_files = []
+    for filename, content in start["datasets"].items():
+        file_path = os.path.join(dataset_dir, os.path.basename(filename))
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        dataset_files.append(file_path)
+    test_files = [os.path.join(dataset_dir, os.path.basename(filename)) for filename in start["test_files"]]
+
+    if agent_config.get("dataset_cache", True):
+        pressure.dataset_cache = DatasetCache(pressure.read_txt_file)
+        pressure.dataset_cache.load(dataset_files)
+    # 输出长度直方图已由协调者读入配置
+    pressure.output_lengths = OutputLengths(agent_config["output_length"]) if output_length_enabled(agent_config) \
+        else None
+
+    stop_event = threading.Event()
+    threading.Thread(target=wait_for_stop, args=(reader, stop_event), daemon=True).start()
+
+    print(f"agent {index}: 测试文件 {len(test_files)} 个，测试并发 {agent_config['test_concurrent_workers']}，"
+          f"后台并发 {agent_config['background_concurrent_workers']}")
+    time.sleep(max(0, start["start_at"] - time.time()))
+    print(f"agent {index}: 开始发送请求")
+
+    try:
+        worker_process(index, agent_config, test_files, dataset_files, AgentChannel(writer), stop_event,
+                       local_interrupt=True)
+        print(f"agent {index}: 已完成")
+    except OSError as e:
+        print(f"错误: 与协调者的连接中断: {e}")
+        pressure.background_active = False
+    finally:
+        sock.close()
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # 用法: python -m zhejing.distributed <协调者IP> <端口>   以 agent 身份运行
+    if len(sys.argv) < 3:
+        print("用法: python -m zhejing.distributed <协调者IP> <端口>")
+        sys.exit(1)
+
+    run_agent({"coordinator_host": sys.argv[1], "coordinator_port": int(sys.argv[2])})
@@ -0,0 +1,151 @@
+import socket
+import threading
+import weakref
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 每个目标 (scheme, host:port) 共享一个会话及其连接池，所有工作线程复用
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# 所有已建立的连接，取消请求时关闭其 socket；弱引用，连接被回收后自动移除
+_connections = weakref.WeakSet()
+_connections_lock = threading.Lock()
+_cancelled = threading.Event()
+
+
+class _TrackedConnectionMixin:
+    """
+    建立连接时登记到 _connections，cancel_requests 可以从其他线程关闭正在阻塞读取的连接；
+    取消后不再建立新连接
+    """
+
+    def connect(self):
+        if _cancelled.is_set():
+            raise ConnectionAbortedError("请求已取消")
+        super().connect()
+        with _connections_lock:
+            _connections.add(self)
+
+    def close(self):
+        with _connections_lock:
+            _connections.discard(self)
+        super().close()
+
+
+class TrackedHTTPConnection(_TrackedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TrackedHTTPSConnection(_TrackedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TrackedHTTPConnection
+
+
+class TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TrackedHTTPSConnection
+
+
+class CancellableAdapter(HTTPAdapter):
+    """
+    使用可取消连接的 HTTPAdapter
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TrackedHTTPConnectionPool,
+            "https": TrackedHTTPSConnectionPool
+        }
+
+
+def cancel_requests():
+    """
+    取消所有在途请求: 关闭所有已建立连接的 socket，阻塞在读取响应的线程会立即收到连接错误；
+    之后新的请求在建立连接时失败，直到调用 reset_cancellation
+    """
+    _cancelled.set()
+    with _connections_lock:
+        connections = list(_connections)
+
+    for connection in connections:
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            continue
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def requests_cancelled():
+    """
+    是否已调用 cancel_requests
+    """
+    return _cancelled.is_set()
+
+
+def reset_cancellation():
+    _cancelled.clear()
+
+
+def get_session(url, pool_size=10):
+    """
+    获取目标地址对应的共享会话，首次获取时按 pool_size 创建连接池
+
+    Args:
+        url: 请求地址，按 scheme 和 host:port 区分目标
+        pool_size: 连接池保留的最大连接数，仅在首次创建会话时生效
+    """
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                # 连接池满时不阻塞，临时新建连接，用完后不放回池中
+                adapter = CancellableAdapter(pool_connections=1, pool_maxsize=max(1, pool_size), pool_block=False)
+                session.mount(f"{parts.scheme}://", adapter)
+                _sessions[key] = session
+    return session
+
+
+def http_post(url, keep_alive=True, pool_size=10, **kwargs):
+    """
+    发送 POST 请求，参数与 requests.post 相同
+
+    Args:
+        url: 请求地址
+        keep_alive: 为 True 时通过共享连接池复用连接；为 False 时每个请求新建连接并在结束后关闭，
+                    用于对比连接复用对测试结果的影响
+        pool_size: 连接池大小，见 get_session
+    """
+    if not keep_alive:
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["Connection"] = "close"
+        # 与 requests.post 相同，每个请求使用一个临时会话
+        with requests.Session() as session:
+            session.mount(f"{urlsplit(url).scheme}://", CancellableAdapter())
+            return session.post(url, headers=headers, **kwargs)
+
+    return get_session(url, pool_size).post(url, **kwargs)
+
+
+def close_sessions():
+    """
+    关闭所有共享会话及其连接
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,344 @@
+import math
+from array import array
+
+# 报告的分位数
+PERCENTILES = (50, 90, 99, 99.9)
+# 按列保存的数值中缺失值的表示
+NAN = float("nan")
+
+
+def new_stream_timing(start_time):
+    """
+    创建单个流式请求的计时记录，start_time 为请求发出的时间
+    """
+    return {
+        "start_time": start_time,
+        "first_byte_time": None,        # 收到第一行响应数据的时间
+        "first_content_time": None,     # 收到第一个 content token 的时间
+        "first_reasoning_time": None,   # 收到第一个 reasoning_content token 的时间
+        "chunk_times": []               # 每个携带 token 的 chunk 的到达时间
+    }
+
+
+def finalize_stream_timing(timing, usage=None):
+    """
+    由计时记录计算单个请求的延迟指标，时间均为相对请求发出时间的秒数
+
+    TTFT: 第一个 token（content 或 reasoning_content）的到达延迟
+    TPOT: 首 token 之后平均每个输出 token 的耗时 = (最后一个 chunk - 第一个 chunk) / (输出 token 数 - 1)。
+          一个 chunk 可能携带多个 token（投机解码、服务端合并发送），usage 中有输出 token 数时按 token 数计算
+          （不少于 chunk 数），否则按 chunk 数计算，此时为每个 chunk 的耗时
+    chunk_offsets: 每个 token chunk 的到达时间，相邻两项之差即 ITL
+
+    chunk 的到达时间取所在网络读取的时间（见 SSEStreamParser.feed），同一次读取中的多个 chunk 时间相同，
+    对应的 ITL 为 0，读取粒度较粗时 ITL 分布会偏向 0 和较大值两端
+
+    Args:
+        timing: new_stream_timing 创建并由 SSEStreamParser 填充的计时记录
+        usage: 响应中的 usage（服务端返回、分词器统计或按 chunk 数估算），为 None 时按 chunk 数计算 TPOT
+    """
+    start_time = timing["start_time"]
+
+    def offset(t):
+        return round(t - start_time, 6) if t is not None else None
+
+    chunk_times = timing["chunk_times"]
+    ttft = offset(chunk_times[0]) if chunk_times else None
+    tokens = max((usage or {}).get("completion_tokens") or 0, len(chunk_times))
+    tpot = (chunk_times[-1] - chunk_times[0]) / (tokens - 1) if len(chunk_times) > 1 else None
+
+    return {
+        "first_byte_latency": offset(timing["first_byte_time"]),
+        "first_content_latency": offset(timing["first_content_time"]),
+        "first_reasoning_latency": offset(timing["first_reasoning_time"]),
+        "ttft": ttft,
+        "tpot": tpot,
+        "token_chunks": len(chunk_times),
+        "chunk_offsets": [offset(t) for t in chunk_times]
+    }
+
+
+def percentile(sorted_values, q):
+    """
+    计算已排序数据的分位数（线性插值）
+    """
+    if not sorted_values:
+        return None
+
+    k = (len(sorted_values) - 1) * q / 100
+    f = math.floor(k)
+    c = min(f + 1, len(sorted_values) - 1)
+    return sorted_values[f] + (sorted_values[c] - sorted_values[f]) * (k - f)
+
+
+def summarize(values):
+    """
+    计算一组数据的数量、均值、最值和各分位数，忽略 None
+    """
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {"count": 0}
+
+    summary = {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "min": values[0],
+        "max": values[-1]
+    }
+    for q in PERCENTILES:
+        summary[f"p{q:g}"] = percentile(values, q)
+    return summary
+
+
+def column_value(value):
+    return NAN if value is None else value
+
+
+class RequestColumns:
+    """
+    按列保存每个请求的数值，每列一个 array('d')，每个请求每列只占 8 字节，缺失值为 NaN。
+
+    子类在 COLUMNS 中给出列名并实现 record_result，每个请求每列追加一个值
+    """
+
+    COLUMNS = ()
+
+    def __init__(self):
+        self.columns = {name: array('d') for name in self.COLUMNS}
+
+    def __len__(self):
+        return len(self.columns[self.COLUMNS[0]])
+
+    def merge(self, other):
+        for name, column in other.columns.items():
+            self.columns[name].extend(column)
+        return self
+
+
+def summarize_latency(results):
+    """
+    汇总一次运行中所有成功请求的端到端延迟、TTFT、TPOT 和 ITL 分布
+    """
+    e2e = []
+    ttft = []
+    tpot = []
+    itl = []
+
+    for result in results:
+        if not result["success"]:
+            continue
+
+        e2e.append(result["processing_time"])
+
+        timing = result.get("timing")
+        if not timing:
+            continue
+
+        ttft.append(timing["ttft"])
+        tpot.append(timing["tpot"])
+        offsets = timing["chunk_offsets"]
+        itl.extend(offsets[i] - offsets[i - 1] for i in range(1, len(offsets)))
+
+    return {
+        "e2e": summarize(e2e),
+        "ttft": summarize(ttft),
+        "tpot": summarize(tpot),
+        "itl": summarize(itl)
+    }
+
+
+def format_latency_summary(latency_stats):
+    """
+    将延迟统计格式化为控制台输出的文本行，单位为毫秒
+    """
+    names = {"e2e": "端到端", "ttft": "TTFT", "tpot": "TPOT", "itl": "ITL", "schedule_lag": "调度滞后"}
+    lines = []
+
+    for key, name in names.items():
+        summary = latency_stats.get(key)
+        if not summary or summary["count"] == 0:
+            continue
+
+        quantiles = ", ".join(f"p{q:g}: {summary[f'p{q:g}'] * 1000:.1f}" for q in PERCENTILES)
+        lines.append(f"{name}(ms) - 均值: {summary['mean'] * 1000:.1f}, {quantiles}, 样本数: {summary['count']}")
+
+    return lines
+
+
+def format_ms(value):
+    return f"{value * 1000:.1f}" if value is not None else "-"
+
+
+def request_tokens(result):
+    """
+    取出单个成功请求的 token 统计: 输入/输出 token 数（来自 usage，未知为 None）和解码速度
+
+    解码速度 = 首 token 之后的输出 token 数 / (最后一个 token 到达时间 - TTFT)，单位 token/s，只有流式请求可计算
+    """
+    usage = (result.get("response") or {}).get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+
+    decode_speed = None
+    timing = result.get("timing")
+    if timing and completion_tokens and completion_tokens > 1 and timing["chunk_offsets"]:
+        decode_time = timing["chunk_offsets"][-1] - timing["ttft"]
+        if decode_time > 0:
+            decode_speed = (completion_tokens - 1) / decode_time
+
+    return prompt_tokens, completion_tokens, decode_speed
+
+
+def summarize_tokens(results, elapsed):
+    """
+    汇总 token 吞吐: 输入/输出 token 总数、输入/输出 token/s（按运行时长 elapsed 计算）和单请求解码速度分布
+    """
+    prompt_tokens = 0
+    completion_tokens = 0
+    decode_speeds = []
+
+    for result in results:
+        if not result["success"]:
+            continue
+
+        prompt, completion, decode_speed = request_tokens(result)
+        prompt_tokens += prompt or 0
+        completion_tokens += completion or 0
+        decode_speeds.append(decode_speed)
+
+    return token_summary(prompt_tokens, completion_tokens, elapsed, summarize(decode_speeds))
+
+
+def token_summary(prompt_tokens, completion_tokens, elapsed, decode_speed):
+    """
+    由 token 总数和运行时长计算吞吐，decode_speed 为解码速度分布的汇总（summarize 的结构）
+    """
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "input_tokens_per_second": prompt_tokens / elapsed if elapsed > 0 else 0,
+        "output_tokens_per_second": completion_tokens / elapsed if elapsed > 0 else 0,
+        "decode_speed": decode_speed
+    }
+
+
+def format_token_summary(token_stats, label=""):
+    """
+    将 token 吞吐统计格式化为控制台输出的文本行，label 为行首的流量说明，如 "测试"
+    """
+    lines = [
+        f"{label}输入 tokens: {token_stats['prompt_tokens']} ({token_stats['input_tokens_per_second']:.1f} tok/s), "
+        f"输出 tokens: {token_stats['completion_tokens']} ({token_stats['output_tokens_per_second']:.1f} tok/s)"
+    ]
+
+    summary = token_stats["decode_speed"]
+    if summary and summary["count"] > 0:
+        quantiles = ", ".join(f"p{q:g}: {summary[f'p{q:g}']:.1f}" for q in PERCENTILES)
+        lines.append(f"{label}单请求解码速度(tok/s) - 均值: {summary['mean']:.1f}, {quantiles}, 样本数: {summary['count']}")
+    return lines
+
+
+# 可配置 SLO 的请求级指标
+SLO_METRICS = ("ttft", "tpot", "e2e")
+
+
+def slo_enabled(slo):
+    """
+    是否配置了至少一项 SLO
+    """
+    return bool(slo) and any(slo.get(name) for name in SLO_METRICS)
+
+
+def check_slo(result, slo):
+    """
+    返回单个请求违反的 SLO 名称列表，未配置 SLO 时或客户端主动中断的请求返回 None；
+    失败的请求不检查，返回空列表（计入失败而不是违反）
+
+    端到端延迟取 processing_time；TTFT、TPOT 只有流式请求可计算，非流式请求不检查这两项
+    """
+    if not slo_enabled(slo) or result.get("aborted"):
+        return None
+    if not result["success"]:
+        return []
+
+    timing = result.get("timing") or {}
+    values = {"ttft": timing.get("ttft"), "tpot": timing.get("tpot"), "e2e": result["processing_time"]}
+    return [name for name in SLO_METRICS if slo.get(name) and values[name] is not None and values[name] > slo[name]]
+
+
+def format_goodput_summary(goodput, label=""):
+    """
+    将 goodput 统计（见 WorkerStats.goodput_summary）格式化为控制台输出的文本行
+    """
+    slo = goodput["slo"]
+    limits = ", ".join(f"{name.upper()} <= {slo[name] * 1000:.0f}ms" for name in SLO_METRICS if slo.get(name))
+    violations = ", ".join(f"{name.upper()}: {goodput['violations'][name]}" for name in SLO_METRICS if slo.get(name))
+
+    target = slo.get("attainment", 0)
+    verdict = ""
+    if target:
+        verdict = f" ({'达标' if goodput['attainment'] >= target else '未达标'}, 目标 {target * 100:.1f}%)"
+
+    lines = [
+        f"{label}SLO: {limits}",
+        f"{label}SLO 达成率: {goodput['attainment'] * 100:.2f}% "
+        f"({goodput['attained_requests']}/{goodput['requests']}){verdict}",
+        f"{label}Goodput: {goodput['goodput_qps']:.2f} req/s, {goodput['goodput_output_tokens_per_second']:.1f} 输出tok/s",
+        f"{label}SLO 违反数 - {violations}, 失败: {goodput['failed_requests']}"
+    ]
+
+    # 违反 SLO 最多的数据集文件
+    files = sorted(goodput["files"].items(), key=lambda item: item[1]["requests"] - item[1]["attained"], reverse=True)
+    files = [(filename, counts) for filename, counts in files if counts["requests"] > counts["attained"]][:10]
+    if files:
+        lines.append(f"{label}未达成 SLO 最多的数据集文件:")
+        for filename, counts in files:
+            detail = ", ".join(f"{name.upper()}: {counts[name]}" for name in SLO_METRICS if counts[name])
+            failed = f", 失败: {counts['failed']}" if counts["failed"] else ""
+            lines.append(f"{label}  {filename} - 达成 {counts['attained']}/{counts['requests']}"
+                         f"{' (' + detail + ')' if detail else ''}{failed}")
+    return lines
+
+
+# 双侧 95% 置信水平的 t 分布临界值，下标为自由度 - 1
+T_CRITICAL_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145,
+                 2.131, 2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048,
+                 2.045, 2.042)
+
+
+def t_critical_95(df):
+    """
+    自由度 df 的 t 分布双侧 95% 临界值，df 大于 30 时用 Cornish-Fisher 展开近似
+    """
+    if df < 1:
+        return None
+    if df <= len(T_CRITICAL_95):
+        return T_CRITICAL_95[int(df) - 1]
+    z = 1.959964
+    return z + (z ** 3 + z) / (4 * df)
+
+
+def mean_difference(samples, baseline):
+    """
+    两组样本的均值之差 (samples - baseline) 及其 95% 置信区间（Welch t 区间，不要求两组方差相等），
+    返回 (差值, 下限, 上限)；任一组样本为空时返回 None，样本数不足 2 时置信区间为 None
+    """
+    if not samples or not baseline:
+        return None
+
+    n1, n2 = len(samples), len(baseline)
+    mean1, mean2 = sum(samples) / n1, sum(baseline) / n2
+    delta = mean1 - mean2
+    if n1 < 2 or n2 < 2:
+        return delta, None, None
+
+    var1 = sum((x - mean1) ** 2 for x in samples) / (n1 - 1)
+    var2 = sum((x - mean2) ** 2 for x in baseline) / (n2 - 1)
+    se2 = var1 / n1 + var2 / n2
+    if se2 == 0:
+        return delta, delta, delta
+
+    # Welch-Satterthwaite 自由度
+    df = se2 ** 2 / ((var1 / n1) ** 2 / (n1 - 1) + (var2 / n2) ** 2 / (n2 - 1))
+    margin = t_critical_95(df) * math.sqrt(se2)
+    return delta, delta - margin, delta + margin
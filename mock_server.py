@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+# 模拟服务端默认行为
+MOCK_CONFIG = {
+    "ttft": 0.05,               # 首 token 延迟(秒)
+    "token_delay": 0.01,        # 相邻 token 的间隔(秒)
+    "output_tokens": 64,        # 未被 max_tokens 截断时的输出 token 数
+    "reasoning_tokens": 0,      # 正文之前输出的 reasoning_content token 数
+    "error_rate": 0.0,          # 返回 HTTP 500 的请求比例
+    "abort_rate": 0.0,          # 流式响应中途断开连接的请求比例
+    "model_name": "mock"        # 请求未指定 model 时返回的模型名
+}
+
+
+class MockServer:
+    """
+    OpenAI 兼容的 /v1/chat/completions 模拟服务，用于在没有真实推理服务时压测客户端本身
+
+    基于 asyncio 实现最小的 HTTP/1.1 服务端（支持 keep-alive 和 chunked 流式响应），只依赖标准库。
+    token 按计划时刻（开始时间 + ttft + i * token_delay）发送，不会因事件循环调度累积漂移。
+    """
+
+    def __init__(self, options=None):
+        self.options = {**MOCK_CONFIG, **(options or {})}
+        self.served_requests = 0
+        self.served_tokens = 0
+
+    def output_length(self, request):
+        """
+        输出 token 数: ignore_eos 时输出 max_tokens 个，否则为 min(output_tokens, max_tokens)，
+        返回 (reasoning token 数, 正文 token 数, finish_reason)
+        """
+        options = self.options
+        max_tokens = request.get("max_tokens") or request.get("max_completion_tokens")
+        natural = options["reasoning_tokens"] + options["output_tokens"]
+
+        if max_tokens and (request.get("ignore_eos") or max_tokens < natural):
+            total = max_tokens
+            finish_reason = "length"
+        else:
+            total = natural
+            finish_reason = "stop"
+
+        reasoning = min(options["reasoning_tokens"], total)
+        return reasoning, total - reasoning, finish_reason
+
+    @staticmethod
+    def usage(request, completion_tokens):
+        # 以字符数近似 prompt token 数
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in request.get("messages", []))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                if method != "POST" or path.split("?")[0] != "/v1/chat/completions":
+                    await self.write_response(writer, 404, {"error": {"message": "not found"}}, keep_alive)
+                else:
+                    keep_alive = await self.handle_chat(writer, json.loads(body), keep_alive)
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def write_response(writer, status, data, keep_alive):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        reason = {200: "OK", 404: "Not Found", 500: "Internal Server Error"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+    async def handle_chat(self, writer, request, keep_alive):
+        """
+        处理一个对话请求，返回连接是否可以继续复用
+        """
+        options = self.options
+        if random.random() < options["error_rate"]:
+            await self.write_response(writer, 500, {"error": {"message": "injected error"}}, keep_alive)
+            return keep_alive
+
+        start = time.monotonic()
+        reasoning, content, finish_reason = self.output_length(request)
+        total = reasoning + content
+        model = request.get("model") or options["model_name"]
+        self.served_requests += 1
+
+        if not request.get("stream"):
+            await asyncio.sleep(options["ttft"] + max(0, total - 1) * options["token_delay"])
+            self.served_tokens += total
+            await self.write_response(writer, 200, {
+                "id": f"chatcmpl-mock{self.served_requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": "tok " * content,
+                        "reasoning_content": "think " * reasoning if reasoning else None
+                    },
+                    "finish_reason": finish_reason
+                }],
+                "usage": self.usage(request, total)
+            }, keep_alive)
+            return keep_alive
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: " + (b"keep-alive" if keep_alive else b"close") + b"\r\n\r\n"
+        )
+        abort_at = random.randrange(total) if total and random.random() < options["abort_rate"] else None
+        chunk_id = f"chatcmpl-mock{self.served_requests}"
+
+        def write_event(data):
+            event = b"data: " + data + b"\n\n"
+            writer.write(f"{len(event):x}\r\n".encode('latin-1') + event + b"\r\n")
+
+        for i in range(total):
+            delay = start + options["ttft"] + i * options["token_delay"] - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if i == abort_at:
+                # 模拟服务端中途断开，不发送结束块
+                writer.close()
+                return False
+
+            delta = {"reasoning_content": "think "} if i < reasoning else {"content": "tok "}
+            write_event(json.dumps({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": delta,
+                    "finish_reason": finish_reason if i == total - 1 else None
+                }]
+            }).encode('utf-8'))
+            self.served_tokens += 1
+            await writer.drain()
+
+        if (request.get("stream_options") or {}).get("include_usage"):
+            write_event(json.dumps({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [],
+                "usage": self.usage(request, total)
+            }).encode('utf-8'))
+        write_event(b"[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return keep_alive
+
+    async def serve(self, host="127.0.0.1", port=18000, ready=None):
+        """
+        启动服务并一直运行，ready 为 asyncio.Event 或 None，监听成功后设置
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=4096)
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="OpenAI 兼容的 /v1/chat/completions 模拟服务")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=18000)
+    arg_parser.add_argument("--ttft", type=float, default=MOCK_CONFIG["ttft"], help="首 token 延迟(秒)")
+    arg_parser.add_argument("--token-delay", type=float, default=MOCK_CONFIG["token_delay"], help="token 间隔(秒)")
+    arg_parser.add_argument("--output-tokens", type=int, default=MOCK_CONFIG["output_tokens"], help="输出 token 数")
+    arg_parser.add_argument("--reasoning-tokens", type=int, default=MOCK_CONFIG["reasoning_tokens"],
+                            help="reasoning_content token 数")
+    arg_parser.add_argument("--error-rate", type=float, default=MOCK_CONFIG["error_rate"], help="HTTP 500 比例")
+    arg_parser.add_argument("--abort-rate", type=float, default=MOCK_CONFIG["abort_rate"], help="流式中途断开比例")
+    args = arg_parser.parse_args()
+
+    options = {
+        "ttft": args.ttft,
+        "token_delay": args.token_delay,
+        "output_tokens": args.output_tokens,
+        "reasoning_tokens": args.reasoning_tokens,
+        "error_rate": args.error_rate,
+        "abort_rate": args.abort_rate
+    }
+    print(f"模拟服务监听 http://{args.host}:{args.port}/v1/chat/completions, 配置: {options}", flush=True)
+    try:
+        asyncio.run(MockServer(options).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
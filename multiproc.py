@@ -0,0 +1,359 @@
+import concurrent.futures
+import copy
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+
+from zhejing import send_reqs_with_pressure as pressure
+from zhejing.results_writer import ResultsWriter
+from zhejing.metrics import summarize_latency, format_latency_summary, format_token_summary, \
+    format_goodput_summary, slo_enabled
+from zhejing.output_length import length_check_enabled, format_length_summary
+from zhejing.stats import WorkerStats
+from zhejing.prometheus import start_metrics_server
+
+
+def split_share(total, parts, index):
+    """
+    把 total 尽量平均地分成 parts 份，返回第 index 份
+    """
+    return total // parts + (1 if index < total % parts else 0)
+
+
+def build_process_config(config, processes, index):
+    """
+    生成第 index 个子进程的配置: 测试并发、后台并发、连接池和开环到达速率按进程数均分，后台请求计划使用第 index 个序列，
+    爬坡、预热和冷却时间置为 0
+
+    多个速率为 qps/N 的独立泊松过程叠加后仍是速率为 qps 的泊松过程；constant 模式下各进程的发送时刻相同，
+    总体表现为每个间隔同时发出 N 个请求。
+    """
+    child = copy.deepcopy(config)
+    child["test_concurrent_workers"] = split_share(config["test_concurrent_workers"], processes, index)
+    child["background_concurrent_workers"] = split_share(config["background_concurrent_workers"], processes, index)
+    if config.get("pool_size"):
+        child["pool_size"] = max(1, split_share(config["pool_size"], processes, index))
+
+    # 多进程和分布式模式不支持预热/冷却窗口和并发爬坡（validate_config 已提示），工作者直接满并发运行且不统计窗口
+    for key in ("ramp_up_seconds", "warmup_seconds", "cooldown_seconds"):
+        child[key] = 0
+
+    # 各工作者使用同一种子下不同编号的请求序列，避免发出重复的请求
+    child.setdefault("schedule", {})["stream"] = index
+
+    if config.get("background_mode", "closed") == "open":
+        arrival = child["arrival"]
+        arrival["qps"] = config["arrival"]["qps"] / processes
+        if "burst_qps" in arrival:
+            arrival["burst_qps"] = config["arrival"]["burst_qps"] / processes
+        arrival["max_outstanding"] = max(1, split_share(config["arrival"].get("max_outstanding", 10000),
+                                                        processes, index))
+    return child
+
+
+def worker_process(index, config, test_files, dataset_files, messages, stop_event, local_interrupt=False):
+    """
+    工作者入口（多进程模式的子进程或分布式模式的 agent）: 运行分配到的测试请求和后台压力，
+    测试结果和后台统计快照通过 messages.put 发送给汇总方
+
+    停止统一由 stop_event 驱动: 停止时仍在进行的测试请求被取消，后台压力经排空阶段后停止，最后发送最终统计。
+    多进程模式下 Ctrl-C 会发给整个进程组，子进程忽略 SIGINT，由父进程设置 stop_event；
+    agent 没有父进程，local_interrupt 为 True 时本机 Ctrl-C 只设置 stop_event
+
+    消息格式为 (类型, 进程序号, 数据):
+        ("result", index, result)        单个测试请求结果
+        ("metrics", index, WorkerStats)  后台统计快照（累计值）
+        ("done", index, None)            子进程结束
+    """
+    if local_interrupt:
+        signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    else:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    background_thread = None
+    if config["background_concurrent_workers"] > 0 or config.get("background_mode", "closed") == "open":
+        pressure.background_active = True
+        background_thread = threading.Thread(
+            target=pressure.background_pressure_test,
+            args=(config, dataset_files, None, False)  # 由父进程通过 stop_event 统一停止
+        )
+        background_thread.start()
+
+    def send_metrics():
+        while not stop_event.wait(config.get("report_interval", 10) / 2):
+            messages.put(("metrics", index, pressure.background_metrics.snapshot()))
+
+    metrics_thread = threading.Thread(target=send_metrics, daemon=True)
+    metrics_thread.start()
+
+    if test_files:
+        file_infos = [(file_path, os.path.basename(file_path)) for file_path in test_files]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=config["test_concurrent_workers"]) as executor:
+            futures = [executor.submit(pressure.send_request, file_info, config, False) for file_info in file_infos]
+
+            def cancel_tests():
+                # 测试请求完成前收到停止（父进程/协调者被中断）: 不再发送新请求，关闭在途请求的连接
+                stop_event.wait()
+                if not all(future.done() for future in futures):
+                    for future in futures:
+                        future.cancel()
+                    pressure.cancel_requests()
+
+            threading.Thread(target=cancel_tests, daemon=True).start()
+            for future in concurrent.futures.as_completed(futures):
+                if not future.cancelled():
+                    messages.put(("result", index, future.result()))
+
+    stop_event.wait()
+    if background_thread:
+        pressure.background_active = False
+        background_thread.join()
+
+    pressure.close_sessions()
+    messages.put(("metrics", index, pressure.background_metrics.snapshot()))
+    messages.put(("done", index, None))
+
+
+def merge_snapshots(snapshots):
+    """
+    合并各子进程最新的后台统计快照
+    """
+    merged = WorkerStats()
+    for snapshot in snapshots:
+        merged.merge(snapshot)
+    return merged
+
+
+def assign_test_files(config, txt_files, parts):
+    """
+    把测试文件轮流分配给分到测试并发的工作者，返回 {序号: 文件列表}
+    """
+    test_files = {i: [] for i in range(parts)}
+    if config["test_concurrent_workers"] > 0:
+        workers = [i for i in range(parts) if split_share(config["test_concurrent_workers"], parts, i) > 0]
+        for position, file_path in enumerate(txt_files):
+            test_files[workers[position % len(workers)]].append(file_path)
+    return test_files
+
+
+def run_multiprocess(config, txt_files, results_dir):
+    """
+    多进程模式: fork processes 个子进程分担测试请求和后台并发，父进程合并各子进程的统计并输出，
+    测试结果统一写入一个结果文件
+    """
+    processes = config["processes"]
+    test_files = assign_test_files(config, txt_files, processes)
+
+    context = multiprocessing.get_context("fork")
+    messages = context.Queue()
+    stop_event = context.Event()
+    children = [
+        context.Process(
+            target=worker_process,
+            args=(i, build_process_config(config, processes, i), test_files[i], txt_files, messages, stop_event),
+            daemon=True
+        )
+        for i in range(processes)
+    ]
+
+    print(f"多进程模式: {processes} 个进程")
+    for child in children:
+        child.start()
+
+    try:
+        collect_worker_messages(config, len(txt_files), results_dir, messages, stop_event,
+                                [child.is_alive for child in children], f"{processes}进程")
+    finally:
+        stop_event.set()
+        # 所有子进程共用一个截止时间，各自的排空并行进行
+        deadline = time.time() + stop_grace_period(config)
+        for child in children:
+            child.join(timeout=max(0, deadline - time.time()))
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+
+def stop_grace_period(config):
+    """
+    设置 stop_event 后等待工作者发回最终统计的时长(秒): 后台排空时间加上关闭连接和发送统计的余量
+    """
+    return config.get("drain_timeout", 10) + 10
+
+
+def collect_worker_messages(config, total_files, results_dir, messages, stop_event, alive_checks, label):
+    """
+    汇总各工作者（子进程或远程 agent）发回的消息: 写入测试结果，定期输出合并后的后台统计，
+    测试请求全部完成或后台压力到达持续时间后设置 stop_event，收到所有工作者的 done 消息后输出最终统计
+
+    Args:
+        total_files: 测试文件总数
+        messages: 消息队列，消息格式见 worker_process
+        stop_event: 停止事件，工作者收到后停止后台压力并发送最终统计
+        alive_checks: 每个工作者一个无参函数，返回工作者是否仍在运行
+        label: 输出前缀中的工作者描述，如 "4进程"
+    """
+    workers = len(alive_checks)
+    background_enabled = config["background_concurrent_workers"] > 0 or config.get("background_mode") == "open"
+    test_enabled = config["test_concurrent_workers"] > 0
+
+    if test_enabled:
+        print(f"使用 {config['test_concurrent_workers']} 个测试并发工作线程")
+    if background_enabled:
+        print(f"使用 {config['background_concurrent_workers']} 个后台并发工作线程")
+    print(f"模型名称: {config['model_name']}")
+    print("开始处理...\n")
+
+    start_time = time.time()
+    if not test_enabled:
+        total_files = 0
+    completed_files = 0
+    successful_requests = 0
+    failed_requests = 0
+    latency_records = []
+
+    results_writer = None
+    results_file = None
+    if test_enabled:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        results_file = os.path.join(results_dir, f"all_results_{timestamp}.jsonl")
+        results_writer = ResultsWriter(results_file, {
+            "config": config,
+            "timestamp": datetime.now().isoformat(),
+            "total_files": total_files
+        })
+
+    # 没有测试请求时后台压力按 background_duration 运行，否则随测试请求完成而停止
+    deadline = None if test_enabled else start_time + config["background_duration"]
+    interval = config.get("report_interval", 10)
+    next_report = start_time + interval
+    previous_snapshot = None
+    latest_snapshots = {}
+    finished = set()
+    interrupted = False
+    stop_deadline = None
+    # 设置 stop_event 的时刻，之后工作者的排空时间不计入运行时长
+    stopped_at = None
+
+    # 测试结果在汇总方统计，测试请求的在途数无法获得，按完成时同时计入已发出
+    test_stats = WorkerStats()
+    metrics_server = start_metrics_server(config, lambda: {
+        "test": merge_snapshots([test_stats]) if test_enabled else None,
+        "background": merge_snapshots(list(latest_snapshots.values())) if background_enabled else None
+    })
+
+    while len(finished) < workers:
+        try:
+            now = time.time()
+            if stop_deadline and now >= stop_deadline:
+                print(f"警告: 工作者 {sorted(set(range(workers)) - finished)} 未在 {stop_grace_period(config)}秒内停止，"
+                      f"使用最近一次的统计")
+                break
+            if not stop_event.is_set():
+                if (test_enabled and completed_files >= total_files) or (deadline and now >= deadline):
+                    stop_event.set()
+                    stopped_at = now
+
+            if background_enabled and now >= next_report:
+                snapshot = merge_snapshots(latest_snapshots.values())
+                line = pressure.format_background_progress(snapshot, previous_snapshot, interval, now - start_time)
+                print(f"[后台·{label}] {line}")
+                previous_snapshot = snapshot
+                next_report = now + interval
+
+            try:
+                kind, index, payload = messages.get(timeout=0.5)
+            except queue.Empty:
+                dead = [i for i, alive in enumerate(alive_checks) if i not in finished and not alive()]
+                if dead:
+                    print(f"警告: 工作者 {dead} 异常退出")
+                    finished.update(dead)
+                continue
+
+            if kind == "result":
+                completed_files += 1
+                if payload["success"]:
+                    successful_requests += 1
+                else:
+                    failed_requests += 1
+                test_stats.increment("started_requests")
+                test_stats.record_result(payload)
+                results_writer.write(payload)
+                latency_records.append({key: payload[key] for key in ("success", "processing_time", "timing")})
+                pressure.print_result(payload, completed_files, total_files)
+            elif kind == "metrics":
+                latest_snapshots[index] = payload
+            elif kind == "done":
+                finished.add(index)
+        except KeyboardInterrupt:
+            # Ctrl-C: 通知工作者停止（取消测试请求、排空后台压力），继续接收各工作者的最终统计
+            if interrupted:
+                raise
+            interrupted = True
+            print("\n测试被中断，正在停止所有工作者...")
+            stop_event.set()
+            stopped_at = stopped_at or time.time()
+            stop_deadline = time.time() + stop_grace_period(config)
+
+    if metrics_server:
+        metrics_server.stop()
+
+    elapsed = (stopped_at or time.time()) - start_time
+    background_snapshot = merge_snapshots(latest_snapshots.values())
+    if background_enabled:
+        pressure.print_background_summary(background_snapshot, elapsed,
+                                          config.get("background_mode", "closed") == "open", config.get("slo"),
+                                          length_check=length_check_enabled(config))
+
+    if not test_enabled:
+        return
+
+    latency_stats = summarize_latency(latency_records)
+    token_stats = test_stats.token_summary(elapsed)
+    goodput_stats = test_stats.goodput_summary(elapsed, config["slo"]) if slo_enabled(config.get("slo")) else None
+    length_stats = test_stats.length_summary() if length_check_enabled(config) else None
+    combined_token_stats = None
+    if background_enabled:
+        combined_token_stats = merge_snapshots([test_stats, background_snapshot]).token_summary(elapsed)
+    results_writer.close({
+        "successful_requests": successful_requests,
+        "failed_requests": failed_requests,
+        "success_rate": successful_requests / total_files * 100 if total_files > 0 else 0,
+        "latency_stats": latency_stats,
+        "token_stats": token_stats,
+        "combined_token_stats": combined_token_stats,
+        "goodput_stats": goodput_stats,
+        "length_stats": length_stats,
+        "interrupted": interrupted,
+        "workers": label,
+        "background": {
+            **background_snapshot.counters,
+            "latency_stats": {name: histogram.summary() for name, histogram in background_snapshot.histograms.items()}
+        }
+    })
+
+    print("\n" + "=" * 50)
+    print("处理中断，以下为已完成请求的统计" if interrupted else "处理完成!")
+    print(f"工作者: {label}")
+    print(f"总文件数: {total_files}")
+    print(f"成功请求: {successful_requests}")
+    print(f"失败请求: {failed_requests}")
+    print(f"成功率: {successful_requests / total_files * 100:.1f}%")
+    for line in format_latency_summary(latency_stats):
+        print(line)
+    for line in format_token_summary(token_stats):
+        print(line)
+    if combined_token_stats:
+        for line in format_token_summary(combined_token_stats, "合计(测试+后台) "):
+            print(line)
+    if goodput_stats:
+        for line in format_goodput_summary(goodput_stats):
+            print(line)
+    if length_stats:
+        for line in format_length_summary(length_stats):
+            print(line)
+    print(f"\n所有结果已保存到: {results_file}")
@@ -0,0 +1,86 @@
+import random
+
+ARRIVAL_PROCESSES = ("constant", "poisson", "bursty")
+
+
+def arrival_times(arrival, rng=None):
+    """
+    按到达过程生成计划发送时刻（相对开始时间的秒数），为无限序列
+
+    Args:
+        arrival: 到达过程配置
+            process: constant 固定间隔 / poisson 泊松过程 / bursty 开关突发
+            qps: constant 和 poisson 的目标 QPS；bursty 关闭期间的 QPS（0 表示关闭期间不发送）
+            burst_qps: bursty 开启期间的 QPS
+            burst_on_seconds / burst_off_seconds: bursty 开启和关闭期间的时长
+        rng: random.Random 实例，默认新建
+    """
+    rng = rng or random.Random()
+    process = arrival["process"]
+    qps = arrival["qps"]
+
+    if process == "constant":
+        # 按序号计算时刻，避免浮点累加误差
+        interval = 1.0 / qps
+        index = 0
+        while True:
+            index += 1
+            yield index * interval
+
+    elif process == "poisson":
+        t = 0.0
+        while True:
+            t += rng.expovariate(qps)
+            yield t
+
+    elif process == "bursty":
+        on_seconds = arrival["burst_on_seconds"]
+        period = on_seconds + arrival["burst_off_seconds"]
+        t = 0.0
+        while True:
+            position = t % period
+            in_burst = position < on_seconds
+            rate = arrival["burst_qps"] if in_burst else qps
+            boundary = t - position + (on_seconds if in_burst else period)
+
+            if rate <= 0:
+                t = boundary
+                continue
+
+            # 泊松过程无记忆，跨过阶段边界时从边界处按新阶段的速率重新抽样
+            next_t = t + rng.expovariate(rate)
+            if next_t > boundary:
+                t = boundary
+                continue
+            t = next_t
+            yield t
+
+    else:
+        raise ValueError(f"不支持的到达过程: {process}")
+
+
+def validate_arrival(arrival):
+    """
+    检查到达过程配置，返回错误信息列表，为空表示配置有效
+    """
+    errors = []
+    process = arrival.get("process")
+    if process not in ARRIVAL_PROCESSES:
+        errors.append(f"到达过程 {process} 不支持，可选: {', '.join(ARRIVAL_PROCESSES)}")
+        return errors
+
+    if process in ("constant", "poisson") and arrival.get("qps", 0) <= 0:
+        errors.append("qps 必须大于0")
+
+    if process == "bursty":
+        if arrival.get("qps", 0) < 0:
+            errors.append("qps 不能小于0")
+        if arrival.get("burst_qps", 0) <= 0:
+            errors.append("burst_qps 必须大于0")
+        if arrival.get("burst_on_seconds", 0) <= 0 or arrival.get("burst_off_seconds", 0) < 0:
+            errors.append("burst_on_seconds 必须大于0，burst_off_seconds 不能小于0")
+
+    if arrival.get("max_outstanding", 1) < 1:
+        errors.append("max_outstanding 必须大于0")
+
+    return errors
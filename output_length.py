@@ -0,0 +1,132 @@
+import bisect
+import itertools
+import math
+
+from zhejing.metrics import request_tokens
+
+# 支持的输出长度分布
+DISTRIBUTIONS = ("fixed", "uniform", "lognormal", "histogram")
+
+
+def output_length_enabled(config):
+    """
+    是否按分布抽取每个请求的 max_tokens
+    """
+    return bool((config.get("output_length") or {}).get("distribution"))
+
+
+def length_check_enabled(config):
+    """
+    是否校验返回的输出 token 数: 只有开启 ignore_eos 时输出长度才确定等于 max_tokens
+    """
+    return output_length_enabled(config) and config["output_length"].get("ignore_eos", True)
+
+
+def load_histogram(file_path):
+    """
+    读取经验直方图文件，每行 "输出长度,权重"（逗号或空白分隔），# 之后的内容和空行忽略，返回 [[长度, 权重], ...]
+    """
+    bins = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            fields = line.replace(",", " ").split()
+            try:
+                tokens, weight = int(fields[0]), float(fields[1])
+            except (IndexError, ValueError):
+                raise ValueError(f"{file_path} 第 {number} 行格式错误: {line}")
+            if len(fields) != 2 or tokens < 1 or weight < 0:
+                raise ValueError(f"{file_path} 第 {number} 行格式错误: {line}")
+            bins.append([tokens, weight])
+
+    if sum(weight for _, weight in bins) <= 0:
+        raise ValueError(f"{file_path} 中没有权重大于 0 的输出长度")
+    return bins
+
+
+class OutputLengths:
+    """
+    按配置的分布抽取每个请求的 max_tokens:
+        fixed      固定为 tokens
+        uniform    [min, max] 内均匀分布的整数
+        lognormal  中位数为 median、对数标准差为 sigma 的对数正态分布，取整后截断到 [min, max]
+        histogram  按经验直方图 [[长度, 权重], ...] 的权重抽取（validate_config 读取 histogram_file 后写入配置）
+    """
+
+    def __init__(self, settings):
+        self.distribution = settings["distribution"]
+        self.tokens = settings.get("tokens", 256)
+        self.min = settings.get("min", 1)
+        self.max = settings.get("max", self.tokens)
+        self.median = settings.get("median", self.tokens)
+        self.sigma = settings.get("sigma", 0)
+        bins = settings.get("histogram") or []
+        self.values = [tokens for tokens, _ in bins]
+        self.weights = [weight for _, weight in bins]
+        self.cumulative = list(itertools.accumulate(self.weights))
+
+    def clip(self, value):
+        return min(max(int(round(value)), self.min), self.max)
+
+    def sample(self, rng):
+        """
+        用 random.Random（或 random 模块本身）抽取一个输出长度
+        """
+        if self.distribution == "fixed":
+            return self.tokens
+        if self.distribution == "uniform":
+            return rng.randint(self.min, self.max)
+        if self.distribution == "lognormal":
+            return self.clip(rng.lognormvariate(math.log(self.median), self.sigma))
+        return self.values[bisect.bisect_right(self.cumulative, rng.random() * self.cumulative[-1])]
+
+    def generate(self, rng, size):
+        """
+        用 NumPy Generator 向量化抽取 size 个输出长度，返回 Python 整数列表
+        """
+        if self.distribution == "fixed":
+            return [self.tokens] * size
+        if self.distribution == "uniform":
+            return rng.integers(self.min, self.max, size, endpoint=True).tolist()
+        if self.distribution == "lognormal":
+            return [self.clip(value) for value in rng.lognormal(math.log(self.median), self.sigma, size).tolist()]
+        total = self.cumulative[-1]
+        indices = rng.choice(len(self.values), size, p=[weight / total for weight in self.weights])
+        return [self.values[index] for index in indices.tolist()]
+
+    def describe(self):
+        if self.distribution == "fixed":
+            return f"固定 {self.tokens}"
+        if self.distribution == "uniform":
+            return f"均匀分布 [{self.min}, {self.max}]"
+        if self.distribution == "lognormal":
+            return f"对数正态分布 (中位数 {self.median}, sigma {self.sigma}, 截断到 [{self.min}, {self.max}])"
+        return f"经验直方图 ({len(self.values)} 个输出长度)"
+
+
+def output_length_error(result, payload, config):
+    """
+    开启输出长度校验时，返回成功完成的请求实际输出 token 数与请求的 max_tokens 之差，不校验或 token 数未知时返回 None
+    """
+    if payload is None or not length_check_enabled(config) or not result["success"] or result["aborted"]:
+        return None
+    completion_tokens = request_tokens(result)[1]
+    if completion_tokens is None:
+        return None
+    return completion_tokens - payload["max_tokens"]
+
+
+def format_length_summary(summary, label=""):
+    """
+    将输出长度校验结果（见 WorkerStats.length_summary）格式化为控制台输出的文本行
+    """
+    if not summary["checked"]:
+        return [f"{label}输出长度校验: 没有可校验的请求（响应中缺少输出 token 数）"]
+    lines = [f"{label}输出长度校验: 与 max_tokens 一致 {summary['matched']}/{summary['checked']} "
+             f"({summary['match_rate'] * 100:.1f}%), 不足 {summary['short']}, 超出 {summary['long']}"]
+    if summary["short"] or summary["long"]:
+        lines.append(f"{label}警告: 部分请求的输出长度与 max_tokens 不一致，服务端可能未支持 ignore_eos "
+                     f"或被其他长度上限截断，输出 token 数缺失时按分词器或 chunk 数估算也会产生偏差")
+    return lines
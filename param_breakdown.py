@@ -0,0 +1,163 @@
+import bisect
+import math
+
+from zhejing.metrics import NAN, RequestColumns, column_value, format_ms, request_tokens, summarize
+from zhejing.schedule import SAMPLED_PARAMS
+
+# 后台请求随机生成的采样参数，对应 background_param_ranges 中去掉 _range 后缀的键
+PARAMETERS = tuple(name for name, _ in SAMPLED_PARAMS)
+COLUMNS = PARAMETERS + ("end_time", "success", "e2e", "ttft", "tpot", "completion_tokens")
+# 取整数值的采样参数，按整数划分桶边界
+INTEGER_PARAMETERS = frozenset(name for name, kind in SAMPLED_PARAMS if kind == "integers")
+
+
+class ParamColumns(RequestColumns):
+    """
+    按列保存每个后台请求的采样参数和延迟（见 RequestColumns）。
+
+    与 WorkerStats 一样只由所属线程写入，由 MetricsRegistry 在结束时合并
+    """
+
+    COLUMNS = COLUMNS
+
+    def record_result(self, result):
+        """
+        追加一个带 sampling_params 的请求结果，主动中断的请求只保留 TTFT
+        """
+        params = result.get("sampling_params")
+        if not params:
+            return
+
+        columns = self.columns
+        for name in PARAMETERS:
+            columns[name].append(params[name])
+
+        success = result["success"]
+        complete = success and not result.get("aborted")
+        timing = result.get("timing") or {}
+        completion_tokens = request_tokens(result)[1] if complete else None
+
+        start_time = result.get("start_time")
+        columns["end_time"].append(NAN if start_time is None else start_time + result["processing_time"])
+        columns["success"].append(1.0 if success else 0.0)
+        columns["e2e"].append(result["processing_time"] if complete else NAN)
+        columns["ttft"].append(column_value(timing.get("ttft")) if success else NAN)
+        columns["tpot"].append(column_value(timing.get("tpot")) if complete else NAN)
+        columns["completion_tokens"].append(column_value(completion_tokens))
+
+
+def bucket_index(value, low, width, buckets):
+    """
+    值所在的等宽桶序号，超出范围的值归入两端的桶
+    """
+    if width <= 0:
+        return 0
+    return min(max(int((value - low) / width), 0), buckets - 1)
+
+
+def integer_edges(low, high, buckets):
+    """
+    把整数闭区间 [low, high] 尽量均匀地分为最多 buckets 个桶，返回各桶的起点和末尾的 high + 1，
+    第 i 个桶为 [edges[i], edges[i + 1] - 1]，整数个数少于 buckets 时每个整数一个桶
+    """
+    count = high - low + 1
+    buckets = max(min(buckets, count), 1)
+    return [low + math.ceil(i * count / buckets) for i in range(buckets + 1)]
+
+
+def param_breakdown(params, param_ranges, buckets, elapsed, window=None):
+    """
+    按每个采样参数把取值范围等分为 buckets 个桶，统计每个桶内请求的吞吐和延迟，
+    整数参数（top_k、seed）的桶边界取整数，桶为闭区间
+
+    seed 与延迟无关，各桶的差异可作为随机波动的参考
+
+    Args:
+        params: ParamColumns
+        param_ranges: background_param_ranges 配置
+        buckets: 每个参数的桶数
+        elapsed: 统计时长(秒)，用于计算每个桶的输出 tok/s
+        window: 稳态窗口（见 phases.measurement_window），不为 None 时只统计窗口内完成的请求
+
+    Returns:
+        行列表，每行为一个参数的一个桶
+    """
+    columns = params.columns
+    rows = list(range(len(params)))
+    if window:
+        end_times = columns["end_time"]
+        rows = [i for i in rows if window["steady_start"] <= end_times[i] <= window["steady_end"]]
+
+    result = []
+    for name in PARAMETERS:
+        low, high = param_ranges[f"{name}_range"]
+        values = columns[name]
+        if name in INTEGER_PARAMETERS:
+            low, high = int(low), int(high)
+            edges = integer_edges(low, high, buckets)
+            groups = [[] for _ in range(len(edges) - 1)]
+            for i in rows:
+                index = bisect.bisect_right(edges, values[i]) - 1
+                groups[min(max(index, 0), len(groups) - 1)].append(i)
+            for index, group in enumerate(groups):
+                result.append(summarize_bucket(columns, group, name, edges[index], max(edges[index + 1] - 1, low),
+                                               elapsed))
+            continue
+
+        width = (high - low) / buckets
+        groups = [[] for _ in range(buckets if width > 0 else 1)]
+        for i in rows:
+            groups[bucket_index(values[i], low, width, buckets)].append(i)
+
+        for index, group in enumerate(groups):
+            result.append(summarize_bucket(columns, group, name, low + index * width,
+                                           low + (index + 1) * width if width > 0 else high, elapsed))
+    return result
+
+
+def summarize_bucket(columns, group, name, low, high, elapsed):
+    def present(column):
+        return [columns[column][i] for i in group if not math.isnan(columns[column][i])]
+
+    tokens = present("completion_tokens")
+    # 单请求输出速度 = 输出 token 数 / 端到端延迟，非流式请求也可计算
+    speeds = [columns["completion_tokens"][i] / columns["e2e"][i] for i in group
+              if not math.isnan(columns["completion_tokens"][i]) and columns["e2e"][i] > 0]
+    e2e = summarize(present("e2e"))
+    ttft = summarize(present("ttft"))
+    tpot = summarize(present("tpot"))
+    speed = summarize(speeds)
+
+    return {
+        "parameter": name,
+        "low": low,
+        "high": high,
+        "requests": len(group),
+        "failed": sum(1 for i in group if not columns["success"][i]),
+        "output_tokens_per_second": sum(tokens) / elapsed if elapsed > 0 else 0,
+        "request_tokens_per_second_p50": speed.get("p50"),
+        "e2e_p50": e2e.get("p50"),
+        "ttft_p50": ttft.get("p50"),
+        "tpot_p50": tpot.get("p50"),
+        "tpot_p90": tpot.get("p90")
+    }
+
+
+def format_param_breakdown(rows):
+    """
+    将 param_breakdown 的结果格式化为控制台输出的文本行，每个参数一组
+    """
+    lines = ["按采样参数分桶统计 (延迟单位 ms):",
+             f"  {'参数':<18} {'区间':>17} {'请求数':>4} {'失败':>4} {'输出tok/s':>9} {'单请求tok/s':>8} "
+             f"{'E2E p50':>9} {'TTFT p50':>9} {'TPOT p50':>9} {'TPOT p90':>9}"]
+    for row in rows:
+        speed = row["request_tokens_per_second_p50"]
+        if row["parameter"] in INTEGER_PARAMETERS:
+            interval = f"[{row['low']:>7d}, {row['high']:>7d}]"
+        else:
+            interval = f"[{row['low']:>7.2f}, {row['high']:>7.2f})"
+        lines.append(f"  {row['parameter']:<20} {interval} {row['requests']:>7} "
+                     f"{row['failed']:>6} {row['output_tokens_per_second']:>10.1f} "
+                     f"{f'{speed:.1f}' if speed is not None else '-':>12} {format_ms(row['e2e_p50']):>9} "
+                     f"{format_ms(row['ttft_p50']):>9} {format_ms(row['tpot_p50']):>9} {format_ms(row['tpot_p90']):>9}")
+    return lines
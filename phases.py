@@ -0,0 +1,125 @@
+import math
+import threading
+import time
+from datetime import datetime
+
+
+class ConcurrencyRamp:
+    """
+    并发爬坡: 在 ramp_seconds 秒内把允许的在途请求数从 1 线性提高到 target，之后不再限制
+
+    工作线程在发送每个请求前调用 acquire，请求结束后调用 release；ramp_seconds 为 0 时不限制
+    """
+
+    def __init__(self, target, ramp_seconds, start=None):
+        self.target = max(1, target)
+        self.ramp_seconds = ramp_seconds
+        self.start = time.time() if start is None else start
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def allowed(self, now):
+        """
+        now 时刻允许的在途请求数
+        """
+        elapsed = now - self.start
+        if self.ramp_seconds <= 0 or elapsed >= self.ramp_seconds:
+            return self.target
+        return max(1, math.ceil(self.target * elapsed / self.ramp_seconds))
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                now = time.time()
+                allowed = self.allowed(now)
+                if self.in_flight < allowed:
+                    self.in_flight += 1
+                    return
+                # 等待其他请求结束，或等到允许的并发数提高的时刻
+                next_step = self.start + self.ramp_seconds * allowed / self.target
+                self._condition.wait(max(0.001, next_step - now))
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def run(self, func, *args):
+        """
+        在爬坡限制下调用 func(*args)
+        """
+        self.acquire()
+        try:
+            return func(*args)
+        finally:
+            self.release()
+
+
+def ramp_delay(index, workers, ramp_seconds):
+    """
+    第 index 个并发的启动延迟(秒)，ramp_seconds 内所有并发均匀错开启动
+    """
+    if ramp_seconds <= 0 or workers <= 0:
+        return 0
+    return ramp_seconds * index / workers
+
+
+def window_enabled(config):
+    """
+    是否配置了预热或冷却阶段
+    """
+    return config.get("warmup_seconds", 0) > 0 or config.get("cooldown_seconds", 0) > 0
+
+
+def measurement_window(run_start, run_end, warmup, cooldown):
+    """
+    稳态统计窗口: 运行开始 warmup 秒之后到运行结束前 cooldown 秒，各边界均为时间戳；窗口为空时返回 None
+    """
+    steady_start = run_start + warmup
+    steady_end = run_end - cooldown
+    if steady_end <= steady_start:
+        return None
+    return {
+        "run_start": run_start,
+        "steady_start": steady_start,
+        "steady_end": steady_end,
+        "run_end": run_end
+    }
+
+
+def in_window(record, window):
+    """
+    请求是否在稳态窗口内完成，record 需包含 start_time 和 processing_time
+
+    与后台流量的窗口快照（统计窗口内完成的请求）口径一致: 跨越窗口边界发出的请求和长于窗口的请求都按完成时刻计入，
+    吞吐的分母为窗口长度，分子也是窗口内完成的请求
+    """
+    start = record.get("start_time")
+    if start is None:
+        return False
+    return window["steady_start"] <= start + record["processing_time"] <= window["steady_end"]
+
+
+def window_summary(window, total_requests, window_requests):
+    """
+    窗口边界（ISO 时间）、稳态时长以及窗口内/外的请求数，写入结果汇总
+    """
+    return {
+        **{name: datetime.fromtimestamp(value).isoformat() for name, value in window.items()},
+        "steady_duration": window["steady_end"] - window["steady_start"],
+        "total_requests": total_requests,
+        "window_requests": window_requests,
+        "excluded_requests": total_requests - window_requests
+    }
+
+
+def format_window_summary(summary):
+    """
+    将 window_summary 的结果格式化为控制台输出的文本行
+    """
+    return [
+        f"预热: {summary['run_start']} ~ {summary['steady_start']}",
+        f"稳态: {summary['steady_start']} ~ {summary['steady_end']} ({summary['steady_duration']:.2f}秒)",
+        f"冷却: {summary['steady_end']} ~ {summary['run_end']}",
+        f"稳态窗口内请求: {summary['window_requests']}, 预热/冷却阶段请求(不计入统计): {summary['excluded_requests']}"
+    ]
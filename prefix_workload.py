@@ -0,0 +1,211 @@
+import asyncio
+import csv
+import os
+import random
+import time
+from datetime import datetime
+
+#import send_reqs_with_pressure as pressure # ide run
+from zhejing import send_reqs_with_pressure as pressure
+from zhejing.metrics import format_ms
+from zhejing.stats import WorkerStats
+
+# 生成前缀和后缀的词表，常见英文单词在主流分词器中通常各占 1 个 token
+WORDS = (
+    "time", "year", "people", "way", "day", "man", "thing", "woman", "life", "child", "world", "school", "state",
+    "family", "student", "group", "country", "problem", "hand", "part", "place", "case", "week", "company", "system",
+    "program", "question", "work", "government", "number", "night", "point", "home", "water", "room", "mother",
+    "area", "money", "story", "fact", "month", "lot", "right", "study", "book", "eye", "job", "word", "business",
+    "issue", "side", "kind", "head", "house", "service", "friend", "father", "power", "hour", "game", "line", "end",
+    "member", "law", "car", "city", "community", "name", "president", "team", "minute", "idea", "kid", "body",
+    "information", "back", "parent", "face", "others", "level", "office", "door", "health", "person", "art", "war",
+    "history", "party", "result", "change", "morning", "reason", "research", "girl", "guy", "moment", "air",
+    "teacher", "force", "education", "good", "new", "first", "last", "long", "great", "little", "own", "other",
+    "old", "big", "high", "different", "small", "large", "next", "early", "young", "important", "few", "public",
+    "bad", "same", "able", "make", "know", "take", "see", "come", "think", "look", "want", "give", "use", "find",
+    "tell", "ask", "seem", "feel", "try", "leave", "call", "keep", "start", "show", "hear", "play", "run", "move",
+    "live", "believe", "hold", "bring", "happen", "write", "provide", "sit", "stand", "lose", "pay", "meet",
+    "include", "continue", "set", "learn", "lead", "understand", "watch", "follow", "stop", "create", "speak",
+    "read", "allow", "add", "spend", "grow", "open", "walk", "win", "offer", "remember", "love", "consider"
+)
+
+# CSV 列，时间单位为秒
+COLUMNS = (
+    "pool_size", "kind", "duration", "requests", "successful", "failed", "qps", "output_tokens_per_second",
+    "ttft_p50", "ttft_p90", "ttft_p99", "e2e_p50", "e2e_p99", "tpot_p50", "speedup"
+)
+
+
+def generate_text(rng, length):
+    """
+    生成 length 个随机单词组成的文本
+    """
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+class PrefixWorkload:
+    """
+    共享前缀请求生成器
+
+    reuse_ratio 比例的请求从前缀池中随机选择一个前缀（system 消息），其余请求使用全新生成的前缀；
+    每个请求的 user 消息为独有的随机后缀。前缀开头带有编号，不同前缀从第一个 token 起就不同。
+
+    请求分为两类: warm 为前缀此前已发送过的请求（服务端前缀缓存可能命中），
+    cold 为全新前缀或前缀池中前缀的第一次使用（不可能命中）。
+    """
+
+    def __init__(self, pool_size, prefix_length, suffix_length, reuse_ratio, seed=0):
+        self.pool_size = pool_size
+        self.prefix_length = prefix_length
+        self.suffix_length = suffix_length
+        self.reuse_ratio = reuse_ratio
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self._pool = {}
+        self._cold_prefixes = 0
+
+    def pool_prefix(self, index):
+        """
+        前缀池中的第 index 个前缀，相同种子和编号生成相同内容，首次使用时生成
+        """
+        prefix = self._pool.get(index)
+        if prefix is None:
+            prefix = f"[context {self.seed}-{index}] " + generate_text(random.Random(f"{self.seed}-{index}"),
+                                                                        self.prefix_length)
+            self._pool[index] = prefix
+        return prefix
+
+    def next_request(self):
+        """
+        生成下一个请求，返回 (messages, 类别 warm/cold, 前缀标识)
+        """
+        if self.pool_size > 0 and self.rng.random() < self.reuse_ratio:
+            index = self.rng.randrange(self.pool_size)
+            kind = "warm" if index in self._pool else "cold"
+            prefix = self.pool_prefix(index)
+            label = f"prefix_{index}"
+        else:
+            self._cold_prefixes += 1
+            kind = "cold"
+            prefix = f"[context cold-{self.seed}-{self._cold_prefixes}] " + generate_text(self.rng, self.prefix_length)
+            label = "cold"
+
+        suffix = generate_text(self.rng, self.suffix_length)
+        messages = [
+            {"role": "system", "content": prefix},
+            {"role": "user", "content": f"{suffix}\nSummarize the context above in one sentence."}
+        ]
+        return messages, kind, label
+
+
+async def prefix_worker(session, config, workload, stats, deadline):
+    """
+    单个闭环并发协程，持续发送共享前缀请求直到 deadline，按 warm/cold 分别统计
+    """
+    from zhejing.async_engine import async_send_request
+
+    while time.time() < deadline:
+        messages, kind, label = workload.next_request()
+        payload = pressure.build_payload(messages, config)
+        result = await async_send_request(session, (None, label), config, payload=payload)
+        stats[kind].record_result(result)
+
+
+async def run_stage(config, workload, concurrency, duration):
+    """
+    运行一个前缀池大小，返回 {"warm": WorkerStats, "cold": WorkerStats}
+    """
+    from zhejing.async_engine import aiohttp, raise_nofile_limit
+
+    raise_nofile_limit(concurrency + 1024)
+    connector = aiohttp.TCPConnector(limit=concurrency, force_close=not config.get("keep_alive", True))
+    timeout = aiohttp.ClientTimeout(total=config["timeout"])
+    stats = {"warm": WorkerStats(), "cold": WorkerStats()}
+    deadline = time.time() + duration
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(prefix_worker(session, config, workload, stats, deadline) for _ in range(concurrency)))
+    return stats
+
+
+def summarize_kind(pool_size, kind, stats, elapsed):
+    counters = stats.counters
+    histograms = stats.histograms
+    ttft = histograms["ttft"].percentiles((50, 90, 99))
+    e2e = histograms["e2e"].percentiles((50, 99))
+    return {
+        "pool_size": pool_size,
+        "kind": kind,
+        "duration": elapsed,
+        "requests": counters["total_requests"],
+        "successful": counters["successful_requests"],
+        "failed": counters["failed_requests"],
+        "qps": counters["successful_requests"] / elapsed if elapsed > 0 else 0,
+        "output_tokens_per_second": counters["completion_tokens"] / elapsed if elapsed > 0 else 0,
+        "ttft_p50": ttft[50],
+        "ttft_p90": ttft[90],
+        "ttft_p99": ttft[99],
+        "e2e_p50": e2e[50],
+        "e2e_p99": e2e[99],
+        "tpot_p50": histograms["tpot"].percentiles((50,))[50],
+        "speedup": None
+    }
+
+
+def print_row(row):
+    speedup = f"{row['speedup']:.2f}x" if row["speedup"] else "-"
+    print(f"{row['pool_size']:>8} {row['kind']:>5} {row['requests']:>7} {row['qps']:>8.2f} "
+          f"{format_ms(row['ttft_p50']):>9} {format_ms(row['ttft_p99']):>9} {format_ms(row['e2e_p50']):>9} "
+          f"{format_ms(row['e2e_p99']):>9} {speedup:>8}")
+
+
+def run_prefix_workload(config, results_dir):
+    """
+    共享前缀负载: 对每个前缀池大小运行 duration 秒的闭环并发，分别统计 warm（前缀可能命中缓存）和 cold 请求的
+    TTFT/端到端延迟。加速比（cold p50 / warm p50）反映前缀缓存的收益，前缀池增大到超过服务端缓存容量后
+    加速比下降即为缓存淘汰的影响。结果写入 results/prefix_*.csv
+    """
+    workload_config = config["prefix_workload"]
+    pool_sizes = workload_config.get("pool_sizes", [16])
+    prefix_length = workload_config.get("prefix_length", 2048)
+    suffix_length = workload_config.get("suffix_length", 64)
+    reuse_ratio = workload_config.get("reuse_ratio", 0.8)
+    concurrency = workload_config.get("concurrency", 16)
+    duration = workload_config.get("duration", 60)
+
+    print(f"共享前缀负载: 前缀池大小 {pool_sizes}, 前缀长度 {prefix_length} 词, "
+          f"后缀长度 {suffix_length} 词, 复用比例 {reuse_ratio}")
+    print(f"并发数: {concurrency}, 每个前缀池大小运行 {duration}秒")
+    print(f"模型名称: {config['model_name']}")
+    print(f"{'前缀池':>6} {'类别':>3} {'请求数':>4} {'QPS':>8} {'TTFT p50':>9} {'TTFT p99':>9} "
+          f"{'E2E p50':>9} {'E2E p99':>9} {'加速比':>6}  (ms)")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    csv_file = os.path.join(results_dir, f"prefix_{timestamp}.csv")
+
+    with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+
+        try:
+            for pool_size in pool_sizes:
+                # 每个阶段使用不同的种子，避免上一阶段已缓存的前缀影响结果
+                workload = PrefixWorkload(pool_size, prefix_length, suffix_length, reuse_ratio,
+                                          f"{workload_config.get('seed', 0)}-{pool_size}")
+                start = time.time()
+                stats = asyncio.run(run_stage(config, workload, concurrency, duration))
+                elapsed = time.time() - start
+
+                rows = {kind: summarize_kind(pool_size, kind, stats[kind], elapsed) for kind in ("warm", "cold")}
+                # 加速比 = cold / warm 的 TTFT p50，非流式请求没有 TTFT，取端到端 p50
+                key = "ttft_p50" if rows["warm"]["ttft_p50"] and rows["cold"]["ttft_p50"] else "e2e_p50"
+                if rows["warm"][key] and rows["cold"][key]:
+                    rows["warm"]["speedup"] = rows["cold"][key] / rows["warm"][key]
+                for row in rows.values():
+                    writer.writerow(row)
+                    print_row(row)
+                f.flush()
+        except KeyboardInterrupt:
+            print("共享前缀负载被中断")
+
+    print(f"\n结果已保存到: {csv_file}")
@@ -0,0 +1,142 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from zhejing.metrics import SLO_METRICS
+
+# 直方图的 le 桶边界(秒)，覆盖 ITL 的毫秒级到长输出请求的分钟级
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# WorkerStats 直方图名 -> (指标名, 说明)
+HISTOGRAM_METRICS = {
+    "e2e": ("zhejing_request_duration_seconds", "端到端请求延迟"),
+    "ttft": ("zhejing_ttft_seconds", "首 token 延迟 (TTFT)"),
+    "tpot": ("zhejing_tpot_seconds", "每输出 token 平均耗时 (TPOT)"),
+    "itl": ("zhejing_itl_seconds", "流式响应相邻 chunk 间隔 (ITL)"),
+    "schedule_lag": ("zhejing_schedule_lag_seconds", "开环模式调度滞后")
+}
+
+
+def format_bound(bound):
+    return f"{bound:g}"
+
+
+def render_metrics(stats_by_role):
+    """
+    把各角色的 WorkerStats 渲染为 Prometheus 文本格式
+
+    Args:
+        stats_by_role: {"test": WorkerStats, "background": WorkerStats}，值为 None 的角色不输出
+    """
+    stats_by_role = {role: stats for role, stats in stats_by_role.items() if stats is not None}
+    lines = [
+        "# HELP zhejing_requests_total 已完成的请求数",
+        "# TYPE zhejing_requests_total counter"
+    ]
+    for role, stats in stats_by_role.items():
+        counters = stats.counters
+        lines.append(f'zhejing_requests_total{{role="{role}",status="success"}} {counters["successful_requests"]}')
+        lines.append(f'zhejing_requests_total{{role="{role}",status="failure"}} {counters["failed_requests"]}')
+
+    lines.append("# HELP zhejing_capped_requests_total 开环模式下因在途请求达到上限而延后发送的请求数")
+    lines.append("# TYPE zhejing_capped_requests_total counter")
+    for role, stats in stats_by_role.items():
+        lines.append(f'zhejing_capped_requests_total{{role="{role}"}} {stats.counters["capped_requests"]}')
+
+    lines.append("# HELP zhejing_aborted_requests_total 客户端主动中断的流式请求数（同时计入 status=\"success\"）")
+    lines.append("# TYPE zhejing_aborted_requests_total counter")
+    for role, stats in stats_by_role.items():
+        lines.append(f'zhejing_aborted_requests_total{{role="{role}"}} {stats.counters["aborted_requests"]}')
+
+    lines.append("# HELP zhejing_tokens_total 成功请求的 token 数（来自 usage，缺失时为分词器统计或 chunk 数估算）")
+    lines.append("# TYPE zhejing_tokens_total counter")
+    for role, stats in stats_by_role.items():
+        lines.append(f'zhejing_tokens_total{{role="{role}",type="prompt"}} {stats.counters["prompt_tokens"]}')
+        lines.append(f'zhejing_tokens_total{{role="{role}",type="completion"}} {stats.counters["completion_tokens"]}')
+
+    lines.append("# HELP zhejing_slo_requests_total 配置了 SLO 时各请求的 SLO 结果（attained 为成功且满足全部 SLO）")
+    lines.append("# TYPE zhejing_slo_requests_total counter")
+    for role, stats in stats_by_role.items():
+        counters = stats.counters
+        lines.append(f'zhejing_slo_requests_total{{role="{role}",result="attained"}} {counters["slo_attained_requests"]}')
+        for name in SLO_METRICS:
+            lines.append(f'zhejing_slo_requests_total{{role="{role}",result="{name}_violation"}} '
+                         f'{counters[f"slo_{name}_violations"]}')
+
+    lines.append("# HELP zhejing_in_flight_requests 已发出尚未完成的请求数")
+    lines.append("# TYPE zhejing_in_flight_requests gauge")
+    for role, stats in stats_by_role.items():
+        in_flight = max(0, stats.counters["started_requests"] - stats.counters["total_requests"])
+        lines.append(f'zhejing_in_flight_requests{{role="{role}"}} {in_flight}')
+
+    for name, (metric, description) in HISTOGRAM_METRICS.items():
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for role, stats in stats_by_role.items():
+            histogram = stats.histograms[name]
+            for bound, count in zip(BUCKETS, histogram.cumulative_counts(BUCKETS)):
+                lines.append(f'{metric}_bucket{{role="{role}",le="{format_bound(bound)}"}} {count}')
+            lines.append(f'{metric}_bucket{{role="{role}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{role="{role}"}} {histogram.total}')
+            lines.append(f'{metric}_count{{role="{role}"}} {histogram.count}')
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer(threading.Thread):
+    """
+    Prometheus 指标 HTTP 服务，GET /metrics 时调用 collect() 获取 {角色: WorkerStats} 并渲染。
+
+    请求路径上只更新各线程自己的计数器和直方图，合并与渲染只在抓取时进行，抓取频率不影响压测开销。
+    """
+
+    def __init__(self, collect, host="0.0.0.0", port=9400):
+        super().__init__(daemon=True)
+        self.collect = collect
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_metrics(server.collect()).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 不输出每次抓取的访问日志
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    def run(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_metrics_server(config, collect):
+    """
+    按配置启动指标服务，metrics_port 为 0 时不启动，返回 MetricsServer 或 None
+    """
+    port = config.get("metrics_port", 0)
+    if not port:
+        return None
+
+    host = config.get("metrics_host", "0.0.0.0")
+    try:
+        server = MetricsServer(collect, host, port)
+    except OSError as e:
+        print(f"警告: 指标服务启动失败 {host}:{port}: {e}")
+        return None
+
+    server.start()
+    print(f"Prometheus 指标服务: http://{host}:{port}/metrics")
+    return server
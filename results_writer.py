@@ -0,0 +1,223 @@
+import gzip
+import json
+import queue
+import sys
+import threading
+
+# 写入线程结束标记
+_CLOSE = object()
+
+
+class JsonlWriter(threading.Thread):
+    """
+    JSONL 写入线程: 调用方提交的记录由写入线程逐行写入文件，队列为空时才刷新到磁盘，积压时批量写入
+
+    子类可重写 header / encode / footer 决定首行、每条记录和末行的内容，重写 flush 刷新额外的文件
+    """
+
+    def __init__(self, file_path, buffer_size=1 << 20):
+        """
+        Args:
+            file_path: JSONL 文件路径
+            buffer_size: 文件写缓冲大小(字节)
+        """
+        super().__init__(daemon=True)
+        self.file_path = file_path
+        self.buffer_size = buffer_size
+        self.written = 0
+        self._queue = queue.SimpleQueue()
+
+    def write(self, item):
+        """
+        提交一条记录，由写入线程异步写入，调用方之后不能再修改该记录
+        """
+        self._queue.put(item)
+
+    def close(self):
+        """
+        写入所有剩余记录后关闭文件
+        """
+        self._queue.put(_CLOSE)
+        self.join()
+
+    def header(self):
+        """
+        文件第一行的内容，为 None 时不写
+        """
+        return None
+
+    def encode(self, item):
+        """
+        把提交的记录转换为写入文件的 JSON 对象
+        """
+        return item
+
+    def footer(self):
+        """
+        关闭时最后一行的内容，为 None 时不写
+        """
+        return None
+
+    def flush(self, f):
+        f.flush()
+
+    def run(self):
+        with open(self.file_path, 'w', encoding='utf-8', buffering=self.buffer_size) as f:
+            header = self.header()
+            if header is not None:
+                f.write(json.dumps(header, ensure_ascii=False) + "\n")
+                f.flush()
+
+            while True:
+                item = self._queue.get()
+                if item is _CLOSE:
+                    break
+
+                f.write(json.dumps(self.encode(item), ensure_ascii=False) + "\n")
+                self.written += 1
+
+                # 没有待写记录时刷新，积压时批量写入
+                if self._queue.empty():
+                    self.flush(f)
+
+            footer = self.footer()
+            if footer is not None:
+                f.write(json.dumps(footer, ensure_ascii=False) + "\n")
+
+
+class ResultsWriter(JsonlWriter):
+    """
+    结果流式写入线程，每个请求结果完成后立即写为 JSONL 的一行，运行中途崩溃也只丢失缓冲区中的少量结果
+
+    文件格式（每行一个 JSON 对象，record 字段区分类型）:
+        {"record": "header", "config": ..., "timestamp": ..., "total_files": ...}
+        {"record": "result", "filename": ..., "success": ..., ...}    每个请求一行
+        {"record": "summary", "successful_requests": ..., ...}         运行结束时写入
+
+    指定 body_file 时，结果中的 "body" 字段（响应原文，bytes 或 str）不写入 JSONL，而是单独压缩为一个 gzip 成员
+    追加到 body_file，结果中改为记录 "body": {"offset", "length", "size"}（压缩后的偏移和长度、原始大小），
+    汇总字段可以直接查询而不必读取响应原文，需要时用 read_body 按偏移读取单个响应
+    """
+
+    def __init__(self, file_path, header, buffer_size=1 << 20, body_file=None, compress_level=6):
+        """
+        Args:
+            file_path: JSONL 文件路径
+            header: 运行信息，写在文件第一行
+            buffer_size: 文件写缓冲大小(字节)，队列为空时才刷新到磁盘
+            body_file: 响应原文的压缩旁路文件路径，为 None 时 body 字段直接写入 JSONL
+            compress_level: gzip 压缩级别
+        """
+        super().__init__(file_path, buffer_size)
+        self.run_info = header
+        self.body_file = body_file
+        self.compress_level = compress_level
+        self._summary = None
+        self._body_f = None
+        self.start()
+
+    def close(self, summary=None):
+        """
+        写入所有剩余结果和汇总信息后关闭文件
+        """
+        self._summary = summary
+        super().close()
+
+    def header(self):
+        header = {"record": "header", **self.run_info}
+        if self.body_file:
+            header["body_file"] = self.body_file
+        return header
+
+    def encode(self, item):
+        if self._body_f and item.get("body") is not None:
+            item = {**item, "body": self._write_body(self._body_f, item["body"])}
+        return {"record": "result", **item}
+
+    def footer(self):
+        return {"record": "summary", **self._summary} if self._summary is not None else None
+
+    def flush(self, f):
+        f.flush()
+        if self._body_f:
+            self._body_f.flush()
+
+    def run(self):
+        self._body_f = open(self.body_file, 'wb', buffering=self.buffer_size) if self.body_file else None
+        try:
+            super().run()
+        finally:
+            if self._body_f:
+                self._body_f.close()
+
+    def _write_body(self, body_f, body):
+        """
+        把一个响应原文压缩为独立的 gzip 成员追加到旁路文件，返回其位置
+        """
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        compressed = gzip.compress(data, compresslevel=self.compress_level, mtime=0)
+        offset = body_f.tell()
+        body_f.write(compressed)
+        return {"offset": offset, "length": len(compressed), "size": len(data)}
+
+
+def read_body(body_file, location):
+    """
+    按结果中记录的位置 {"offset", "length"} 从旁路文件读取并解压单个响应原文，返回 bytes
+    """
+    with open(body_file, 'rb') as f:
+        f.seek(location["offset"])
+        return gzip.decompress(f.read(location["length"]))
+
+
+def load_all_results(file_path):
+    """
+    读取 JSONL 结果文件，重建原 all_results 结构:
+    {"config", "timestamp", "total_files", "results", "successful_requests", "failed_requests", "success_rate", ...}
+
+    运行中途崩溃没有汇总行时，按已写入的结果重新计算成功/失败统计；最后一行写到一半的结果会被忽略
+    """
+    all_results = {}
+    results = []
+    summary = None
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            record_type = record.pop("record", None)
+            if record_type == "header":
+                all_results.update(record)
+            elif record_type == "result":
+                results.append(record)
+            elif record_type == "summary":
+                summary = record
+
+    all_results["results"] = results
+    if summary is None:
+        successful_requests = sum(1 for result in results if result["success"])
+        total_files = all_results.get("total_files") or len(results)
+        summary = {
+            "successful_requests": successful_requests,
+            "failed_requests": len(results) - successful_requests,
+            "success_rate": successful_requests / total_files * 100 if total_files > 0 else 0
+        }
+
+    all_results.update(summary)
+    return all_results
+
+
+if __name__ == "__main__":
+    # 用法: python results_writer.py <all_results_xxx.jsonl> [输出.json]
+    if len(sys.argv) < 2:
+        print("用法: python results_writer.py <all_results_xxx.jsonl> [输出.json]")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else source.rsplit(".", 1)[0] + ".json"
+    with open(target, 'w', encoding='utf-8') as f:
+        json.dump(load_all_results(source), f, ensure_ascii=False, indent=2)
+    print(f"已重建 all_results 结构并保存到: {target}")
@@ -0,0 +1,137 @@
+import itertools
+import os
+import random
+import threading
+from collections import OrderedDict
+
+from zhejing.output_length import OutputLengths, output_length_enabled
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 后台请求随机生成的采样参数及取值方式: uniform 区间内均匀分布的浮点数 / integers 闭区间内的整数
+SAMPLED_PARAMS = (
+    ("presence_penalty", "uniform"),
+    ("frequency_penalty", "uniform"),
+    ("repetition_penalty", "uniform"),
+    ("temperature", "uniform"),
+    ("top_p", "uniform"),
+    ("top_k", "integers"),
+    ("seed", "integers")
+)
+# 同时缓存的块数，工作者按序号领取请求，只需保留最近的几块
+CACHED_BLOCKS = 4
+
+
+def schedule_backend():
+    return "numpy" if np is not None else "random"
+
+
+class RequestSchedule:
+    """
+    后台请求计划: 按种子预先生成每个后台请求的数据集文件、采样参数、max_tokens、是否主动中断和思考时间
+
+    计划按 block_size 个请求为一块向量化生成（安装了 NumPy 时使用 NumPy，否则使用 random 模块），
+    第 k 块只由 (seed, stream, k) 决定，与生成顺序和线程调度无关。工作者通过 next() 按序号领取请求，
+    相同种子的两次运行发出的请求序列完全相同；各请求由哪个工作者发送、完成的先后仍取决于并发调度。
+    NumPy 和 random 模块生成的序列不同，需要对比的两次运行应使用同一种后端。
+    """
+
+    def __init__(self, config, dataset_files, seed, stream=0, block_size=4096):
+        """
+        Args:
+            config: 配置字典，使用 background_param_ranges、max_tokens、output_length、abort 和 think_time
+            dataset_files: 数据集文件列表，按文件名排序后编号，与 glob 返回的顺序无关
+            seed: 非负整数种子
+            stream: 同一种子下的序列编号，多进程/分布式模式下每个工作者使用不同的编号
+            block_size: 每块的请求数
+        """
+        self.files = sorted(dataset_files, key=os.path.basename)
+        self.param_ranges = config["background_param_ranges"]
+        self.max_tokens = config["max_tokens"]
+        # 配置了输出长度分布时每个请求的 max_tokens 按分布生成，否则都为 max_tokens
+        self.output_lengths = OutputLengths(config["output_length"]) if output_length_enabled(config) else None
+        abort = config.get("abort") or {}
+        self.abort_ratio = abort.get("ratio", 0) if config.get("background_stream", False) else 0
+        self.abort_after = abort.get("after_tokens", 1)
+        self.think_time = tuple(config.get("think_time", (0.1, 0.5)))
+        self.seed = seed
+        self.stream = stream
+        self.block_size = block_size
+        self.backend = schedule_backend()
+        self._counter = itertools.count()
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def next(self):
+        """
+        领取下一个请求，itertools.count 的 next 在 GIL 下是原子操作，多线程领取不会重复或跳号
+        """
+        return self.entry(next(self._counter))
+
+    def entry(self, index):
+        """
+        第 index 个请求: {"index", "file_path", "params", "max_tokens", "abort_after", "think_time"}，
+        abort_after 为 None 表示不主动中断
+        """
+        block_index, offset = divmod(index, self.block_size)
+        block = self.block(block_index)
+        return {
+            "index": index,
+            "file_path": self.files[block["file"][offset]],
+            "params": {name: block[name][offset] for name, _ in SAMPLED_PARAMS},
+            "max_tokens": block["max_tokens"][offset] if self.output_lengths else self.max_tokens,
+            "abort_after": self.abort_after if block["abort"][offset] else None,
+            "think_time": block["think_time"][offset]
+        }
+
+    def block(self, block_index):
+        with self._lock:
+            block = self._blocks.get(block_index)
+            if block is None:
+                block = self._blocks[block_index] = self.generate(block_index)
+                if len(self._blocks) > CACHED_BLOCKS:
+                    self._blocks.popitem(last=False)
+            return block
+
+    def generate(self, block_index):
+        """
+        生成第 block_index 块，按列返回 Python 列表（NumPy 数组转为 Python 数值，JSON 编码结果与后端无关）
+        """
+        size = self.block_size
+        columns = {}
+
+        if np is not None:
+            rng = np.random.default_rng([self.seed, self.stream, block_index])
+            columns["file"] = rng.integers(0, len(self.files), size).tolist()
+            for name, kind in SAMPLED_PARAMS:
+                low, high = self.param_ranges[f"{name}_range"]
+                if kind == "uniform":
+                    columns[name] = rng.uniform(low, high, size).tolist()
+                else:
+                    columns[name] = rng.integers(low, high, size, endpoint=True).tolist()
+            columns["abort"] = (rng.random(size) < self.abort_ratio).tolist()
+            columns["think_time"] = rng.uniform(*self.think_time, size).tolist()
+            if self.output_lengths:
+                columns["max_tokens"] = self.output_lengths.generate(rng, size)
+            return columns
+
+        rng = random.Random(f"{self.seed}-{self.stream}-{block_index}")
+        columns["file"] = [rng.randrange(len(self.files)) for _ in range(size)]
+        for name, kind in SAMPLED_PARAMS:
+            low, high = self.param_ranges[f"{name}_range"]
+            draw = rng.uniform if kind == "uniform" else rng.randint
+            columns[name] = [draw(low, high) for _ in range(size)]
+        columns["abort"] = [rng.random() < self.abort_ratio for _ in range(size)]
+        columns["think_time"] = [rng.uniform(*self.think_time) for _ in range(size)]
+        if self.output_lengths:
+            columns["max_tokens"] = [self.output_lengths.sample(rng) for _ in range(size)]
+        return columns
+
+    def arrival_rng(self):
+        """
+        开环到达时刻使用的随机数生成器，与请求内容的序列相互独立
+        """
+        return random.Random(f"{self.seed}-{self.stream}-arrival")
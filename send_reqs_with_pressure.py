@@ -1,25 +1,62 @@
 import os
 import json
-import requests
 import glob
 import re
 import concurrent.futures
 import time
 import random
 import threading
+import multiprocessing
 from datetime import datetime
 #from config_with_pressure import CONFIG # ide run
 from zhejing.config_with_pressure import CONFIG
+from zhejing.http_session import http_post, close_sessions, cancel_requests, requests_cancelled, reset_cancellation
+from zhejing.sse_parser import SSEStreamParser
+from zhejing.dataset_cache import DatasetCache
+from zhejing.open_loop import validate_arrival
+from zhejing.results_writer import ResultsWriter
+from zhejing.metrics import new_stream_timing, finalize_stream_timing, summarize_latency, format_latency_summary, \
+    format_token_summary, format_goodput_summary, check_slo, slo_enabled
+from zhejing.tokenizer import apply_tokenizer_usage
+from zhejing.stats import MetricsRegistry, MetricsReporter, WindowSnapshots, WorkerStats
+from zhejing.schedule import RequestSchedule
+from zhejing.output_length import DISTRIBUTIONS, OutputLengths, output_length_enabled, length_check_enabled, \
+    load_histogram, output_length_error, format_length_summary
+from zhejing.param_breakdown import PARAMETERS, ParamColumns, param_breakdown, format_param_breakdown
+from zhejing.phases import ConcurrencyRamp, ramp_delay, window_enabled, measurement_window, in_window, \
+    window_summary, format_window_summary
+from zhejing.prometheus import start_metrics_server
+
+# 客户端主动中断的流式请求的 finish_reason
+CLIENT_ABORT = "client_abort"
+# 被 cancel_requests 取消的请求的错误信息
+CANCELLED_ERROR = "请求已取消"
 
 # 全局变量，用于后台压力测试控制
 background_active = False
-background_stats = {
-    "start_time": 0,
-    "total_requests": 0,
-    "successful_requests": 0,
-    "failed_requests": 0,
-    "last_report_time": 0
-}
+# 后台压力测试统计，按线程分别计数，每次 background_pressure_test 启动时重新创建
+background_metrics = MetricsRegistry()
+# 测试请求统计，用于 Prometheus 指标服务
+test_metrics = MetricsRegistry()
+# 后台请求计划，每次 background_pressure_test 启动时按 schedule 配置重新创建
+background_schedule = None
+# 后台请求的采样参数和延迟（列式存储），每次 background_pressure_test 启动时重新创建
+background_params = MetricsRegistry(ParamColumns)
+# 后台压力测试的稳态窗口快照，配置了预热/冷却时由 background_pressure_test 创建
+background_window = None
+
+# 测试请求结果中用于按稳态窗口重新统计的字段，response 只保留 usage
+WINDOW_FIELDS = ("filename", "success", "start_time", "processing_time", "timing", "aborted", "slo_violations",
+                 "length_error")
+
+# 数据集预解析缓存，由 process_dataset_files 在启动时创建
+dataset_cache = None
+
+# 请求轨迹记录，配置了 trace.record 时由 process_dataset_files 创建
+trace_recorder = None
+
+# 测试请求的输出长度分布，配置了 output_length 时由 process_dataset_files 创建（后台请求由请求计划生成）
+output_lengths = None
 
 
 def parse_message_line(line):
@@ -58,71 +95,250 @@ def read_txt_file(file_path):
     return messages
 
 
-def handle_stream_response(response, filename):
+def build_stream_response_data(full_content, reasoning_content, finish_reason=None, usage=None):
+    """
+    根据流式响应拼接出的内容构建完整的响应结构，模拟非流式响应
+
+    finish_reason 和 usage 取自服务端的流式响应（见 SSEStreamParser），服务端未返回 finish_reason 时为 None
+    """
+    return {
+        "id": f"chatcmpl-{int(time.time())}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": CONFIG["model_name"],
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": full_content,
+                    "reasoning_content": reasoning_content if reasoning_content else None
+                },
+                "finish_reason": finish_reason
+            }
+        ],
+        "usage": usage
+    }
+
+
+def handle_stream_response(response, filename, timing=None, abort_after=None):
     """
     处理流式响应
+
+    Args:
+        response: 流式响应
+        filename: 文件名
+        timing: 计时记录（见 metrics.new_stream_timing），不为 None 时记录首字节、首 token 及每个 chunk 的到达时间
+        abort_after: 收到该数量的 token 后主动关闭连接，finish_reason 记为 client_abort；为 None 时读取完整响应
     """
-    full_content = ""
-    reasoning_content = ""
+    parser = SSEStreamParser(timing)
 
     try:
-        for line in response.iter_lines():
-            if line:
-                line = line.decode('utf-8')
-                if line.startswith('data: '):
-                    data = line[6:]  # 去掉 'data: ' 前缀
-
-                    if data == '[DONE]':
-                        break
-
-                    try:
-                        chunk = json.loads(data)
-                        if 'choices' in chunk and len(chunk['choices']) > 0:
-                            delta = chunk['choices'][0].get('delta', {})
-
-                            # 提取普通内容
-                            if 'content' in delta:
-                                content = delta['content']
-                                full_content += content
-
-                            # 提取推理内容
-                            if 'reasoning_content' in delta:
-                                reasoning = delta['reasoning_content']
-                                reasoning_content += reasoning
-
-                    except json.JSONDecodeError:
-                        continue
-
-        # 构建完整的响应结构，模拟非流式响应
-        response_data = {
-            "id": f"chatcmpl-{int(time.time())}",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": CONFIG["model_name"],
-            "choices": [
-                {
-                    "index": 0,
-                    "message": {
-                        "role": "assistant",
-                        "content": full_content,
-                        "reasoning_content": reasoning_content if reasoning_content else None
-                    },
-                    "finish_reason": "stop"
-                }
-            ],
-            "usage": {
-                "prompt_tokens": 0,  # 这些值在流式响应中通常不可用
-                "completion_tokens": 0,
-                "total_tokens": 0
+        # 按网络实际到达的数据块增量解析，每个数据块记录一次到达时间
+        for data in response.iter_content(chunk_size=None):
+            if parser.feed(data, time.time()):
+                break
+            if abort_after and parser.token_chunks >= abort_after:
+                # 未读完的响应关闭时会断开连接，服务端据此停止生成
+                response.close()
+                return build_stream_response_data(parser.content, parser.reasoning_content, CLIENT_ABORT,
+                                                  parser.usage)
+        parser.close(time.time())
+
+        return build_stream_response_data(parser.content, parser.reasoning_content, parser.finish_reason, parser.usage)
+    except Exception as e:
+        raise Exception(f"处理流式响应时出错: {str(e)}")
+
+
+def load_messages(file_path):
+    """
+    获取文件的消息列表，启用数据集缓存时从缓存读取
+    """
+    if dataset_cache is not None:
+        return dataset_cache.get_messages(file_path)
+    return read_txt_file(file_path)
+
+
+def encode_payload(file_path, payload):
+    """
+    把请求体编码为 JSON 字节串，启用数据集缓存时只需编码采样参数等字段
+    """
+    if dataset_cache is not None:
+        return dataset_cache.encode_payload(file_path, payload)
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+
+def is_stream_request(config, is_background=False):
+    """
+    判断请求是否使用流式响应，后台压力测试由 background_stream 控制（默认不使用流式）
+    """
+    if is_background:
+        return config.get("background_stream", False)
+    return config["is_stream"]
+
+
+def stream_options(config, is_background=False):
+    """
+    流式请求要求服务端在最后一个 chunk 返回 usage，用于统计 token 数
+    """
+    if is_stream_request(config, is_background) and config.get("stream_usage", True):
+        return {"stream_options": {"include_usage": True}}
+    return {}
+
+
+def request_output_length(config, entry=None):
+    """
+    单个请求的 (max_tokens, ignore_eos): 有后台请求计划时 max_tokens 取自计划，配置了输出长度分布时按分布抽取，
+    否则为 max_tokens 配置；配置了输出长度分布时 ignore_eos 取 output_length.ignore_eos
+    """
+    if entry is not None:
+        max_tokens = entry["max_tokens"]
+    elif output_lengths is not None:
+        max_tokens = output_lengths.sample(random)
+    else:
+        max_tokens = config["max_tokens"]
+
+    if output_length_enabled(config):
+        return max_tokens, config["output_length"].get("ignore_eos", True)
+    return max_tokens, config["ignore_eos"]
+
+
+def build_payload(messages, config, is_background=False, entry=None):
+    """
+    构建请求体
+
+    Args:
+        messages: 消息列表
+        config: 配置字典
+        is_background: 是否为后台压力测试请求，是则使用随机的后处理参数
+        entry: 后台请求计划中的请求（见 RequestSchedule.entry），提供采样参数和 max_tokens；为 None 时临时随机生成
+    """
+    if is_background:
+        if entry is None:
+            param_ranges = config["background_param_ranges"]
+            params = {
+                "presence_penalty": random.uniform(*param_ranges["presence_penalty_range"]),
+                "frequency_penalty": random.uniform(*param_ranges["frequency_penalty_range"]),
+                "repetition_penalty": random.uniform(*param_ranges["repetition_penalty_range"]),
+                "temperature": random.uniform(*param_ranges["temperature_range"]),
+                "top_p": random.uniform(*param_ranges["top_p_range"]),
+                "top_k": random.randint(*param_ranges["top_k_range"]),
+                "seed": random.randint(*param_ranges["seed_range"])
             }
+        else:
+            params = entry["params"]
+        max_tokens, ignore_eos = request_output_length(config, entry)
+
+        return {
+            "model": config["model_name"],
+            "messages": messages,
+            "stream": is_stream_request(config, is_background),
+            **params,
+            "ignore_eos": ignore_eos,
+            "chat_template_kwargs": {"enable_thinking": config["think"]},
+            "max_tokens": max_tokens,
+            **stream_options(config, is_background)
         }
 
-        return response_data
-    except Exception as e:
-        raise Exception(f"处理流式响应时出错: {str(e)}")
+    max_tokens, ignore_eos = request_output_length(config)
+    return {
+        "model": config["model_name"],
+        "messages": messages,
+        "stream": is_stream_request(config, is_background),
+        "presence_penalty": config["presence_penalty"],
+        "frequency_penalty": config["frequency_penalty"],
+        "repetition_penalty": config["repetition_penalty"],
+        "temperature": config["temperature"],
+        "top_p": config["top_p"],
+        "top_k": config["top_k"],
+        "seed": config["seed"],
+        "ignore_eos": ignore_eos,
+        "chat_template_kwargs": {"enable_thinking": config["think"]},
+        "max_tokens": max_tokens,
+        **stream_options(config, is_background)
+    }
 
 
-def send_request(file_info, config, is_background=False):
+def abort_after_tokens(config, is_background, stream, entry=None):
+    """
+    客户端主动中断: 按 abort.ratio 的比例随机选择流式后台请求，返回收到多少个 token 后中断，不中断时返回 None；
+    有后台请求计划时由计划决定
+    """
+    if entry is not None:
+        return entry["abort_after"] if is_background and stream else None
+    abort = config.get("abort") or {}
+    if is_background and stream and abort.get("ratio", 0) > 0 and random.random() < abort["ratio"]:
+        return abort.get("after_tokens", 1)
+    return None
+
+
+def request_error(e):
+    """
+    请求异常的错误信息，cancel_requests 取消的请求统一记为 CANCELLED_ERROR
+    """
+    return CANCELLED_ERROR if requests_cancelled() else str(e)
+
+
+def build_result(filename, config, is_background, processing_time, messages=None, response_data=None, error=None,
+                 timing=None, start_time=None, payload=None):
+    """
+    构建单个请求的结果字典，成功与失败的结果结构保持一致，timing 为流式请求的计时记录（见 new_stream_timing），
+    在确定 usage 之后计算延迟指标；
+    后台请求传入 payload 时记录随机生成的采样参数，用于按参数分桶统计
+    """
+    # 提取回复内容和推理内容
+    reply = ""
+    reasoning = ""
+
+    # 服务端没有返回 usage 时，配置了本地分词器则用分词器统计 token 数
+    if error is None and response_data and config.get("tokenizer"):
+        apply_tokenizer_usage(response_data, messages, config["tokenizer"])
+    # TPOT 按 usage 中的输出 token 数计算，所以在分词器替换 usage 之后再计算
+    if error is None and timing is not None:
+        timing = finalize_stream_timing(timing, response_data.get("usage"))
+
+    if response_data and "choices" in response_data and len(response_data["choices"]) > 0:
+        message_data = response_data["choices"][0].get("message", {})
+        reply = message_data.get("content", "")
+        reasoning = message_data.get("reasoning_content", "")
+
+    result = {
+        "filename": filename,
+        "success": error is None,
+        "messages": messages if error is None else [],
+        "response": response_data if error is None else None,
+        "reply": reply,
+        "reasoning_content": reasoning,
+        "start_time": start_time,
+        "processing_time": processing_time,
+        "timing": timing if error is None else None,
+        "is_stream": is_stream_request(config, is_background),
+        "model_name": config["model_name"],
+        "is_background": is_background,
+        "aborted": error is None and bool(response_data) and
+                   response_data["choices"][0].get("finish_reason") == CLIENT_ABORT,
+        "error": error
+    }
+    # 配置了 SLO 时记录违反的 SLO，用于 goodput 统计
+    result["slo_violations"] = check_slo(result, config.get("slo"))
+    # 开启输出长度校验时记录实际输出 token 数与 max_tokens 之差
+    result["length_error"] = output_length_error(result, payload, config)
+    if is_background and payload and config.get("param_buckets", 4) > 0:
+        result["sampling_params"] = {name: payload[name] for name in PARAMETERS}
+    return result
+
+
+def get_pool_size(config):
+    """
+    获取连接池大小，未配置时与测试并发+后台并发之和一致，开环模式下后台并发按在途请求上限计算
+    """
+    background_workers = config["background_concurrent_workers"]
+    if config.get("background_mode", "closed") == "open":
+        background_workers = config["arrival"].get("max_outstanding", 10000)
+    return config.get("pool_size") or config["test_concurrent_workers"] + background_workers
+
+
+def send_request(file_info, config, is_background=False, entry=None):
     """
     发送请求到聊天接口
 
@@ -130,213 +346,407 @@ def send_request(file_info, config, is_background=False):
         file_info: 文件信息元组 (file_path, filename)
         config: 配置字典
         is_background: 是否为后台压力测试请求
+        entry: 后台请求计划中的请求，见 build_payload
     """
     file_path, filename = file_info
     start_time = time.time()
+    record_request_start(is_background)
+    payload = None
 
     try:
         # 读取并解析文件内容
-        messages = read_txt_file(file_path)
+        messages = load_messages(file_path)
 
         url = f"http://{config['IP']}:{config['PORT']}/v1/chat/completions"
 
         # 如果是后台压力测试，随机生成参数
-        if is_background:
-            payload = {
-                "model": config["model_name"],
-                "messages": messages,
-                "stream": False,  # 后台压力测试默认不使用流式
-                "presence_penalty": random.uniform(*config["background_param_ranges"]["presence_penalty_range"]),
-                "frequency_penalty": random.uniform(*config["background_param_ranges"]["frequency_penalty_range"]),
-                "repetition_penalty": random.uniform(*config["background_param_ranges"]["repetition_penalty_range"]),
-                "temperature": random.uniform(*config["background_param_ranges"]["temperature_range"]),
-                "top_p": random.uniform(*config["background_param_ranges"]["top_p_range"]),
-                "top_k": random.randint(*config["background_param_ranges"]["top_k_range"]),
-                "seed": random.randint(*config["background_param_ranges"]["seed_range"]),
-                "ignore_eos": config["ignore_eos"],
-                "chat_template_kwargs": {"enable_thinking": config["think"]},
-                "max_tokens": config["max_tokens"]
-            }
-        else:
-            payload = {
-                "model": config["model_name"],
-                "messages": messages,
-                "stream": config["is_stream"],
-                "presence_penalty": config["presence_penalty"],
-                "frequency_penalty": config["frequency_penalty"],
-                "repetition_penalty": config["repetition_penalty"],
-                "temperature": config["temperature"],
-                "top_p": config["top_p"],
-                "top_k": config["top_k"],
-                "seed": config["seed"],
-                "ignore_eos": config["ignore_eos"],
-                "chat_template_kwargs": {"enable_thinking": config["think"]},
-                "max_tokens": config["max_tokens"]
-            }
+        payload = build_payload(messages, config, is_background, entry)
+        body = encode_payload(file_path, payload)
+        headers = {"Content-Type": "application/json"}
+
+        # 测试线程和后台线程共享同一个连接池，keep_alive 关闭时每个请求新建连接
+        keep_alive = config.get("keep_alive", True)
+        pool_size = get_pool_size(config)
 
         # 根据是否流式选择不同的请求方式
-        if config["is_stream"] and not is_background:  # 后台压力测试不使用流式
-            response = requests.post(url, json=payload, timeout=config["timeout"], stream=True)
+        timing = None
+        if payload["stream"]:
+            timing = new_stream_timing(start_time)
+            response = http_post(url, keep_alive, pool_size, data=body, headers=headers, timeout=config["timeout"],
+                                 stream=True)
             response.raise_for_status()
-            response_data = handle_stream_response(response, filename)
+            response_data = handle_stream_response(response, filename, timing,
+                                                   abort_after_tokens(config, is_background, True, entry))
         else:
-            response = requests.post(url, json=payload, timeout=config["timeout"])
+            response = http_post(url, keep_alive, pool_size, data=body, headers=headers, timeout=config["timeout"])
             response.raise_for_status()
             response_data = response.json()
 
-        end_time = time.time()
-        processing_time = end_time - start_time
+        processing_time = time.time() - start_time
+        result = build_result(filename, config, is_background, processing_time, messages, response_data, timing=timing,
+                              start_time=start_time, payload=payload)
 
-        # 提取回复内容和推理内容
-        reply = ""
-        reasoning = ""
+    except Exception as e:
+        processing_time = time.time() - start_time
+        result = build_result(filename, config, is_background, processing_time, error=request_error(e),
+                              start_time=start_time, payload=payload)
 
-        if "choices" in response_data and len(response_data["choices"]) > 0:
-            message_data = response_data["choices"][0].get("message", {})
-            reply = message_data.get("content", "")
-            reasoning = message_data.get("reasoning_content", "")
+    record_trace(start_time, payload, result)
+    return result
 
-        return {
-            "filename": filename,
-            "success": True,
-            "messages": messages,
-            "response": response_data,
-            "reply": reply,
-            "reasoning_content": reasoning,
-            "processing_time": processing_time,
-            "is_stream": config["is_stream"] and not is_background,
-            "model_name": config["model_name"],
-            "is_background": is_background,
-            "error": None
-        }
 
-    except Exception as e:
-        end_time = time.time()
-        processing_time = end_time - start_time
+def start_trace_recording(config, results_dir):
+    """
+    配置了 trace.record 时开始把本次运行发出的每个请求记录为轨迹文件
+    """
+    global trace_recorder
+    if not config.get("trace", {}).get("record"):
+        return
 
-        return {
-            "filename": filename,
-            "success": False,
-            "messages": [],
-            "response": None,
-            "reply": "",
-            "reasoning_content": "",
-            "processing_time": processing_time,
-            "is_stream": config["is_stream"] and not is_background,
-            "model_name": config["model_name"],
-            "is_background": is_background,
-            "error": str(e)
-        }
+    from zhejing.trace_replay import TraceRecorder
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    trace_recorder = TraceRecorder(os.path.join(results_dir, f"trace_{timestamp}.jsonl"))
+    print(f"记录请求轨迹到: {trace_recorder.file_path}")
 
 
-def background_pressure_test(config, dataset_files, duration=None):
-    """
-    后台压力测试函数
+def stop_trace_recording():
+    global trace_recorder
+    if trace_recorder is None:
+        return
 
-    Args:
-        config: 配置字典
-        dataset_files: 数据集文件列表
-        duration: 测试持续时间(秒)，如果为None则持续运行直到被停止
+    trace_recorder.close()
+    print(f"请求轨迹已保存到: {trace_recorder.file_path} (共 {trace_recorder.written} 个请求)")
+    trace_recorder = None
+
+
+def record_trace(start_time, payload, result):
+    """
+    记录一个已发出的请求，payload 为 None 表示请求体构建前就已失败，不记录
     """
-    global background_active, background_stats
+    recorder = trace_recorder
+    if recorder is not None and payload is not None:
+        recorder.record(start_time, payload, result)
 
-    print(f"开始后台压力测试，并发数: {config['background_concurrent_workers']}")
-    if duration:
-        print(f"持续时间: {duration}秒")
+
+def print_result(result, completed_files, total_files):
+    """
+    输出单个测试请求的结果
+    """
+    if result["success"]:
+        status = "✓ 成功"
+
+        # 显示回复和推理内容
+        reply = result["reply"] or ""
+        reply_preview = reply[:50] + "..." if len(reply) > 50 else reply
+        reasoning_preview = ""
+        if result["reasoning_content"]:
+            reasoning_preview = result["reasoning_content"][:50] + "..." if len(
+                result["reasoning_content"]) > 50 else result["reasoning_content"]
+            reply_preview = f"回复: {reply_preview}, 推理: {reasoning_preview}"
+        else:
+            reply_preview = f"回复: {reply_preview}"
     else:
-        print("持续运行直到测试任务完成")
-    print("后台压力测试使用随机参数，不保存结果...")
+        status = "✗ 失败"
+        reply_preview = result["error"]
 
-    background_stats["start_time"] = time.time()
-    background_stats["last_report_time"] = time.time()
+    stream_indicator = " [流式]" if result["is_stream"] else ""
+    print(f"[{completed_files}/{total_files}] {status}{stream_indicator} - {result['filename']}")
+    print(f"  模型: {result['model_name']}, 时间: {result['processing_time']:.2f}s, {reply_preview}")
 
-    def background_worker():
-        while background_active:
-            # 随机选择一个文件
-            file_path = random.choice(dataset_files)
-            filename = os.path.basename(file_path)
-            file_info = (file_path, filename)
 
-            try:
-                result = send_request(file_info, config, is_background=True)
-                background_stats["total_requests"] += 1
+def record_request_start(is_background):
+    """
+    统计一个已发出的请求，已发出数减去已完成数即在途请求数
+    """
+    (background_metrics if is_background else test_metrics).local().increment("started_requests")
 
-                if result["success"]:
-                    background_stats["successful_requests"] += 1
-                else:
-                    background_stats["failed_requests"] += 1
 
-                # 每10秒报告一次状态
-                current_time = time.time()
-                if current_time - background_stats["last_report_time"] >= 10:
-                    elapsed = current_time - background_stats["start_time"]
-                    qps = background_stats["total_requests"] / elapsed if elapsed > 0 else 0
-                    success_rate = background_stats["successful_requests"] / background_stats["total_requests"] * 100 if \
-                    background_stats["total_requests"] > 0 else 0
+def collect_metrics(config):
+    """
+    合并当前的测试和后台统计，供 Prometheus 指标服务使用
+    """
+    background_enabled = config["background_concurrent_workers"] > 0 or config.get("background_mode") == "open"
+    return {
+        "test": test_metrics.snapshot() if config["test_concurrent_workers"] > 0 else None,
+        "background": background_metrics.snapshot() if background_enabled else None
+    }
 
-                    print(
-                        f"[后台] 已发送: {background_stats['total_requests']}, 成功: {background_stats['successful_requests']}, "
-                        f"失败: {background_stats['failed_requests']}, QPS: {qps:.2f}, 成功率: {success_rate:.1f}%")
 
-                    background_stats["last_report_time"] = current_time
+def record_background_result(result):
+    """
+    统计一个后台请求的结果，只写入当前线程的统计对象，不加锁；停止时被取消的请求不计入统计
+    """
+    if result["error"] == CANCELLED_ERROR:
+        return
+    background_metrics.local().record_result(result)
+    background_params.local().record_result(result)
 
-                # 随机延迟，模拟真实请求模式
-                time.sleep(random.uniform(0.1, 0.5))
 
-            except Exception as e:
-                background_stats["total_requests"] += 1
-                background_stats["failed_requests"] += 1
-                print(f"[后台] 请求异常: {str(e)}")
+def record_background_exception(e):
+    """
+    统计一个未能生成结果的后台请求异常
+    """
+    stats = background_metrics.local()
+    stats.increment("total_requests")
+    stats.increment("failed_requests")
+    print(f"[后台] 请求异常: {str(e)}")
 
-    # 启动后台工作线程
-    with concurrent.futures.ThreadPoolExecutor(max_workers=config["background_concurrent_workers"]) as executor:
-        # 提交所有后台工作线程
-        futures = [executor.submit(background_worker) for _ in range(config["background_concurrent_workers"])]
 
-        # 如果有持续时间限制，等待指定时间
-        if duration:
-            try:
-                # 等待指定时间
-                time.sleep(duration)
-            except KeyboardInterrupt:
-                print("后台压力测试被中断")
+def format_background_progress(snapshot, previous, interval, elapsed):
+    """
+    生成后台压力测试状态行，previous 为上一次的统计快照（首次为 None），interval 为两次快照的间隔(秒)
+    """
+    counters = snapshot.counters
+    qps = counters["total_requests"] / elapsed if elapsed > 0 else 0
+    recent_requests = counters["total_requests"] - (previous.counters["total_requests"] if previous else 0)
+    recent_qps = recent_requests / interval if interval > 0 else 0
+    success_rate = counters["successful_requests"] / counters["total_requests"] * 100 if \
+    counters["total_requests"] > 0 else 0
 
-            # 停止后台压力测试
-            background_active = False
+    recent_tokens = counters["completion_tokens"] - (previous.counters["completion_tokens"] if previous else 0)
+    recent_tps = recent_tokens / interval if interval > 0 else 0
 
-            # 等待所有线程结束
-            concurrent.futures.wait(futures, timeout=10)
-        else:
-            # 如果没有持续时间限制，等待所有线程完成
-            # 这种情况实际上不会发生，因为后台线程是无限循环的
-            # 我们会在外部通过设置background_active=False来停止
-            try:
-                # 等待所有线程完成（实际上不会完成，除非被停止）
-                for future in futures:
-                    future.result()
-            except:
-                pass
+    e2e = snapshot.histograms["e2e"].percentiles((50, 99))
+    latency = f", 延迟p50/p99: {e2e[50]:.2f}s/{e2e[99]:.2f}s" if e2e[50] is not None else ""
+    attainment = f", SLO达成率: {counters['slo_attained_requests'] / counters['slo_requests'] * 100:.1f}%" if \
+    counters["slo_requests"] > 0 else ""
+    aborted = f", 主动中断: {counters['aborted_requests']}" if counters["aborted_requests"] > 0 else ""
 
-    # 输出最终统计
-    elapsed = time.time() - background_stats["start_time"]
-    qps = background_stats["total_requests"] / elapsed if elapsed > 0 else 0
-    success_rate = background_stats["successful_requests"] / background_stats["total_requests"] * 100 if \
-    background_stats["total_requests"] > 0 else 0
+    return (f"已发送: {counters['total_requests']}, 成功: {counters['successful_requests']}, "
+            f"失败: {counters['failed_requests']}, QPS: {qps:.2f}, 近{interval:.0f}秒QPS: {recent_qps:.2f}, "
+            f"近{interval:.0f}秒输出tok/s: {recent_tps:.1f}, 成功率: {success_rate:.1f}%{attainment}{aborted}{latency}")
+
+
+def report_background_progress(snapshot, previous, interval):
+    """
+    报告后台压力测试状态，由 MetricsReporter 按固定间隔调用
+    """
+    elapsed = time.time() - background_metrics.start_time
+    print(f"[后台] {format_background_progress(snapshot, previous, interval, elapsed)}")
+
+
+def print_background_summary(snapshot, elapsed, open_loop=False, slo=None, window_stats=None, length_check=False):
+    """
+    输出后台压力测试的最终统计，配置了 SLO 时包括 goodput，length_check 为 True 时包括输出长度校验；
+    window_stats 不为 None 时 snapshot 和 elapsed 为稳态窗口内的统计
+    """
+    counters = snapshot.counters
+    qps = counters["total_requests"] / elapsed if elapsed > 0 else 0
+    success_rate = counters["successful_requests"] / counters["total_requests"] * 100 if \
+    counters["total_requests"] > 0 else 0
 
     print(f"\n后台压力测试完成!")
-    print(f"总请求数: {background_stats['total_requests']}")
-    print(f"成功请求: {background_stats['successful_requests']}")
-    print(f"失败请求: {background_stats['failed_requests']}")
+    print(f"总请求数: {counters['total_requests']}")
+    print(f"成功请求: {counters['successful_requests']}")
+    print(f"失败请求: {counters['failed_requests']}")
+    if counters["aborted_requests"]:
+        print(f"主动中断请求: {counters['aborted_requests']}（计入成功，只统计 TTFT）")
     print(f"平均QPS: {qps:.2f}")
     print(f"成功率: {success_rate:.1f}%")
+    if window_stats:
+        for line in format_window_summary(window_stats):
+            print(line)
+    latency_names = ("e2e", "ttft", "tpot", "itl", "schedule_lag") if open_loop else ("e2e", "ttft", "tpot", "itl")
+    for line in format_latency_summary({name: snapshot.histograms[name].summary() for name in latency_names}):
+        print(line)
+    for line in format_token_summary(snapshot.token_summary(elapsed)):
+        print(line)
+    if slo_enabled(slo):
+        for line in format_goodput_summary(snapshot.goodput_summary(elapsed, slo)):
+            print(line)
+    if length_check:
+        for line in format_length_summary(snapshot.length_summary()):
+            print(line)
+    if open_loop:
+        print(f"受在途上限限制的请求数: {counters['capped_requests']}")
     print(f"总时长: {elapsed:.2f}秒")
 
 
+def use_async_engine(config):
+    """
+    判断后台压力测试是否使用 asyncio 引擎，未安装 aiohttp 时回退到线程引擎
+    """
+    if config.get("engine", "thread") != "asyncio":
+        return False
+
+    from zhejing.async_engine import aiohttp
+    if aiohttp is None:
+        print("警告: 未安装 aiohttp，asyncio 引擎不可用，已回退到线程引擎 (pip install aiohttp)")
+        return False
+    return True
+
+
+def wait_ramp_up(delay):
+    """
+    并发爬坡: 等待 delay 秒后再开始发送请求，期间后台压力测试被停止时立即返回
+    """
+    deadline = time.time() + delay
+    while background_active:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(min(remaining, 0.5))
+
+
+def drain_requests(futures, drain_timeout):
+    """
+    排空阶段: 停止发送新请求后等待在途请求在 drain_timeout 秒内完成，超时后取消剩余的请求
+    """
+    done, pending = concurrent.futures.wait(futures, timeout=drain_timeout)
+    if pending:
+        print(f"排空超时({drain_timeout}秒)，取消 {len(pending)} 个仍在进行的请求")
+        cancel_requests()
+        concurrent.futures.wait(pending)
+
+
+def background_pressure_test(config, dataset_files, duration=None, verbose=True):
+    """
+    后台压力测试函数
+
+    Args:
+        config: 配置字典
+        dataset_files: 数据集文件列表
+        duration: 测试持续时间(秒)，如果为None则持续运行直到被停止
+        verbose: 是否输出运行状态和最终统计，多进程模式的子进程由父进程统一输出
+    """
+    global background_active, background_metrics, background_params, background_window, background_schedule
+
+    async_engine = use_async_engine(config)
+    open_loop = config.get("background_mode", "closed") == "open"
+    if open_loop and not async_engine:
+        print("警告: 开环模式需要 asyncio 引擎，已使用闭环模式")
+        open_loop = False
+
+    background_metrics = MetricsRegistry()
+    background_params = MetricsRegistry(ParamColumns)
+    reporter = None
+    reset_cancellation()
+
+    # 按种子预先生成的请求序列，工作者按序号领取
+    schedule = config.get("schedule") or {}
+    background_schedule = RequestSchedule(config, dataset_files, schedule.get("seed") or 0, schedule.get("stream", 0),
+                                          schedule.get("block_size", 4096))
+
+    # 配置了预热/冷却时记录窗口边界的统计快照，最终统计只包括稳态窗口
+    background_window = None
+    if window_enabled(config):
+        background_window = WindowSnapshots(background_metrics, config.get("warmup_seconds", 0),
+                                            config.get("cooldown_seconds", 0), lambda: background_active)
+        background_window.start()
+
+    if verbose:
+        if open_loop:
+            arrival = config["arrival"]
+            print(f"开始后台压力测试（开环），到达过程: {arrival['process']}, QPS: {arrival['qps']}, "
+                  f"在途请求上限: {arrival.get('max_outstanding', 10000)}")
+        else:
+            print(f"开始后台压力测试，并发数: {config['background_concurrent_workers']}")
+        print(f"压力引擎: {'asyncio' if async_engine else 'thread'}")
+        if duration:
+            print(f"持续时间: {duration}秒")
+        else:
+            print("持续运行直到测试任务完成")
+        print(f"后台请求计划: 种子 {background_schedule.seed}, 序列 {background_schedule.stream}, "
+              f"生成后端 {background_schedule.backend}")
+        print("后台压力测试使用随机参数，不保存结果...")
+
+        reporter = MetricsReporter(background_metrics, report_background_progress, config.get("report_interval", 10))
+        reporter.start()
+
+    def background_worker(index):
+        wait_ramp_up(ramp_delay(index, config["background_concurrent_workers"], config.get("ramp_up_seconds", 0)))
+        while background_active:
+            # 按序号领取计划中的下一个请求（数据集文件、采样参数和思考时间）
+            entry = background_schedule.next()
+            file_path = entry["file_path"]
+            filename = os.path.basename(file_path)
+            file_info = (file_path, filename)
+
+            try:
+                result = send_request(file_info, config, is_background=True, entry=entry)
+                record_background_result(result)
+
+                # 随机延迟，模拟真实请求模式
+                think_time = entry["think_time"]
+                if think_time > 0:
+                    time.sleep(think_time)
+
+            except Exception as e:
+                record_background_exception(e)
+
+    if async_engine:
+        # 所有后台并发在同一个事件循环中运行
+        from zhejing.async_engine import run_async_background
+        try:
+            run_async_background(config, duration)
+        except KeyboardInterrupt:
+            print("后台压力测试被中断")
+        background_active = False
+    else:
+        # 启动后台工作线程
+        with concurrent.futures.ThreadPoolExecutor(max_workers=config["background_concurrent_workers"]) as executor:
+            # 提交所有后台工作线程
+            futures = [executor.submit(background_worker, index)
+                       for index in range(config["background_concurrent_workers"])]
+
+            # 如果有持续时间限制，等待指定时间
+            if duration:
+                try:
+                    # 等待指定时间
+                    time.sleep(duration)
+                except KeyboardInterrupt:
+                    print("后台压力测试被中断")
+
+                # 停止后台压力测试
+                background_active = False
+            else:
+                # 没有持续时间限制时，由外部设置 background_active=False 来停止
+                while background_active:
+                    time.sleep(0.5)
+
+            drain_requests(futures, config.get("drain_timeout", 10))
+
+    if reporter:
+        reporter.stop()
+    if background_window:
+        background_window.join()
+
+    # 输出最终统计
+    if verbose:
+        snapshot = background_metrics.snapshot()
+        elapsed = time.time() - background_metrics.start_time
+        windowed = background_window.window_stats() if background_window else None
+        window = None
+        window_stats = None
+        if windowed:
+            total_requests = snapshot.counters["total_requests"]
+            snapshot, window = windowed
+            elapsed = window["steady_end"] - window["steady_start"]
+            window_stats = window_summary(window, total_requests, snapshot.counters["total_requests"])
+        elif background_window:
+            print("警告: 后台压力测试时长不足预热和冷却时间之和，稳态窗口为空，统计全部请求")
+        print_background_summary(snapshot, elapsed, open_loop, config.get("slo"), window_stats,
+                                 length_check_enabled(config))
+        if config.get("param_buckets", 4) > 0:
+            rows = param_breakdown(background_params.snapshot(), config["background_param_ranges"],
+                                   config["param_buckets"], elapsed, window)
+            for line in format_param_breakdown(rows):
+                print(line)
+
+
 def process_dataset_files(config):
     """
     处理datasets文件夹下的所有txt文件（并发版本）
     """
-    global background_active
+    global background_active, dataset_cache, output_lengths
+
+    # 上一次运行被中断时取消过请求，重新允许建立连接
+    reset_cancellation()
+
+    output_lengths = OutputLengths(config["output_length"]) if output_length_enabled(config) else None
+    if output_lengths:
+        print(f"输出长度: {output_lengths.describe()}, ignore_eos: "
+              f"{'开启' if config['output_length'].get('ignore_eos', True) else '关闭'}")
 
     current_dir = os.path.dirname(os.path.abspath(__file__))
     dataset_dir = os.path.join(current_dir, "datasets")
@@ -348,6 +758,18 @@ def process_dataset_files(config):
     if not os.path.exists(results_dir):
         os.makedirs(results_dir)
 
+    # 轨迹回放模式: 按轨迹文件记录的时间重新发送请求，不使用数据集目录
+    if config.get("trace", {}).get("replay"):
+        from zhejing.trace_replay import run_replay
+        run_replay(config, results_dir)
+        return
+
+    # 共享前缀负载: 请求由生成器构建，不使用数据集目录
+    if config.get("prefix_workload", {}).get("enabled"):
+        from zhejing.prefix_workload import run_prefix_workload
+        run_prefix_workload(config, results_dir)
+        return
+
     # 查找所有txt文件
     txt_files = glob.glob(os.path.join(dataset_dir, "*.txt"))
 
@@ -357,11 +779,42 @@ def process_dataset_files(config):
 
     print(f"找到 {len(txt_files)} 个txt文件")
 
+    # 启动时一次性解析所有数据集文件，请求路径上不再读文件
+    if config.get("dataset_cache", True):
+        dataset_cache = DatasetCache(read_txt_file)
+        print(f"已预加载 {dataset_cache.load(txt_files)} 个数据集文件到缓存")
+    else:
+        dataset_cache = None
+
+    start_trace_recording(config, results_dir)
+
+    # 容量扫描模式: 逐级提高后台并发或 QPS，不运行普通测试
+    if config.get("sweep", {}).get("enabled"):
+        from zhejing.sweep import run_sweep
+        run_sweep(config, txt_files, results_dir)
+        close_sessions()
+        return
+
+    # 分布式模式: 协调者只下发任务和汇总统计，请求由各 agent 发送
+    if config.get("role", "standalone") == "coordinator":
+        from zhejing.distributed import run_coordinator
+        run_coordinator(config, txt_files, results_dir)
+        return
+
+    # 多进程模式: 子进程 fork 时继承已加载的数据集缓存
+    if config.get("processes", 1) > 1:
+        from zhejing.multiproc import run_multiprocess
+        run_multiprocess(config, txt_files, results_dir)
+        close_sessions()
+        return
+
     # 检查配置是否有效
     if config["test_concurrent_workers"] == 0 and config["background_concurrent_workers"] == 0:
         print("错误: 测试并发和后台并发不能同时为0")
         return
 
+    metrics_server = start_metrics_server(config, lambda: collect_metrics(config))
+
     # 如果测试并发为0，只进行后台压力测试
     if config["test_concurrent_workers"] == 0:
         print(f"使用 {config['background_concurrent_workers']} 个后台并发工作线程")
@@ -371,6 +824,9 @@ def process_dataset_files(config):
         # 启动后台压力测试
         background_active = True
         background_pressure_test(config, txt_files, duration=config["background_duration"])
+        close_sessions()
+        if metrics_server:
+            metrics_server.stop()
         return
 
     # 否则，进行测试并发和后台并发
@@ -391,13 +847,19 @@ def process_dataset_files(config):
     successful_requests = 0
     failed_requests = 0
 
-    # 收集所有结果
-    all_results = {
+    # 每个结果完成后立即由写入线程追加到 JSONL 文件，内存中只保留计算延迟统计所需的字段
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = os.path.join(results_dir, f"all_results_{timestamp}.jsonl")
+    results_writer = ResultsWriter(results_file, {
         "config": config,
         "timestamp": datetime.now().isoformat(),
-        "total_files": total_files,
-        "results": []
-    }
+        "total_files": total_files
+    })
+    latency_records = []
+    run_start = time.time()
+    interrupted = False
+    # 配置了爬坡时间时，测试请求的在途数从 1 逐步提高到测试并发数
+    ramp = ConcurrencyRamp(config["test_concurrent_workers"], config.get("ramp_up_seconds", 0), run_start)
 
     # 如果开启了后台压力测试，启动后台线程
     background_thread = None
@@ -413,91 +875,158 @@ def process_dataset_files(config):
     with concurrent.futures.ThreadPoolExecutor(max_workers=config["test_concurrent_workers"]) as executor:
         # 提交所有任务
         future_to_file = {
-            executor.submit(send_request, file_info, config, False): file_info
+            executor.submit(ramp.run, send_request, file_info, config, False): file_info
             for file_info in file_infos
         }
 
-        # 处理完成的任务
-        for future in concurrent.futures.as_completed(future_to_file):
-            file_info = future_to_file[future]
-            file_path, filename = file_info
-
-            try:
-                result = future.result()
-                all_results["results"].append(result)
-
-                completed_files += 1
-
-                if result["success"]:
-                    successful_requests += 1
-                    status = "✓ 成功"
-
-                    # 显示回复和推理内容
-                    reply_preview = result["reply"][:50] + "..." if len(result["reply"]) > 50 else result["reply"]
-                    reasoning_preview = ""
-                    if result["reasoning_content"]:
-                        reasoning_preview = result["reasoning_content"][:50] + "..." if len(
-                            result["reasoning_content"]) > 50 else result["reasoning_content"]
-                        reply_preview = f"回复: {reply_preview}, 推理: {reasoning_preview}"
+        try:
+            # 处理完成的任务
+            for future in concurrent.futures.as_completed(future_to_file):
+                file_info = future_to_file[future]
+                file_path, filename = file_info
+
+                try:
+                    result = future.result()
+                    test_metrics.local().record_result(result)
+                    results_writer.write(result)
+                    latency_records.append({
+                        **{key: result.get(key) for key in WINDOW_FIELDS},
+                        "response": {"usage": (result["response"] or {}).get("usage")}
+                    })
+
+                    completed_files += 1
+
+                    if result["success"]:
+                        successful_requests += 1
                     else:
-                        reply_preview = f"回复: {reply_preview}"
-                else:
+                        failed_requests += 1
+
+                    print_result(result, completed_files, total_files)
+
+                except Exception as e:
+                    completed_files += 1
                     failed_requests += 1
-                    status = "✗ 失败"
-                    reply_preview = result["error"]
 
-                stream_indicator = " [流式]" if result["is_stream"] else ""
-                print(f"[{completed_files}/{total_files}] {status}{stream_indicator} - {filename}")
-                print(f"  模型: {result['model_name']}, 时间: {result['processing_time']:.2f}s, {reply_preview}")
+                    # 添加错误结果到总结果中
+                    error_result = {
+                        "filename": filename,
+                        "success": False,
+                        "messages": [],
+                        "response": None,
+                        "reply": "",
+                        "reasoning_content": "",
+                        "processing_time": 0,
+                        "timing": None,
+                        "is_stream": config["is_stream"],
+                        "model_name": config["model_name"],
+                        "is_background": False,
+                        "aborted": False,
+                        "error": str(e)
+                    }
+                    results_writer.write(error_result)
+                    test_metrics.local().record_result(error_result)
+
+                    print(f"[{completed_files}/{total_files}] ✗ 异常 - {filename}")
+                    print(f"  错误: {str(e)}")
+
+        except KeyboardInterrupt:
+            # Ctrl-C: 不再发送新请求，关闭在途请求的连接，已完成的结果照常汇总
+            interrupted = True
+            print("\n测试被中断，取消剩余请求...")
+            background_active = False
+            for future in future_to_file:
+                future.cancel()
+            cancel_requests()
 
-            except Exception as e:
-                completed_files += 1
-                failed_requests += 1
-
-                # 添加错误结果到总结果中
-                error_result = {
-                    "filename": filename,
-                    "success": False,
-                    "messages": [],
-                    "response": None,
-                    "reply": "",
-                    "reasoning_content": "",
-                    "processing_time": 0,
-                    "is_stream": config["is_stream"],
-                    "model_name": config["model_name"],
-                    "is_background": False,
-                    "error": str(e)
-                }
-                all_results["results"].append(error_result)
-
-                print(f"[{completed_files}/{total_files}] ✗ 异常 - {filename}")
-                print(f"  错误: {str(e)}")
-
-    # 停止后台压力测试
+    # 测试请求全部完成的时刻，之后后台压力的排空时间不计入运行时长
+    run_end = time.time()
+
+    # 停止后台压力测试，后台线程内部完成排空后退出
     if background_thread:
         background_active = False
-        background_thread.join(timeout=10)
+        background_thread.join()
         print("\n后台压力测试已停止")
 
-    # 更新统计信息
-    all_results["successful_requests"] = successful_requests
-    all_results["failed_requests"] = failed_requests
-    all_results["success_rate"] = successful_requests / total_files * 100 if total_files > 0 else 0
-
-    # 保存所有结果到一个JSON文件
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    results_file = os.path.join(results_dir, f"all_results_{timestamp}.json")
-
-    with open(results_file, 'w', encoding='utf-8') as f:
-        json.dump(all_results, f, ensure_ascii=False, indent=2)
+    close_sessions()
+    if metrics_server:
+        metrics_server.stop()
+
+    test_snapshot = test_metrics.snapshot()
+    background_snapshot = background_metrics.snapshot() if background_thread else None
+
+    # 配置了预热/冷却时，测试请求和后台流量都只统计在稳态窗口内完成的请求
+    window = None
+    window_stats = None
+    if window_enabled(config):
+        window = measurement_window(run_start, run_end, config.get("warmup_seconds", 0),
+                                    config.get("cooldown_seconds", 0))
+        if window is None:
+            print("警告: 预热和冷却时间之和不小于运行时长，稳态窗口为空，统计全部请求")
+            window = measurement_window(run_start, run_end, 0, 0)
+        latency_records = [record for record in latency_records if in_window(record, window)]
+        test_snapshot = WorkerStats()
+        for record in latency_records:
+            test_snapshot.record_result(record)
+        window_stats = window_summary(window, completed_files, len(latency_records))
+        run_start, run_end = window["steady_start"], window["steady_end"]
+
+        windowed = background_window.window_stats() if background_thread and background_window else None
+        if windowed:
+            background_snapshot = windowed[0]
+
+    # token 吞吐按测试运行时长计算，合计包括同一时段内的后台流量
+    run_elapsed = run_end - run_start
+    token_stats = test_snapshot.token_summary(run_elapsed)
+    goodput_stats = test_snapshot.goodput_summary(run_elapsed, config["slo"]) if slo_enabled(config.get("slo")) else None
+    length_stats = test_snapshot.length_summary() if length_check_enabled(config) else None
+    combined_token_stats = None
+    if background_snapshot:
+        combined_token_stats = test_snapshot.merge(background_snapshot).token_summary(run_elapsed)
+    # 后台请求按采样参数分桶的统计，表格已由后台线程输出，这里只写入汇总
+    param_stats = None
+    if background_thread and config.get("param_buckets", 4) > 0:
+        param_stats = param_breakdown(background_params.snapshot(), config["background_param_ranges"],
+                                      config["param_buckets"], run_elapsed, window)
+
+    # 写入汇总信息，完整结果可用 results_writer.load_all_results 重建为原 all_results 结构
+    latency_stats = summarize_latency(latency_records)
+    results_writer.close({
+        "successful_requests": successful_requests,
+        "failed_requests": failed_requests,
+        "success_rate": successful_requests / total_files * 100 if total_files > 0 else 0,
+        "latency_stats": latency_stats,
+        "token_stats": token_stats,
+        "combined_token_stats": combined_token_stats,
+        "goodput_stats": goodput_stats,
+        "length_stats": length_stats,
+        "window_stats": window_stats,
+        "param_stats": param_stats,
+        "interrupted": interrupted
+    })
 
     # 输出统计信息
     print("\n" + "=" * 50)
-    print("处理完成!")
+    print("处理中断，以下为已完成请求的统计" if interrupted else "处理完成!")
     print(f"总文件数: {total_files}")
     print(f"成功请求: {successful_requests}")
     print(f"失败请求: {failed_requests}")
     print(f"成功率: {successful_requests / total_files * 100:.1f}%")
+    if window_stats:
+        for line in format_window_summary(window_stats):
+            print(line)
+    for line in format_latency_summary(latency_stats):
+        print(line)
+    for line in format_token_summary(token_stats):
+        print(line)
+    if combined_token_stats:
+        for line in format_token_summary(combined_token_stats, "合计(测试+后台) "):
+            print(line)
+    if goodput_stats:
+        for line in format_goodput_summary(goodput_stats):
+            print(line)
+    if length_stats:
+        for line in format_length_summary(length_stats):
+            print(line)
     print(f"模型名称: {config['model_name']}")
     print(f"流式模式: {'开启' if config['is_stream'] else '关闭'}")
     print(f"思考模式: {'开启' if config['think'] else '关闭'}")
@@ -516,7 +1045,8 @@ def validate_config(config):
         print("警告: 后台并发工作线程数不能小于0，已设置为0")
         config["background_concurrent_workers"] = 0
 
-    if config["test_concurrent_workers"] == 0 and config["background_concurrent_workers"] == 0:
+    if config["test_concurrent_workers"] == 0 and config["background_concurrent_workers"] == 0 and \
+            not config.get("sweep", {}).get("enabled"):
         print("错误: 测试并发和后台并发不能同时为0")
         return False
 
@@ -527,6 +1057,171 @@ def validate_config(config):
         print("警告: 超时时间不能小于1秒，已设置为60秒")
         config["timeout"] = 60
 
+    for key in ("ramp_up_seconds", "warmup_seconds", "cooldown_seconds"):
+        if config.get(key, 0) < 0:
+            print(f"警告: {key} 不能小于0，已设置为0")
+            config[key] = 0
+    if (window_enabled(config) or config.get("ramp_up_seconds", 0) > 0) and \
+            (config.get("processes", 1) > 1 or config.get("role", "standalone") != "standalone"):
+        print("警告: 多进程和分布式模式不支持预热/冷却窗口和并发爬坡，已忽略")
+
+    if config.get("param_buckets", 4) < 0:
+        print("警告: 采样参数分桶数不能小于0，已设置为0（不统计）")
+        config["param_buckets"] = 0
+
+    if config.get("drain_timeout", 10) < 0:
+        print("警告: 排空时间不能小于0，已设置为10秒")
+        config["drain_timeout"] = 10
+
+    if config.get("pool_size", 0) < 0:
+        print("警告: 连接池大小不能小于0，已设置为0（与并发数一致）")
+        config["pool_size"] = 0
+
+    if config.get("engine", "thread") not in ("asyncio", "thread"):
+        print(f"警告: 不支持的压力引擎 {config['engine']}，已设置为 'thread'")
+        config["engine"] = "thread"
+
+    if config.get("background_mode", "closed") not in ("closed", "open"):
+        print(f"警告: 不支持的后台模式 {config['background_mode']}，已设置为 'closed'")
+        config["background_mode"] = "closed"
+
+    if config.get("background_mode") == "open":
+        errors = validate_arrival(config.get("arrival", {}))
+        if errors:
+            for error in errors:
+                print(f"错误: 开环到达过程配置无效: {error}")
+            return False
+
+    if config.get("processes", 1) < 1:
+        print("警告: 进程数不能小于1，已设置为1")
+        config["processes"] = 1
+
+    if config.get("processes", 1) > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        print("警告: 当前平台不支持 fork，多进程模式不可用，已设置为单进程")
+        config["processes"] = 1
+
+    slo = config.get("slo")
+    if slo:
+        if any(slo.get(name, 0) < 0 for name in ("ttft", "tpot", "e2e")):
+            print("错误: SLO 不能为负数")
+            return False
+        if not 0 <= slo.get("attainment", 0) <= 1:
+            print("错误: 目标 SLO 达成率需在 0 到 1 之间")
+            return False
+
+    schedule = config.setdefault("schedule", {})
+    if schedule.get("seed") is None:
+        # 未指定种子时随机选择，输出到配置信息和结果文件中，便于之后复现
+        schedule["seed"] = random.randrange(2 ** 32)
+    if not isinstance(schedule["seed"], int) or schedule["seed"] < 0:
+        print("错误: 后台请求计划的种子必须为非负整数")
+        return False
+    if schedule.get("block_size", 4096) < 1:
+        print("警告: 请求计划块大小不能小于1，已设置为4096")
+        schedule["block_size"] = 4096
+
+    abort = config.get("abort", {})
+    if abort.get("ratio", 0):
+        if not 0 <= abort["ratio"] <= 1:
+            print("错误: 主动中断比例需在 0 到 1 之间")
+            return False
+        if abort.get("after_tokens", 1) < 1:
+            print("错误: 主动中断的 token 数必须大于0")
+            return False
+        if not config.get("background_stream", False):
+            print("警告: 主动中断只作用于流式后台请求，当前 background_stream 未开启")
+
+    output_length = config.get("output_length") or {}
+    distribution = output_length.get("distribution")
+    if distribution:
+        if distribution not in DISTRIBUTIONS:
+            print(f"错误: 不支持的输出长度分布 {distribution}，可选: {', '.join(DISTRIBUTIONS)}")
+            return False
+        # 直方图读入配置，多进程和分布式模式的工作者不需要访问文件
+        if distribution == "histogram" and not output_length.get("histogram"):
+            try:
+                output_length["histogram"] = load_histogram(output_length.get("histogram_file", ""))
+            except (OSError, ValueError) as e:
+                print(f"错误: 输出长度直方图读取失败: {e}")
+                return False
+        # 按 OutputLengths 实际使用的取值（含缺省值）校验，部分配置的 output_length 同样适用
+        lengths = OutputLengths(output_length)
+        if distribution == "fixed" and lengths.tokens < 1:
+            print("错误: 固定输出长度必须大于0")
+            return False
+        if distribution in ("uniform", "lognormal") and not 1 <= lengths.min <= lengths.max:
+            print(f"错误: 输出长度范围需满足 1 <= min <= max，当前为 [{lengths.min}, {lengths.max}]")
+            return False
+        if distribution == "lognormal" and (lengths.median <= 0 or lengths.sigma < 0):
+            print("错误: 对数正态分布的中位数必须大于0，sigma 不能为负数")
+            return False
+        if not output_length.get("ignore_eos", True):
+            print("警告: 输出长度分布未开启 ignore_eos，max_tokens 只是输出长度上限，不校验返回的输出 token 数")
+
+    trace = config.get("trace", {})
+    if trace.get("replay"):
+        if not os.path.isfile(trace["replay"]):
+            print(f"错误: 轨迹文件 {trace['replay']} 不存在")
+            return False
+        if trace.get("time_scale", 1.0) <= 0:
+            print("错误: 回放倍速必须大于0")
+            return False
+        if not use_async_engine(config):
+            print("错误: 轨迹回放需要 asyncio 引擎")
+            return False
+    if trace.get("record") and (config.get("processes", 1) > 1 or config.get("role", "standalone") != "standalone"):
+        print("警告: 多进程和分布式模式不支持记录请求轨迹，已关闭")
+        trace["record"] = False
+
+    prefix_workload = config.get("prefix_workload", {})
+    if prefix_workload.get("enabled"):
+        pool_sizes = prefix_workload.get("pool_sizes", [16])
+        if not pool_sizes or any(size < 0 for size in pool_sizes):
+            print("错误: 前缀池大小列表不能为空且不能为负数")
+            return False
+        if prefix_workload.get("prefix_length", 2048) < 1 or prefix_workload.get("suffix_length", 64) < 0:
+            print("错误: 前缀长度必须大于0，后缀长度不能为负数")
+            return False
+        if not 0 <= prefix_workload.get("reuse_ratio", 0.8) <= 1:
+            print("错误: 前缀复用比例需在 0 到 1 之间")
+            return False
+        if prefix_workload.get("concurrency", 16) < 1 or prefix_workload.get("duration", 60) <= 0:
+            print("错误: 共享前缀负载的并发数和运行时长必须大于0")
+            return False
+        if not use_async_engine(config):
+            print("错误: 共享前缀负载需要 asyncio 引擎")
+            return False
+
+    sweep = config.get("sweep", {})
+    if sweep.get("enabled"):
+        mode = sweep.get("mode", "concurrency")
+        if mode not in ("concurrency", "qps"):
+            print(f"错误: 不支持的容量扫描模式 {mode}，可选: concurrency, qps")
+            return False
+        start, factor, maximum = sweep.get("start", 1), sweep.get("factor", 2), sweep.get("max", 1024)
+        if start <= 0 or factor <= 1 or maximum < start:
+            print(f"错误: 容量扫描级别需满足 start > 0, factor > 1, max >= start，"
+                  f"当前为 start={start}, factor={factor}, max={maximum}")
+            return False
+        if sweep.get("warmup_seconds", 10) < 1 or sweep.get("hold_seconds", 30) < 1:
+            print("警告: 容量扫描预热和统计时长不能小于1秒，已设置为1秒")
+            sweep["warmup_seconds"] = max(1, sweep.get("warmup_seconds", 10))
+            sweep["hold_seconds"] = max(1, sweep.get("hold_seconds", 30))
+        if mode == "qps" and not use_async_engine(config):
+            print("错误: 开环 QPS 扫描需要 asyncio 引擎")
+            return False
+
+    if config.get("role", "standalone") not in ("standalone", "coordinator", "agent"):
+        print(f"警告: 不支持的运行角色 {config['role']}，已设置为 'standalone'")
+        config["role"] = "standalone"
+
+    if config.get("role") == "coordinator":
+        if config.get("agents", 1) < 1:
+            print("警告: agent 数不能小于1，已设置为1")
+            config["agents"] = 1
+        if config.get("processes", 1) > 1:
+            print("警告: 分布式模式下每个 agent 使用单进程，processes 配置不生效")
+
     if config["background_duration"] < 1:
         print("警告: 后台压力测试持续时间不能小于1秒，已设置为300秒")
         config["background_duration"] = 300
@@ -563,6 +1258,12 @@ def run_zhejing(config=None):
     if config:
         CONFIG.update(config)
 
+    # agent 的测试配置由协调者下发，本地只需要协调者地址
+    if CONFIG.get("role") == "agent":
+        from zhejing.distributed import run_agent
+        run_agent(CONFIG)
+        return
+
     print("开始自动并发请求...")
 
     # 验证配置
@@ -580,7 +1281,10 @@ def run_zhejing(config=None):
         print(f"  {param_name}: {param_range}")
 
     start_time = time.time()
-    process_dataset_files(CONFIG)
+    try:
+        process_dataset_files(CONFIG)
+    finally:
+        stop_trace_recording()
     end_time = time.time()
 
     total_time = end_time - start_time
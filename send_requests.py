@@ -1,12 +1,18 @@
 import os
-import json
-import requests
 import glob
 import re
 import concurrent.futures
 import time
 from datetime import datetime
 from config import CONFIG
+from http_session import http_post, close_sessions
+from sse_parser import SSEStreamParser
+from results_writer import ResultsWriter
+from metrics import new_stream_timing, finalize_stream_timing, summarize_latency, format_latency_summary, \
+    summarize_tokens, format_token_summary
+from tokenizer import apply_tokenizer_usage
+from phases import ConcurrencyRamp, window_enabled, measurement_window, in_window, window_summary, \
+    format_window_summary
 
 
 def parse_message_line(line):
@@ -45,40 +51,25 @@ def read_txt_file(file_path):
     return messages
 
 
-def handle_stream_response(response, filename):
+def handle_stream_response(response, filename, timing=None):
     """
     处理流式响应
+
+    Args:
+        response: 流式响应
+        filename: 文件名
+        timing: 计时记录（见 metrics.new_stream_timing），不为 None 时记录首字节、首 token 及每个 chunk 的到达时间
     """
-    full_content = ""
-    reasoning_content = ""
+    parser = SSEStreamParser(timing)
 
     try:
-        for line in response.iter_lines():
-            if line:
-                line = line.decode('utf-8')
-                if line.startswith('data: '):
-                    data = line[6:]  # 去掉 'data: ' 前缀
-
-                    if data == '[DONE]':
-                        break
-
-                    try:
-                        chunk = json.loads(data)
-                        if 'choices' in chunk and len(chunk['choices']) > 0:
-                            delta = chunk['choices'][0].get('delta', {})
-
-                            # 提取普通内容
-                            if 'content' in delta:
-                                content = delta['content']
-                                full_content += content
-
-                            # 提取推理内容
-                            if 'reasoning_content' in delta:
-                                reasoning = delta['reasoning_content']
-                                reasoning_content += reasoning
-
-                    except json.JSONDecodeError:
-                        continue
+        # 按网络实际到达的数据块增量解析，每个数据块记录一次到达时间
+        for data in response.iter_content(chunk_size=None):
+            if parser.feed(data, time.time()):
+                break
+        parser.close(time.time())
+        full_content = parser.content
+        reasoning_content = parser.reasoning_content
 
         # 构建完整的响应结构，模拟非流式响应
         response_data = {
@@ -94,14 +85,10 @@ def handle_stream_response(response, filename):
                         "content": full_content,
                         "reasoning_content": reasoning_content if reasoning_content else None
                     },
-                    "finish_reason": "stop"
+                    "finish_reason": parser.finish_reason
                 }
             ],
-            "usage": {
-                "prompt_tokens": 0,  # 这些值在流式响应中通常不可用
-                "completion_tokens": 0,
-                "total_tokens": 0
-            }
+            "usage": parser.usage
         }
 
         return response_data
@@ -137,20 +124,36 @@ def send_request(file_info, config):
             "chat_template_kwargs": {"enable_thinking": config["think"]},
             "max_tokens": config["max_tokens"]
         }
+        # 流式请求要求服务端在最后一个 chunk 返回 usage，用于统计 token 数
+        if config["is_stream"] and config.get("stream_usage", True):
+            payload["stream_options"] = {"include_usage": True}
+
+        # 所有工作线程共享同一个连接池，keep_alive 关闭时每个请求新建连接
+        keep_alive = config.get("keep_alive", True)
+        pool_size = config.get("pool_size") or config["concurrent_workers"]
 
         # 根据是否流式选择不同的请求方式
+        timing = None
         if config["is_stream"]:
-            response = requests.post(url, json=payload, timeout=config["timeout"], stream=True)
+            timing = new_stream_timing(start_time)
+            response = http_post(url, keep_alive, pool_size, json=payload, timeout=config["timeout"], stream=True)
             response.raise_for_status()
-            response_data = handle_stream_response(response, filename)
+            response_data = handle_stream_response(response, filename, timing)
         else:
-            response = requests.post(url, json=payload, timeout=config["timeout"])
+            response = http_post(url, keep_alive, pool_size, json=payload, timeout=config["timeout"])
             response.raise_for_status()
             response_data = response.json()
 
         end_time = time.time()
         processing_time = end_time - start_time
 
+        # 服务端没有返回 usage 时，配置了本地分词器则用分词器统计 token 数
+        if config.get("tokenizer"):
+            apply_tokenizer_usage(response_data, messages, config["tokenizer"])
+        # TPOT 按 usage 中的输出 token 数计算，所以在分词器替换 usage 之后再计算
+        if timing is not None:
+            timing = finalize_stream_timing(timing, response_data.get("usage"))
+
         # 提取回复内容和推理内容
         reply = ""
         reasoning = ""
@@ -167,7 +170,9 @@ def send_request(file_info, config):
             "response": response_data,
             "reply": reply,
             "reasoning_content": reasoning,
+            "start_time": start_time,
             "processing_time": processing_time,
+            "timing": timing,
             "is_stream": config["is_stream"],
             "model_name": config["model_name"],
             "error": None
@@ -184,7 +189,9 @@ def send_request(file_info, config):
             "response": None,
             "reply": "",
             "reasoning_content": "",
+            "start_time": start_time,
             "processing_time": processing_time,
+            "timing": None,
             "is_stream": config["is_stream"],
             "model_name": config["model_name"],
             "error": str(e)
@@ -214,6 +221,10 @@ def process_dataset_files(config):
     print(f"模型名称: {config['model_name']}")
     print(f"流式模式: {'开启' if config['is_stream'] else '关闭'}")
     print(f"思考模式: {'开启' if config['think'] else '关闭'}")
+    print(f"连接复用: {'开启' if config.get('keep_alive', True) else '关闭'}")
+    if window_enabled(config) or config.get("ramp_up_seconds", 0) > 0:
+        print(f"预热: {config.get('warmup_seconds', 0)}秒, 冷却: {config.get('cooldown_seconds', 0)}秒, "
+              f"并发爬坡: {config.get('ramp_up_seconds', 0)}秒")
     print("开始处理...\n")
 
     # 准备文件信息列表
@@ -225,19 +236,24 @@ def process_dataset_files(config):
     successful_requests = 0
     failed_requests = 0
 
-    # 收集所有结果
-    all_results = {
+    # 每个结果完成后立即由写入线程追加到 JSONL 文件，内存中只保留计算延迟统计所需的字段
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = os.path.join(results_dir, f"all_results_{timestamp}.jsonl")
+    results_writer = ResultsWriter(results_file, {
         "config": config,
         "timestamp": datetime.now().isoformat(),
-        "total_files": total_files,
-        "results": []
-    }
+        "total_files": total_files
+    })
+    latency_records = []
+    run_start = time.time()
+    # 配置了爬坡时间时，在途请求数从 1 逐步提高到并发量
+    ramp = ConcurrencyRamp(config["concurrent_workers"], config.get("ramp_up_seconds", 0), run_start)
 
     # 使用线程池并发处理
     with concurrent.futures.ThreadPoolExecutor(max_workers=config["concurrent_workers"]) as executor:
         # 提交所有任务
         future_to_file = {
-            executor.submit(send_request, file_info, config): file_info
+            executor.submit(ramp.run, send_request, file_info, config): file_info
             for file_info in file_infos
         }
 
@@ -248,7 +264,12 @@ def process_dataset_files(config):
 
             try:
                 result = future.result()
-                all_results["results"].append(result)
+                results_writer.write(result)
+                latency_records.append({
+                    **{key: result[key] for key in ("success", "start_time", "processing_time", "timing")},
+                    # 只保留 usage，不在内存中保留回复内容
+                    "response": {"usage": (result["response"] or {}).get("usage")}
+                })
 
                 completed_files += 1
 
@@ -287,26 +308,42 @@ def process_dataset_files(config):
                     "reply": "",
                     "reasoning_content": "",
                     "processing_time": 0,
+                    "timing": None,
                     "is_stream": config["is_stream"],
                     "model_name": config["model_name"],
                     "error": str(e)
                 }
-                all_results["results"].append(error_result)
+                results_writer.write(error_result)
 
                 print(f"[{completed_files}/{total_files}] ✗ 异常 - {filename}")
                 print(f"  错误: {str(e)}")
 
-    # 更新统计信息
-    all_results["successful_requests"] = successful_requests
-    all_results["failed_requests"] = failed_requests
-    all_results["success_rate"] = successful_requests / total_files * 100 if total_files > 0 else 0
-
-    # 保存所有结果到一个JSON文件
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    results_file = os.path.join(results_dir, f"all_results_{timestamp}.json")
-
-    with open(results_file, 'w', encoding='utf-8') as f:
-        json.dump(all_results, f, ensure_ascii=False, indent=2)
+    close_sessions()
+
+    # 配置了预热/冷却时，延迟和吞吐只统计在稳态窗口内完成的请求，吞吐按稳态时长计算
+    run_end = time.time()
+    window_stats = None
+    if window_enabled(config):
+        window = measurement_window(run_start, run_end, config.get("warmup_seconds", 0),
+                                    config.get("cooldown_seconds", 0))
+        if window is None:
+            print("警告: 预热和冷却时间之和不小于运行时长，稳态窗口为空，统计全部请求")
+            window = measurement_window(run_start, run_end, 0, 0)
+        latency_records = [record for record in latency_records if in_window(record, window)]
+        window_stats = window_summary(window, total_files, len(latency_records))
+        run_start, run_end = window["steady_start"], window["steady_end"]
+
+    # 写入汇总信息，完整结果可用 results_writer.load_all_results 重建为原 all_results 结构
+    latency_stats = summarize_latency(latency_records)
+    token_stats = summarize_tokens(latency_records, run_end - run_start)
+    results_writer.close({
+        "successful_requests": successful_requests,
+        "failed_requests": failed_requests,
+        "success_rate": successful_requests / total_files * 100 if total_files > 0 else 0,
+        "latency_stats": latency_stats,
+        "token_stats": token_stats,
+        "window_stats": window_stats
+    })
 
     # 输出统计信息
     print("\n" + "=" * 50)
@@ -315,6 +352,13 @@ def process_dataset_files(config):
     print(f"成功请求: {successful_requests}")
     print(f"失败请求: {failed_requests}")
     print(f"成功率: {successful_requests / total_files * 100:.1f}%")
+    if window_stats:
+        for line in format_window_summary(window_stats):
+            print(line)
+    for line in format_latency_summary(latency_stats):
+        print(line)
+    for line in format_token_summary(token_stats):
+        print(line)
     print(f"模型名称: {config['model_name']}")
     print(f"流式模式: {'开启' if config['is_stream'] else '关闭'}")
     print(f"思考模式: {'开启' if config['think'] else '关闭'}")
@@ -332,6 +376,15 @@ def validate_config(config):
     if config["concurrent_workers"] > 50:
         print("警告: 并发工作线程数较大，可能会对服务器造成压力")
 
+    for key in ("ramp_up_seconds", "warmup_seconds", "cooldown_seconds"):
+        if config.get(key, 0) < 0:
+            print(f"警告: {key} 不能小于0，已设置为0")
+            config[key] = 0
+
+    if config.get("pool_size", 0) < 0:
+        print("警告: 连接池大小不能小于0，已设置为0（与并发数一致）")
+        config["pool_size"] = 0
+
     if config["timeout"] < 1:
         print("警告: 超时时间不能小于1秒，已设置为60秒")
         config["timeout"] = 60
@@ -0,0 +1,201 @@
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+# 值不为 null 的 finish_reason / usage 字段（未转义的字段名不会出现在字符串值中）
+_FIELD_SET = re.compile(r'"(?:finish_reason|usage)"\s*:\s*(?!\s|null)')
+
+
+class SSEStreamParser:
+    """
+    增量 SSE 流解析器，直接处理网络读取到的原始字节块
+
+    - 只对完整的行做处理，未结束的行暂存，跨读取拼接的开销与数据量成线性关系
+    - content / reasoning_content 按块追加到列表，最后一次性拼接，避免字符串反复 += 的二次复杂度
+    - 安装了 orjson 时使用 orjson 解析每个 chunk；否则走快速路径，只解析 "delta" 对象，跳过 id、model 等字段，
+      只有 finish_reason 或 usage 不为 null 的 chunk（通常只有最后一两个）才完整解析
+    - 保留服务端返回的 finish_reason 和 usage（请求 stream_options.include_usage 时在最后一个 chunk 返回），
+      服务端不返回 usage 时以 token chunk 数估算输出 token 数
+    """
+
+    def __init__(self, timing=None, use_orjson=True):
+        """
+        Args:
+            timing: 计时记录（见 metrics.new_stream_timing），不为 None 时记录首字节、首 token 及每个 chunk 的到达时间
+            use_orjson: 是否在已安装 orjson 时使用 orjson 解析
+        """
+        self.timing = timing
+        self.use_orjson = use_orjson and orjson is not None
+        self.content_chunks = []
+        self.reasoning_chunks = []
+        self.token_chunks = 0
+        self.finish_reason = None
+        self.server_usage = None
+        self.done = False
+        self._pending = []
+
+    @property
+    def content(self):
+        return "".join(self.content_chunks)
+
+    @property
+    def reasoning_content(self):
+        return "".join(self.reasoning_chunks)
+
+    @property
+    def usage(self):
+        """
+        服务端返回的 usage；未返回时按 token chunk 数估算输出 token 数，输入 token 数未知(None)。
+        usage_source 标明来源: server / chunks
+        """
+        if self.server_usage:
+            return {**self.server_usage, "usage_source": "server"}
+        return {
+            "prompt_tokens": None,
+            "completion_tokens": self.token_chunks,
+            "total_tokens": None,
+            "usage_source": "chunks"
+        }
+
+    def feed(self, data, now=None):
+        """
+        输入一段原始字节，解析其中所有完整的行
+
+        字节块中所有行都记为 now 时刻到达: 服务端连续发出的多个 chunk 在一次读取中返回时，
+        它们的到达时间相同，相邻 chunk 的 ITL 为 0，计时精度受限于读取粒度
+
+        Args:
+            data: 网络读取到的字节块
+            now: 该字节块的到达时间，记录计时时必须提供
+
+        Returns:
+            是否已收到 [DONE]
+        """
+        if self.done or not data:
+            return self.done
+
+        newline = data.find(b'\n')
+        if newline == -1:
+            self._pending.append(data)
+            return False
+
+        if self._pending:
+            self._pending.append(data[:newline])
+            line = b''.join(self._pending)
+            self._pending = []
+        else:
+            line = data[:newline]
+        self._handle_line(line, now)
+
+        start = newline + 1
+        while not self.done:
+            newline = data.find(b'\n', start)
+            if newline == -1:
+                if start < len(data):
+                    self._pending.append(data[start:])
+                break
+            self._handle_line(data[start:newline], now)
+            start = newline + 1
+
+        return self.done
+
+    def close(self, now=None):
+        """
+        流结束时处理最后一行没有换行符的数据
+        """
+        if self._pending and not self.done:
+            line = b''.join(self._pending)
+            self._pending = []
+            self._handle_line(line, now)
+
+    def _handle_line(self, line, now):
+        line = line.rstrip(b'\r')
+        if not line:
+            return
+
+        timing = self.timing
+        if timing is not None and timing["first_byte_time"] is None:
+            timing["first_byte_time"] = now
+
+        if not line.startswith(b'data:'):
+            return
+
+        data = line[5:]
+        if data[:1] == b' ':
+            data = data[1:]  # 去掉 'data: ' 前缀
+
+        if data == b'[DONE]':
+            self.done = True
+            return
+
+        try:
+            delta = self._parse_chunk(data)
+        except ValueError:
+            # 与原实现一致，无法解析的 chunk 直接跳过
+            return
+        if not delta:
+            return
+
+        content = delta.get('content')
+        reasoning = delta.get('reasoning_content')
+
+        if content:
+            self.content_chunks.append(content)
+        if reasoning:
+            self.reasoning_chunks.append(reasoning)
+
+        if content or reasoning:
+            self.token_chunks += 1
+
+        if timing is not None and (content or reasoning):
+            if content and timing["first_content_time"] is None:
+                timing["first_content_time"] = now
+            if reasoning and timing["first_reasoning_time"] is None:
+                timing["first_reasoning_time"] = now
+            timing["chunk_times"].append(now)
+
+    def _parse_chunk(self, data):
+        """
+        取出 choices[0].delta，同时记录 finish_reason 和 usage，chunk 中没有 delta 时返回 None
+        """
+        if self.use_orjson:
+            return self._handle_chunk(orjson.loads(data))
+
+        # 快速路径: 未转义的 "delta": 只可能是字段名，直接从该位置解析 delta 对象
+        text = data.decode('utf-8')
+        index = text.find('"delta":')
+        if index == -1:
+            return self._handle_chunk(json.loads(text))
+
+        start = index + 8
+        while start < len(text) and text[start] in _WHITESPACE:
+            start += 1
+        delta, end = _decoder.raw_decode(text, start)
+
+        # delta 之外的部分很短（id、model、finish_reason 等），只在这两段中检查 finish_reason 和 usage 是否不为 null
+        if _FIELD_SET.search(text, end) or _FIELD_SET.search(text, 0, index):
+            return self._handle_chunk(json.loads(text))
+        return delta if isinstance(delta, dict) else None
+
+    def _handle_chunk(self, chunk):
+        """
+        从完整解析的 chunk 中记录 usage 和 finish_reason，返回 delta
+        """
+        if not isinstance(chunk, dict):
+            return None
+        if chunk.get('usage'):
+            self.server_usage = chunk['usage']
+
+        choices = chunk.get('choices')
+        if not choices:
+            return None
+        if choices[0].get('finish_reason'):
+            self.finish_reason = choices[0]['finish_reason']
+        return choices[0].get('delta')
+
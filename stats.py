@@ -0,0 +1,469 @@
+import collections
+import math
+import threading
+import time
+
+from zhejing.metrics import PERCENTILES, SLO_METRICS, request_tokens, token_summary
+from zhejing.phases import measurement_window
+
+
+class LogHistogram:
+    """
+    对数分桶直方图（HDR 风格）
+
+    第 i 个桶覆盖 [min_value * growth^i, min_value * growth^(i+1))，相对误差不超过 growth - 1。
+    桶以稀疏字典保存，记录为 O(1)，合并和计算分位数的开销只与非空桶数有关，与请求数无关。
+    """
+
+    def __init__(self, min_value=1e-6, growth=1.01):
+        self.min_value = min_value
+        self.growth = growth
+        self._inv_log_growth = 1.0 / math.log(growth)
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        if value is None:
+            return
+
+        index = int(math.log(value / self.min_value) * self._inv_log_growth) if value > self.min_value else 0
+        counts = self.counts
+        counts[index] = counts.get(index, 0) + 1
+
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        把另一个直方图合并到当前直方图，两者的分桶参数必须一致
+        """
+        counts = self.counts
+        for index, count in list(other.counts.items()):
+            counts[index] = counts.get(index, 0) + count
+
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def subtract(self, earlier):
+        """
+        返回当前直方图减去较早快照 earlier 后的新直方图，即两次快照之间记录的数据；
+        区间内的最值无法精确得到，取非空桶的代表值
+        """
+        result = LogHistogram(self.min_value, self.growth)
+        for index, count in self.counts.items():
+            remaining = count - earlier.counts.get(index, 0)
+            if remaining > 0:
+                result.counts[index] = remaining
+
+        result.count = self.count - earlier.count
+        result.total = self.total - earlier.total
+        if result.counts:
+            result.min = max(self.bucket_value(min(result.counts)), self.min)
+            result.max = min(self.bucket_value(max(result.counts)), self.max)
+        return result
+
+    def to_dict(self):
+        """
+        序列化为可 JSON 编码的字典，用于跨进程/跨机器传输
+        """
+        return {
+            "min_value": self.min_value,
+            "growth": self.growth,
+            "counts": self.counts,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["min_value"], data["growth"])
+        # JSON 对象的键为字符串，恢复为整数桶序号
+        histogram.counts = {int(index): count for index, count in data["counts"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+    def bucket_value(self, index):
+        """
+        桶的代表值（桶上下界的几何中点）
+        """
+        return self.min_value * self.growth ** (index + 0.5)
+
+    def cumulative_counts(self, bounds):
+        """
+        按升序边界 bounds 返回累计计数列表（Prometheus 直方图的 le 桶），
+        每个对数桶按其上界归入第一个不小于上界的边界，误差不超过一个对数桶宽度
+        """
+        result = []
+        position = 0
+        cumulative = 0
+        for index in sorted(self.counts):
+            upper = self.min_value * self.growth ** (index + 1)
+            while position < len(bounds) and upper > bounds[position]:
+                result.append(cumulative)
+                position += 1
+            cumulative += self.counts[index]
+        while position < len(bounds):
+            result.append(cumulative)
+            position += 1
+        return result
+
+    def percentiles(self, quantiles=PERCENTILES):
+        """
+        一次遍历计算多个分位数，返回 {q: value}
+        """
+        if self.count == 0:
+            return {q: None for q in quantiles}
+
+        result = {}
+        targets = sorted(quantiles)
+        position = 0
+        cumulative = 0
+        for index in sorted(self.counts):
+            cumulative += self.counts[index]
+            while position < len(targets) and cumulative >= targets[position] / 100 * self.count:
+                value = self.bucket_value(index)
+                result[targets[position]] = min(max(value, self.min), self.max)
+                position += 1
+            if position == len(targets):
+                break
+        for q in targets[position:]:
+            result[q] = self.max
+        return result
+
+    def summary(self):
+        """
+        返回与 metrics.summarize 相同结构的统计结果
+        """
+        if self.count == 0:
+            return {"count": 0}
+
+        summary = {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max
+        }
+        for q, value in self.percentiles().items():
+            summary[f"p{q:g}"] = value
+        return summary
+
+
+class WorkerStats:
+    """
+    单个工作线程的计数器和延迟直方图，只由所属线程写入，因此无需加锁且不会丢失计数
+    """
+
+    # started_requests - total_requests 即在途请求数
+    # slo_* 只统计带 slo_violations 的结果（配置了 SLO 时由 build_result 检查）
+    # aborted_requests 为客户端主动中断的流式请求，同时计入 successful_requests
+    # length_* 只统计带 length_error 的结果（开启输出长度校验时由 build_result 计算）
+    COUNTERS = ("started_requests", "total_requests", "successful_requests", "failed_requests", "capped_requests",
+                "aborted_requests", "prompt_tokens", "completion_tokens", "slo_requests", "slo_attained_requests", "slo_attained_tokens",
+                "slo_ttft_violations", "slo_tpot_violations", "slo_e2e_violations", "length_checked_requests",
+                "length_short_requests", "length_long_requests")
+    HISTOGRAMS = ("e2e", "ttft", "tpot", "itl", "schedule_lag", "decode_speed")
+    # 按数据集文件统计的 SLO 计数
+    FILE_COUNTERS = ("requests", "attained", "failed") + SLO_METRICS
+
+    def __init__(self):
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.histograms = {name: LogHistogram() for name in self.HISTOGRAMS}
+        self.slo_files = {}
+
+    def increment(self, name, value=1):
+        self.counters[name] += value
+
+    def record(self, name, value):
+        self.histograms[name].record(value)
+
+    def record_result(self, result):
+        """
+        统计一个请求结果: 成功/失败计数、端到端延迟、输入/输出 token 数，流式请求还包括 TTFT、TPOT、ITL 和解码速度
+        """
+        counters = self.counters
+        counters["total_requests"] += 1
+
+        if not result["success"]:
+            counters["failed_requests"] += 1
+            if result.get("slo_violations") is not None:
+                self.record_slo(result, 0)
+            return
+
+        counters["successful_requests"] += 1
+        if result.get("aborted"):
+            # 主动中断的请求只有 TTFT 有意义，端到端延迟、TPOT 和 token 数不计入统计
+            counters["aborted_requests"] += 1
+            timing = result.get("timing")
+            if timing:
+                self.histograms["ttft"].record(timing["ttft"])
+            return
+
+        self.histograms["e2e"].record(result["processing_time"])
+
+        prompt_tokens, completion_tokens, decode_speed = request_tokens(result)
+        counters["prompt_tokens"] += prompt_tokens or 0
+        counters["completion_tokens"] += completion_tokens or 0
+        self.histograms["decode_speed"].record(decode_speed)
+        if result.get("slo_violations") is not None:
+            self.record_slo(result, completion_tokens or 0)
+        length_error = result.get("length_error")
+        if length_error is not None:
+            counters["length_checked_requests"] += 1
+            if length_error < 0:
+                counters["length_short_requests"] += 1
+            elif length_error > 0:
+                counters["length_long_requests"] += 1
+
+        timing = result.get("timing")
+        if timing:
+            self.histograms["ttft"].record(timing["ttft"])
+            self.histograms["tpot"].record(timing["tpot"])
+            itl = self.histograms["itl"]
+            offsets = timing["chunk_offsets"]
+            for i in range(1, len(offsets)):
+                itl.record(offsets[i] - offsets[i - 1])
+
+    def record_slo(self, result, completion_tokens):
+        """
+        统计一个请求的 SLO 达成情况，成功且没有违反任何 SLO 的请求计入 goodput
+        """
+        counters = self.counters
+        violations = result["slo_violations"]
+        attained = result["success"] and not violations
+
+        file_counts = self.slo_files.get(result["filename"])
+        if file_counts is None:
+            file_counts = self.slo_files[result["filename"]] = dict.fromkeys(self.FILE_COUNTERS, 0)
+
+        counters["slo_requests"] += 1
+        file_counts["requests"] += 1
+        if not result["success"]:
+            file_counts["failed"] += 1
+        elif attained:
+            counters["slo_attained_requests"] += 1
+            counters["slo_attained_tokens"] += completion_tokens
+            file_counts["attained"] += 1
+        for name in violations:
+            counters[f"slo_{name}_violations"] += 1
+            file_counts[name] += 1
+
+    def goodput_summary(self, elapsed, slo):
+        """
+        返回 goodput 统计: SLO 达成率、满足全部 SLO 的 req/s 和输出 tok/s，以及各 SLO 和各数据集文件的违反数
+        """
+        counters = self.counters
+        requests = counters["slo_requests"]
+        return {
+            "slo": slo,
+            "requests": requests,
+            "attained_requests": counters["slo_attained_requests"],
+            "failed_requests": sum(counts["failed"] for counts in self.slo_files.values()),
+            "attainment": counters["slo_attained_requests"] / requests if requests else 0,
+            "goodput_qps": counters["slo_attained_requests"] / elapsed if elapsed > 0 else 0,
+            "goodput_output_tokens_per_second": counters["slo_attained_tokens"] / elapsed if elapsed > 0 else 0,
+            "violations": {name: counters[f"slo_{name}_violations"] for name in SLO_METRICS},
+            "files": {filename: dict(counts) for filename, counts in list(self.slo_files.items())}
+        }
+
+    def length_summary(self):
+        """
+        返回输出长度校验结果: 校验的请求数、输出 token 数与 max_tokens 一致/不足/超出的请求数和一致率
+        """
+        counters = self.counters
+        checked = counters["length_checked_requests"]
+        matched = checked - counters["length_short_requests"] - counters["length_long_requests"]
+        return {
+            "checked": checked,
+            "matched": matched,
+            "short": counters["length_short_requests"],
+            "long": counters["length_long_requests"],
+            "match_rate": matched / checked if checked else 0
+        }
+
+    def token_summary(self, elapsed):
+        """
+        返回与 metrics.summarize_tokens 相同结构的 token 吞吐统计
+        """
+        return token_summary(self.counters["prompt_tokens"], self.counters["completion_tokens"], elapsed,
+                             self.histograms["decode_speed"].summary())
+
+    def merge(self, other):
+        for name, value in list(other.counters.items()):
+            self.counters[name] = self.counters.get(name, 0) + value
+        for name, histogram in other.histograms.items():
+            self.histograms[name].merge(histogram)
+        for filename, counts in list(other.slo_files.items()):
+            file_counts = self.slo_files.setdefault(filename, dict.fromkeys(self.FILE_COUNTERS, 0))
+            for name, value in counts.items():
+                file_counts[name] += value
+        return self
+
+    def subtract(self, earlier):
+        """
+        返回两次累计快照之间的统计（当前快照减去较早的快照 earlier）
+        """
+        result = WorkerStats()
+        for name, value in self.counters.items():
+            result.counters[name] = value - earlier.counters.get(name, 0)
+        for name, histogram in self.histograms.items():
+            result.histograms[name] = histogram.subtract(earlier.histograms[name])
+        for filename, counts in self.slo_files.items():
+            earlier_counts = earlier.slo_files.get(filename, {})
+            result.slo_files[filename] = {name: value - earlier_counts.get(name, 0) for name, value in counts.items()}
+        return result
+
+    def to_dict(self):
+        return {
+            "counters": self.counters,
+            "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            "slo_files": self.slo_files
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.counters.update(data["counters"])
+        for name, histogram in data["histograms"].items():
+            stats.histograms[name] = LogHistogram.from_dict(histogram)
+        stats.slo_files = data.get("slo_files", {})
+        return stats
+
+
+class MetricsRegistry:
+    """
+    按线程分配 WorkerStats，请求路径上只访问本线程的统计对象，不获取任何全局锁；
+    锁只在线程首次注册和汇总时使用。asyncio 引擎的所有协程运行在同一线程中，共享同一个 WorkerStats。
+
+    factory 为每个线程的统计对象类型，需支持无参构造和 merge，默认为 WorkerStats
+    """
+
+    def __init__(self, factory=None):
+        self.factory = factory or WorkerStats
+        self.start_time = time.time()
+        self._local = threading.local()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def local(self):
+        """
+        获取当前线程的 WorkerStats，首次调用时注册
+        """
+        stats = getattr(self._local, "stats", None)
+        if stats is None:
+            stats = self.factory()
+            with self._lock:
+                self._workers.append(stats)
+            self._local.stats = stats
+        return stats
+
+    def snapshot(self):
+        """
+        合并所有线程的统计，开销为 O(线程数 x 非空桶数)
+        """
+        with self._lock:
+            workers = list(self._workers)
+
+        merged = self.factory()
+        for stats in workers:
+            merged.merge(stats)
+        return merged
+
+
+class MetricsReporter(threading.Thread):
+    """
+    按固定间隔合并统计并调用 report(snapshot, previous, interval) 输出，previous 为上一次的快照（首次为 None）
+    """
+
+    def __init__(self, registry, report, interval=10):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.report = report
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        previous = None
+        last_time = time.time()
+        while not self._stopped.wait(self.interval):
+            now = time.time()
+            snapshot = self.registry.snapshot()
+            self.report(snapshot, previous, now - last_time)
+            previous = snapshot
+            last_time = now
+
+    def stop(self):
+        self._stopped.set()
+        self.join(timeout=self.interval)
+
+
+class WindowSnapshots(threading.Thread):
+    """
+    为稳态统计窗口保存统计快照: 预热结束时的快照、最近 cooldown 秒内按固定间隔的快照，以及停止时的快照。
+
+    running() 返回 False 时视为停止（停止之后排空阶段完成的请求不计入窗口）。窗口为预热结束到停止前 cooldown 秒，
+    窗口内的统计为两端快照之差，即窗口内完成的请求，冷却边界的精度为快照间隔
+    """
+
+    def __init__(self, registry, warmup, cooldown, running, poll_interval=0.1):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.warmup = warmup
+        self.cooldown = cooldown
+        self.running = running
+        self.poll_interval = poll_interval
+        # 冷却期内最多保留约 20 个快照，快照间隔至少 1 秒
+        self.interval = max(1.0, cooldown / 20)
+        self.history = collections.deque(maxlen=int(cooldown / self.interval) + 3)
+        self.start_snapshot = None
+        self.stop_time = None
+
+    def run(self):
+        next_snapshot = self.registry.start_time + self.warmup
+        while self.running():
+            now = time.time()
+            if now >= next_snapshot:
+                if self.start_snapshot is None:
+                    self.start_snapshot = (now, self.registry.snapshot())
+                elif self.cooldown > 0:
+                    self.history.append((now, self.registry.snapshot()))
+                next_snapshot = now + self.interval
+            time.sleep(self.poll_interval)
+
+        self.stop_time = time.time()
+        self.history.append((self.stop_time, self.registry.snapshot()))
+
+    def window_stats(self):
+        """
+        返回 (窗口内的 WorkerStats, 窗口边界)，边界的结构同 phases.measurement_window，取实际快照时刻；
+        运行时长不足预热加冷却时间时返回 None。需在线程结束后调用
+        """
+        if self.start_snapshot is None or self.stop_time is None:
+            return None
+
+        start_time, before = self.start_snapshot
+        end = self.stop_time - self.cooldown
+        candidates = [entry for entry in self.history if start_time < entry[0] <= end]
+        if not candidates:
+            return None
+
+        end_time, after = candidates[-1]
+        window = measurement_window(self.registry.start_time, self.stop_time, start_time - self.registry.start_time,
+                                    self.stop_time - end_time)
+        return after.subtract(before), window
@@ -0,0 +1,219 @@
+import copy
+import csv
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+from zhejing import send_reqs_with_pressure as pressure
+from zhejing.metrics import format_ms, slo_enabled
+
+# CSV 列，时间单位为秒
+COLUMNS = (
+    "step", "mode", "level", "duration", "requests", "successful", "failed", "error_rate",
+    "qps", "input_tokens_per_second", "output_tokens_per_second",
+    "e2e_p50", "e2e_p99", "ttft_p50", "ttft_p90", "ttft_p99", "tpot_p50", "tpot_p90", "tpot_p99",
+    "schedule_lag_p99", "capped", "slo_attainment", "goodput_qps", "goodput_output_tokens_per_second", "stop_reason"
+)
+
+
+def sweep_levels(sweep):
+    """
+    按几何级数生成扫描级别: start, start*factor, ... 不超过 max；并发模式下取整并去重
+    """
+    levels = []
+    level = sweep.get("start", 1)
+    while level <= sweep.get("max", 1024) + 1e-9:
+        value = math.ceil(level) if sweep.get("mode", "concurrency") == "concurrency" else round(level, 3)
+        if not levels or value != levels[-1]:
+            levels.append(value)
+        level *= sweep.get("factor", 2)
+    return levels
+
+
+def build_step_config(config, sweep, level):
+    """
+    生成单个扫描级别的后台压力配置: 并发模式为闭环 level 个并发且不等待，QPS 模式为开环 level QPS，
+    不使用全局的爬坡和预热/冷却时间
+    """
+    step_config = copy.deepcopy(config)
+    step_config["test_concurrent_workers"] = 0
+    step_config["background_stream"] = config["is_stream"]
+    step_config["think_time"] = [0, 0]
+    # 每级有自己的预热和统计时长，全局的爬坡和预热/冷却窗口不作用于单级，否则统计时段内的并发可能低于 level
+    for key in ("ramp_up_seconds", "warmup_seconds", "cooldown_seconds"):
+        step_config[key] = 0
+    if sweep.get("mode", "concurrency") == "concurrency":
+        step_config["background_mode"] = "closed"
+        step_config["background_concurrent_workers"] = level
+    else:
+        step_config["background_mode"] = "open"
+        step_config["arrival"]["qps"] = level
+        if step_config["arrival"]["process"] == "bursty":
+            step_config["arrival"]["process"] = "poisson"
+    return step_config
+
+
+def run_step(step_config, dataset_files, warmup_seconds, hold_seconds):
+    """
+    运行单个级别: 先预热 warmup_seconds 秒，再统计之后 hold_seconds 秒稳态内完成的请求，返回 (WorkerStats, 统计时长)
+    """
+    pressure.background_active = True
+    thread = threading.Thread(target=pressure.background_pressure_test, args=(step_config, dataset_files, None, False))
+    thread.start()
+
+    time.sleep(warmup_seconds)
+    before = pressure.background_metrics.snapshot()
+    start = time.time()
+    time.sleep(hold_seconds)
+    after = pressure.background_metrics.snapshot()
+    elapsed = time.time() - start
+
+    pressure.background_active = False
+    thread.join()
+    # 下一级别按新的并发数重建连接池
+    pressure.close_sessions()
+    return after.subtract(before), elapsed
+
+
+def summarize_step(step, mode, level, stats, elapsed, slo):
+    counters = stats.counters
+    histograms = stats.histograms
+    e2e = histograms["e2e"].percentiles((50, 99))
+    ttft = histograms["ttft"].percentiles((50, 90, 99))
+    tpot = histograms["tpot"].percentiles((50, 90, 99))
+    tokens = stats.token_summary(elapsed)
+    goodput = stats.goodput_summary(elapsed, slo) if slo_enabled(slo) else None
+
+    return {
+        "step": step,
+        "mode": mode,
+        "level": level,
+        "duration": elapsed,
+        "requests": counters["total_requests"],
+        "successful": counters["successful_requests"],
+        "failed": counters["failed_requests"],
+        "error_rate": counters["failed_requests"] / counters["total_requests"] if counters["total_requests"] else 0,
+        "qps": counters["successful_requests"] / elapsed if elapsed > 0 else 0,
+        "input_tokens_per_second": tokens["input_tokens_per_second"],
+        "output_tokens_per_second": tokens["output_tokens_per_second"],
+        "e2e_p50": e2e[50],
+        "e2e_p99": e2e[99],
+        "ttft_p50": ttft[50],
+        "ttft_p90": ttft[90],
+        "ttft_p99": ttft[99],
+        "tpot_p50": tpot[50],
+        "tpot_p90": tpot[90],
+        "tpot_p99": tpot[99],
+        "schedule_lag_p99": histograms["schedule_lag"].percentiles((99,))[99],
+        "capped": counters["capped_requests"],
+        "slo_attainment": goodput["attainment"] if goodput else None,
+        "goodput_qps": goodput["goodput_qps"] if goodput else None,
+        "goodput_output_tokens_per_second": goodput["goodput_output_tokens_per_second"] if goodput else None,
+        "stop_reason": ""
+    }
+
+
+def check_thresholds(row, sweep, slo):
+    """
+    检查是否超过停止阈值，返回停止原因，未超过时返回空字符串；阈值为 0 表示不检查
+    """
+    if row["requests"] == 0:
+        return "没有完成的请求"
+    max_error_rate = sweep.get("max_error_rate", 0.01)
+    if row["error_rate"] > max_error_rate:
+        return f"错误率 {row['error_rate'] * 100:.1f}% > {max_error_rate * 100:.1f}%"
+    target = slo.get("attainment", 0) if slo_enabled(slo) else 0
+    if target and row["slo_attainment"] < target:
+        return f"SLO 达成率 {row['slo_attainment'] * 100:.1f}% < {target * 100:.1f}%"
+
+    for key, limit_key in (("ttft_p99", "max_ttft_p99"), ("tpot_p99", "max_tpot_p99"), ("e2e_p99", "max_e2e_p99")):
+        limit = sweep.get(limit_key, 0)
+        if limit and row[key] is not None and row[key] > limit:
+            return f"{key} {row[key]:.3f}s > {limit}s"
+    return ""
+
+
+def format_attainment(value):
+    return f" {value * 100:>7.2f}%" if value is not None else ""
+
+
+def print_row(row):
+    print(f"{row['level']:>8} {row['qps']:>9.2f} {row['output_tokens_per_second']:>10.1f} "
+          f"{row['error_rate'] * 100:>6.1f}% {format_ms(row['ttft_p50']):>9} {format_ms(row['ttft_p99']):>9} "
+          f"{format_ms(row['tpot_p50']):>9} {format_ms(row['tpot_p99']):>9} {format_ms(row['e2e_p99']):>9}"
+          f"{format_attainment(row['slo_attainment'])}{'  ' + row['stop_reason'] if row['stop_reason'] else ''}")
+
+
+def find_knee(rows, min_gain=0.1):
+    """
+    吞吐饱和点: 第一个相对上一级别 QPS 增幅低于 min_gain 的级别，返回上一级别的行；未饱和时返回 None
+    """
+    for previous, row in zip(rows, rows[1:]):
+        if previous["qps"] > 0 and row["qps"] < previous["qps"] * (1 + min_gain):
+            return previous
+    return None
+
+
+def run_sweep(config, dataset_files, results_dir):
+    """
+    容量扫描: 按几何级数逐级提高并发（或开环 QPS），每级预热后统计稳态的吞吐、TTFT/TPOT 分位数、错误率和 SLO 达成率，
+    超过延迟或错误率阈值、或 SLO 达成率低于目标后停止，结果写入一个 CSV 文件
+    """
+    sweep = config["sweep"]
+    slo = config.get("slo")
+    mode = sweep.get("mode", "concurrency")
+    warmup_seconds = sweep.get("warmup_seconds", 10)
+    hold_seconds = sweep.get("hold_seconds", 30)
+    levels = sweep_levels(sweep)
+
+    print(f"容量扫描模式: {'闭环并发' if mode == 'concurrency' else '开环 QPS'}, 级别: {levels}")
+    print(f"每级预热 {warmup_seconds}秒, 稳态统计 {hold_seconds}秒")
+    print(f"{'级别':>6} {'QPS':>9} {'输出tok/s':>9} {'错误率':>5} {'TTFT p50':>9} {'TTFT p99':>9} "
+          f"{'TPOT p50':>9} {'TPOT p99':>9} {'E2E p99':>9}{' SLO达成率' if slo_enabled(slo) else ''}  (ms)")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    csv_file = os.path.join(results_dir, f"sweep_{timestamp}.csv")
+    rows = []
+
+    with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+
+        try:
+            for step, level in enumerate(levels, 1):
+                step_config = build_step_config(config, sweep, level)
+                stats, elapsed = run_step(step_config, dataset_files, warmup_seconds, hold_seconds)
+                row = summarize_step(step, mode, level, stats, elapsed, slo)
+                row["stop_reason"] = check_thresholds(row, sweep, slo)
+
+                rows.append(row)
+                writer.writerow(row)
+                f.flush()
+                print_row(row)
+
+                if row["stop_reason"]:
+                    break
+        except KeyboardInterrupt:
+            pressure.background_active = False
+            print("容量扫描被中断")
+
+    passed = [row for row in rows if not row["stop_reason"]]
+    print("\n" + "=" * 50)
+    print("容量扫描完成!")
+    if passed:
+        best = max(passed, key=lambda row: row["qps"])
+        print(f"满足阈值的最大吞吐: 级别 {best['level']}, QPS {best['qps']:.2f}, "
+              f"输出 {best['output_tokens_per_second']:.1f} tok/s")
+        if best["slo_attainment"] is not None:
+            print(f"  SLO 达成率 {best['slo_attainment'] * 100:.2f}%, Goodput {best['goodput_qps']:.2f} req/s, "
+                  f"{best['goodput_output_tokens_per_second']:.1f} 输出tok/s")
+    else:
+        print("没有满足阈值的级别")
+
+    knee = find_knee(rows, sweep.get("min_gain", 0.1))
+    if knee:
+        print(f"吞吐饱和点(拐点): 级别 {knee['level']}, QPS {knee['qps']:.2f}, 之后吞吐增幅低于 "
+              f"{sweep.get('min_gain', 0.1) * 100:.0f}%")
+    print(f"\n扫描结果已保存到: {csv_file}")
@@ -1,9 +1,17 @@
 import json
 import time
+import random
+import concurrent.futures
 import requests
 import os
 from datetime import datetime
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
+#from http_session import http_post, close_sessions # ide run
+from zhejing.http_session import http_post, close_sessions
+#from metrics import mean_difference # ide run
+from zhejing.metrics import mean_difference
+#from results_writer import ResultsWriter # ide run
+from zhejing.results_writer import ResultsWriter
 
 
 def read_input_file(file_path: str) -> str:
@@ -45,19 +53,39 @@ def generate_requests(base_request: Dict[str, Any], param_ranges: Dict[str, List
 
     return requests_list
 
-def init_result_file(file_path: str, total_requests: int) -> None:
-    """初始化结果文件"""
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write("=" * 80 + "\n")
-        f.write("HTTP请求测试结果\n")
-        f.write(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"超时时间: 15分钟 (900秒)\n")
-        f.write(f"请求间隔: 15秒\n")
-        f.write(f"总请求数: {total_requests}\n")
-        f.write("=" * 80 + "\n\n")
+def describe_changes(req: Dict[str, Any], base_request: Dict[str, Any]) -> str:
+    """描述请求变体相对基础请求修改的参数"""
+    changes = [f"{key}={req[key]}" for key in req if key in base_request and req[key] != base_request[key]]
+    return ", ".join(changes) or "(与基线参数相同)"
+
+def init_result_file(file_path: str, base_request: Dict[str, Any], total_requests: int, concurrency: int = 1,
+                     repeats: int = 1, timeout: int = 900) -> ResultsWriter:
+    """
+    创建结果写入器，整个运行期间保持文件打开
+    结果文件为 JSONL，每个请求一条记录，响应原文压缩写入同名的 .bodies.gz 旁路文件
+    """
+    body_file = os.path.splitext(file_path)[0] + ".bodies.gz"
+    return ResultsWriter(file_path, {
+        "test": "houchuli",
+        "start_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "timeout": timeout,
+        "concurrency": concurrency,
+        "repeats": repeats,
+        "total_requests": total_requests,
+        # 输入内容可能很长，只记录长度
+        "base_request": {key: value for key, value in base_request.items() if key != "messages"},
+        "input_chars": sum(len(message["content"]) for message in base_request["messages"])
+    }, body_file=body_file)
+
+def response_usage(response_data: Any) -> Dict[str, Any]:
+    """取响应中的 usage，没有或响应不是 JSON 时返回空字典"""
+    try:
+        return response_data.json().get("usage") or {}
+    except (ValueError, AttributeError):
+        return {}
 
 def log_request_result(
-    file_path: str,
+    results_writer: ResultsWriter,
     name: str,
     current_time: str,
     elapsed_time: float,
@@ -65,28 +93,25 @@ def log_request_result(
     base_request: Dict[str, Any],
     status: str,
     response_data: Any = None,
-    error: str = None
+    error: str = None,
+    usage: Dict[str, Any] = None
 ) -> None:
-    """记录单个请求结果到文件"""
-    with open(file_path, "a", encoding="utf-8") as f:
-        f.write(f"=== {name} ===\n")
-        f.write(f"发送时间: {current_time}\n")
-        f.write(f"处理耗时: {elapsed_time:.2f}秒\n")
-
-        if name != "P1":
-            for key in req:
-                if key in base_request and req[key] != base_request[key]:
-                    f.write(f"修改参数: {key} = {req[key]}\n")
-
-        if status == "success":
-            f.write(f"HTTP状态码: {response_data.status_code}\n")
-            f.write(f"响应内容:\n{response_data.text}\n")
-        elif status == "timeout":
-            f.write("状态: 请求超时 (超过15分钟)\n")
-        elif status == "error":
-            f.write(f"状态: 请求失败 - {error}\n")
-
-        f.write("-" * 60 + "\n\n")
+    """提交单个请求的结构化记录，由写入线程写入，响应原文写入压缩旁路文件"""
+    variant, repeat = name.split("#")
+    usage = usage or {}
+    results_writer.write({
+        "name": variant,
+        "repeat": int(repeat),
+        "send_time": current_time,
+        "elapsed": elapsed_time,
+        "changes": {key: req[key] for key in req if key in base_request and req[key] != base_request[key]},
+        "status": status,
+        "http_status": response_data.status_code if response_data is not None else None,
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "error": error,
+        "body": response_data.content if response_data is not None else None
+    })
 
 def send_request(
     server_ip: str,
@@ -94,40 +119,154 @@ def send_request(
     name: str,
     req: Dict[str, Any],
     base_request: Dict[str, Any],
-    result_file: str
-) -> None:
-    """发送单个HTTP请求并处理结果"""
+    results_writer: ResultsWriter,
+    keep_alive: bool = True,
+    pool_size: int = 10,
+    timeout: int = 900
+) -> Dict[str, Any]:
+    """
+    发送单个HTTP请求并处理结果，keep_alive 为 False 时每个请求新建连接
+    返回样本 {"success", "elapsed", "completion_tokens"}，HTTP 状态码不是 200 的请求视为失败
+    """
     start_time = time.time()
     current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     print(f"[{current_time}] 发送 {name}")
 
     try:
-        response = requests.post(
-            url=f"http://{server_ip}:{port}/v1/chat/completions",
+        response = http_post(
+            f"http://{server_ip}:{port}/v1/chat/completions",
+            keep_alive,
+            pool_size,
             headers={"Content-Type": "application/json"},
             json=req,
-            timeout=900
+            timeout=timeout
         )
         elapsed_time = time.time() - start_time
-        log_request_result(result_file, name, current_time, elapsed_time, req, base_request, "success", response)
-        print(f"  ✓ {name} 完成 (耗时: {elapsed_time:.2f}秒)")
+        usage = response_usage(response)
+        success = response.status_code == 200
+        if success:
+            log_request_result(results_writer, name, current_time, elapsed_time, req, base_request, "success",
+                               response, usage=usage)
+            print(f"  ✓ {name} 完成 (耗时: {elapsed_time:.2f}秒)")
+        else:
+            log_request_result(results_writer, name, current_time, elapsed_time, req, base_request, "http_error",
+                               response, error=f"HTTP {response.status_code}", usage=usage)
+            print(f"  ✗ {name} 失败: HTTP {response.status_code} (耗时: {elapsed_time:.2f}秒)")
+        return {"success": success, "elapsed": elapsed_time, "completion_tokens": usage.get("completion_tokens")}
 
     except requests.exceptions.Timeout:
         elapsed_time = time.time() - start_time
-        log_request_result(result_file, name, current_time, elapsed_time, req, base_request, "timeout")
+        log_request_result(results_writer, name, current_time, elapsed_time, req, base_request, "timeout")
         print(f"  ✗ {name} 超时 (耗时: {elapsed_time:.2f}秒)")
 
     except requests.exceptions.RequestException as e:
         elapsed_time = time.time() - start_time
-        log_request_result(result_file, name, current_time, elapsed_time, req, base_request, "error", error=str(e))
+        log_request_result(results_writer, name, current_time, elapsed_time, req, base_request, "error",
+                           error=str(e))
         print(f"  ✗ {name} 失败: {str(e)} (耗时: {elapsed_time:.2f}秒)")
 
-def run_postproc(server_ip="localhost", port=1025, model_name="auto", is_long=False) -> None:
-    """主函数控制整个流程"""
+    return {"success": False, "elapsed": elapsed_time, "completion_tokens": None}
+
+def run_variants(
+    server_ip: str,
+    port,
+    requests_list: List[Tuple[str, Dict[str, Any]]],
+    base_request: Dict[str, Any],
+    results_writer: ResultsWriter,
+    keep_alive: bool = True,
+    concurrency: int = 1,
+    repeats: int = 1,
+    timeout: int = 900
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    并发执行所有变体，每个变体重复 repeats 次，同时在途的请求不超过 concurrency 个
+    每一轮内变体顺序随机打乱，避免服务端负载随时间的变化集中影响某几个变体
+    返回 {变体名: [样本, ...]}
+    """
+    jobs = []
+    for repeat in range(1, repeats + 1):
+        round_jobs = [(name, req, repeat) for name, req in requests_list]
+        random.shuffle(round_jobs)
+        jobs.extend(round_jobs)
+
+    samples = {name: [] for name, _ in requests_list}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(send_request, server_ip, port, f"{name}#{repeat}", req, base_request, results_writer,
+                            keep_alive, concurrency, timeout): name
+            for name, req, repeat in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            samples[futures[future]].append(future.result())
+    return samples
+
+def summarize_variants(
+    requests_list: List[Tuple[str, Dict[str, Any]]],
+    base_request: Dict[str, Any],
+    samples: Dict[str, List[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    """
+    计算每个变体的平均延迟和输出吞吐，以及相对 P1 基线的差值和 95% 置信区间
+    输出吞吐 = 输出 token 数 / 耗时，只统计响应中带 usage 的成功请求
+    """
+    def metrics(name):
+        succeeded = [sample for sample in samples[name] if sample["success"]]
+        latency = [sample["elapsed"] for sample in succeeded]
+        throughput = [sample["completion_tokens"] / sample["elapsed"] for sample in succeeded
+                      if sample["completion_tokens"] and sample["elapsed"] > 0]
+        return latency, throughput
+
+    base_latency, base_throughput = metrics("P1")
+    rows = []
+    for name, req in requests_list:
+        latency, throughput = metrics(name)
+        rows.append({
+            "name": name,
+            "changes": describe_changes(req, base_request) if name != "P1" else "基线",
+            "samples": len(samples[name]),
+            "failed": sum(1 for sample in samples[name] if not sample["success"]),
+            "latency_mean": sum(latency) / len(latency) if latency else None,
+            "latency_delta": mean_difference(latency, base_latency) if name != "P1" else None,
+            "throughput_mean": sum(throughput) / len(throughput) if throughput else None,
+            "throughput_delta": mean_difference(throughput, base_throughput) if name != "P1" else None
+        })
+    return rows
+
+def format_delta(delta: Optional[Tuple], base_mean: Optional[float], unit: str, digits: int = 2) -> str:
+    """格式化差值和置信区间，置信区间不包含 0 时标记 *（差异显著）"""
+    if delta is None:
+        return "-"
+    value, low, high = delta
+    percent = f" ({value / base_mean * 100:+.1f}%)" if base_mean else ""
+    if low is None:
+        return f"{value:+.{digits}f}{unit}{percent}"
+    significant = " *" if low > 0 or high < 0 else ""
+    return f"{value:+.{digits}f}{unit} [{low:+.{digits}f}, {high:+.{digits}f}]{percent}{significant}"
+
+def format_summary(rows: List[Dict[str, Any]]) -> List[str]:
+    """将变体统计格式化为文本行"""
+    base = rows[0]
+    lines = ["各变体相对 P1 基线的差值 (95% 置信区间, * 表示差异显著):"]
+    for row in rows:
+        latency = f"{row['latency_mean']:.3f}s" if row["latency_mean"] is not None else "-"
+        throughput = f"{row['throughput_mean']:.1f}tok/s" if row["throughput_mean"] is not None else "-"
+        lines.append(
+            f"{row['name']:<5} {row['changes']:<28} 样本: {row['samples'] - row['failed']}/{row['samples']}  "
+            f"延迟: {latency} {format_delta(row['latency_delta'], base['latency_mean'], 's', 3)}  "
+            f"吞吐: {throughput} {format_delta(row['throughput_delta'], base['throughput_mean'], 'tok/s', 1)}"
+        )
+    return lines
+
+def run_postproc(server_ip="localhost", port=1025, model_name="auto", is_long=False, keep_alive=True,
+                 concurrency=1, repeats=1, timeout=900) -> None:
+    """
+    主函数控制整个流程
+    concurrency: 同时在途的请求数；repeats: 每个变体的重复次数，不少于 2 次时才能计算置信区间
+    """
     # 配置参数
     curr_time = datetime.now().strftime('%Y%m%d%H%M%S')
-    result_file = f"result_houchuli_{curr_time}.txt"
+    result_file = f"result_houchuli_{curr_time}.jsonl"
     param_ranges = {
         "temperature": [0.1, 0.6, 1.0],
         "top_p": [0.1, 0.6, 1.0],
@@ -150,33 +289,34 @@ def run_postproc(server_ip="localhost", port=1025, model_name="auto", is_long=Fa
     base_request = create_base_request(content, model_name)
     requests_list = generate_requests(base_request, param_ranges)
 
+    total_requests = len(requests_list) * repeats
+
     # 初始化结果文件
-    init_result_file(result_file, len(requests_list))
-    print("开始发送HTTP请求，每秒发送一个...")
-    print(f"超时时间: 15分钟 (900秒)")
-    print(f"结果将保存到 {result_file} 文件中")
+    results_writer = init_result_file(result_file, base_request, total_requests, concurrency, repeats, timeout)
+    print(f"开始发送HTTP请求，{len(requests_list)} 个变体，每个重复 {repeats} 次，并发数: {concurrency}")
+    print(f"超时时间: {timeout}秒")
+    print(f"结果将保存到 {result_file} 文件中，响应原文压缩保存到 {results_writer.body_file}")
     print("-" * 80)
 
     # 发送请求
-    for i, (name, req) in enumerate(requests_list, 1):
-        send_request(server_ip, port, name, req, base_request, result_file)
-
-        # 添加请求间隔
-        if i < len(requests_list):
-            print("等待1秒后发送下一个请求...")
-            time.sleep(1)
-
-    # 结束处理
-    end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with open(result_file, "a", encoding="utf-8") as f:
-        f.write("=" * 80 + "\n")
-        f.write(f"测试完成时间: {end_time}\n")
-        f.write(f"总请求数: {len(requests_list)}\n")
-        f.write("=" * 80 + "\n")
+    samples = run_variants(server_ip, port, requests_list, base_request, results_writer, keep_alive, concurrency,
+                           repeats, timeout)
+    close_sessions()
+    rows = summarize_variants(requests_list, base_request, samples)
+    summary_lines = format_summary(rows)
+
+    # 结束处理，汇总记录写在结果文件最后一行
+    results_writer.close({
+        "end_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "total_requests": total_requests,
+        "variants": rows
+    })
 
     print("\n" + "=" * 80)
     print("所有请求发送完成!")
-    print(f"总请求数: {len(requests_list)}")
+    print(f"总请求数: {total_requests}")
+    for line in summary_lines:
+        print(line)
     print(f"结果已保存到 {result_file} 文件中")
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+import json
+import math
+import random
+import threading
+
+import pytest
+
+from zhejing.metrics import PERCENTILES
+from zhejing.stats import LogHistogram, MetricsRegistry, WorkerStats
+
+
+def sample_values(size=10000, seed=1):
+    """延迟样本: 对数正态分布，中位数约 50ms"""
+    rng = random.Random(seed)
+    return [rng.lognormvariate(math.log(0.05), 1.0) for _ in range(size)]
+
+
+def histogram_of(values):
+    histogram = LogHistogram()
+    for value in values:
+        histogram.record(value)
+    return histogram
+
+
+def copy_histogram(histogram):
+    # 与跨进程/跨机器传输一致，经过 JSON 编解码
+    return LogHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+
+
+def exact_percentile(values, q):
+    """最近秩分位数: 第一个累计个数不小于 q% 的样本，与 LogHistogram.percentiles 的定义一致"""
+    values = sorted(values)
+    rank = next(k for k in range(1, len(values) + 1) if k >= q / 100 * len(values))
+    return values[rank - 1]
+
+
+def assert_close_to_exact(histogram, values, quantiles=PERCENTILES):
+    # 桶代表值为几何中点，相对误差不超过 sqrt(growth) - 1
+    tolerance = math.sqrt(histogram.growth) - 1 + 1e-9
+    for q, value in histogram.percentiles(quantiles).items():
+        exact = exact_percentile(values, q)
+        assert abs(value - exact) / exact <= tolerance, (q, value, exact)
+
+
+def test_percentiles_match_exact_values():
+    values = sample_values()
+    histogram = histogram_of(values)
+
+    assert histogram.count == len(values)
+    assert histogram.total == pytest.approx(sum(values))
+    assert histogram.min == min(values)
+    assert histogram.max == max(values)
+    assert_close_to_exact(histogram, values, PERCENTILES + (1, 10, 25, 75, 100))
+
+
+def test_percentiles_on_uniform_values():
+    values = [i / 1000 for i in range(1, 2001)]
+    assert_close_to_exact(histogram_of(values), values)
+
+
+def test_percentiles_clamped_to_min_and_max():
+    histogram = histogram_of([0.123] * 5)
+    assert histogram.percentiles() == {q: 0.123 for q in PERCENTILES}
+
+    histogram = histogram_of([0.01, 0.02])
+    result = histogram.percentiles((0, 100))
+    assert result[0] == 0.01
+    assert result[100] == 0.02
+
+
+def test_empty_histogram():
+    histogram = LogHistogram()
+    histogram.record(None)
+    assert histogram.count == 0
+    assert histogram.percentiles((50, 99)) == {50: None, 99: None}
+    assert histogram.summary() == {"count": 0}
+    assert histogram.cumulative_counts([0.1, 1.0]) == [0, 0]
+
+
+def test_values_below_min_value_share_first_bucket():
+    histogram = histogram_of([0, 1e-9, 1e-6])
+    assert histogram.counts == {0: 3}
+    assert histogram.percentiles((50,))[50] == 1e-6
+
+
+def test_merge_equals_recording_all_values():
+    values = sample_values()
+    merged = histogram_of(values[:3000]).merge(histogram_of(values[3000:]))
+    expected = histogram_of(values)
+
+    assert merged.counts == expected.counts
+    assert merged.count == expected.count
+    assert merged.total == pytest.approx(expected.total)
+    assert (merged.min, merged.max) == (expected.min, expected.max)
+    assert merged.percentiles() == expected.percentiles()
+
+
+def test_merge_with_empty_histogram():
+    values = sample_values(100)
+    histogram = histogram_of(values)
+    assert LogHistogram().merge(histogram).counts == histogram.counts
+    assert histogram.merge(LogHistogram()).count == len(values)
+    assert (histogram.min, histogram.max) == (min(values), max(values))
+
+
+def test_subtract_returns_values_between_snapshots():
+    values = sample_values()
+    earlier_values, later_values = values[:4000], values[4000:]
+
+    histogram = histogram_of(earlier_values)
+    earlier = copy_histogram(histogram)
+    for value in later_values:
+        histogram.record(value)
+    difference = histogram.subtract(earlier)
+
+    assert difference.counts == histogram_of(later_values).counts
+    assert difference.count == len(later_values)
+    assert difference.total == pytest.approx(sum(later_values))
+    assert_close_to_exact(difference, later_values, (50, 90, 99))
+    # 区间最值取非空桶的代表值，误差不超过一个桶宽
+    assert difference.min <= min(later_values) * histogram.growth
+    assert difference.max >= max(later_values) / histogram.growth
+
+
+def test_merge_then_subtract_round_trip():
+    values = sample_values()
+    first, second = histogram_of(values[:5000]), histogram_of(values[5000:])
+    difference = copy_histogram(first).merge(second).subtract(first)
+
+    assert difference.counts == second.counts
+    assert difference.count == second.count
+    assert difference.total == pytest.approx(second.total)
+
+
+def test_subtract_same_snapshot_is_empty():
+    histogram = histogram_of(sample_values(100))
+    difference = histogram.subtract(copy_histogram(histogram))
+    assert difference.counts == {}
+    assert difference.count == 0
+    assert difference.percentiles((50,)) == {50: None}
+
+
+def test_dict_round_trip():
+    histogram = histogram_of(sample_values(1000))
+    restored = copy_histogram(histogram)
+    assert restored.counts == histogram.counts
+    assert restored.percentiles() == histogram.percentiles()
+
+
+def test_cumulative_counts_bounded_by_exact_counts():
+    values = sample_values()
+    histogram = histogram_of(values)
+    bounds = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, float("inf")]
+    cumulative = histogram.cumulative_counts(bounds)
+
+    assert cumulative == sorted(cumulative)
+    assert cumulative[-1] == len(values)
+    for bound, count in zip(bounds, cumulative):
+        # 按桶上界归入边界: 不多于 <= bound 的样本数，不少于 <= bound / growth 的样本数
+        assert sum(1 for v in values if v <= bound / histogram.growth) <= count
+        assert count <= sum(1 for v in values if v <= bound)
+
+
+def make_result(index, success=True):
+    if not success:
+        return {"filename": f"{index % 3}.txt", "success": False, "processing_time": 0.5}
+    offsets = [0.02 + 0.01 * i for i in range(10)]
+    return {
+        "filename": f"{index % 3}.txt",
+        "success": True,
+        "processing_time": 0.1 + index / 1000,
+        "response": {"usage": {"prompt_tokens": 20, "completion_tokens": 10}},
+        "timing": {"ttft": offsets[0], "tpot": 0.01, "chunk_offsets": offsets},
+        "slo_violations": ["ttft"] if index % 4 == 0 else []
+    }
+
+
+def stats_of(indices):
+    stats = WorkerStats()
+    for index in indices:
+        stats.record_result(make_result(index, success=index % 10 != 0))
+    return stats
+
+
+def copy_stats(stats):
+    return WorkerStats.from_dict(json.loads(json.dumps(stats.to_dict())))
+
+
+def test_worker_stats_merge_adds_counters_and_histograms():
+    merged = stats_of(range(0, 60)).merge(stats_of(range(60, 100)))
+    expected = stats_of(range(100))
+
+    assert merged.counters == expected.counters
+    assert merged.counters["total_requests"] == 100
+    assert merged.counters["failed_requests"] == 10
+    assert merged.counters["completion_tokens"] == 900
+    for name in WorkerStats.HISTOGRAMS:
+        assert merged.histograms[name].counts == expected.histograms[name].counts
+    assert merged.slo_files == expected.slo_files
+
+
+def test_worker_stats_subtract_returns_interval():
+    stats = stats_of(range(40))
+    earlier = copy_stats(stats)
+    for index in range(40, 100):
+        stats.record_result(make_result(index, success=index % 10 != 0))
+    difference = stats.subtract(earlier)
+    expected = stats_of(range(40, 100))
+
+    assert difference.counters == expected.counters
+    for name in WorkerStats.HISTOGRAMS:
+        assert difference.histograms[name].counts == expected.histograms[name].counts
+    assert difference.slo_files == expected.slo_files
+
+
+def test_registry_snapshot_merges_all_threads():
+    registry = MetricsRegistry()
+
+    def work(offset):
+        stats = registry.local()
+        for index in range(offset, offset + 50):
+            stats.record_result(make_result(index))
+
+    threads = [threading.Thread(target=work, args=(i * 50,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = registry.snapshot()
+    expected = WorkerStats()
+    for index in range(200):
+        expected.record_result(make_result(index))
+
+    assert len(registry._workers) == 4
+    assert snapshot.counters == expected.counters
+    assert snapshot.histograms["e2e"].counts == expected.histograms["e2e"].counts
@@ -0,0 +1,67 @@
+import threading
+
+try:
+    from transformers import AutoTokenizer
+except ImportError:
+    AutoTokenizer = None
+
+_tokenizers = {}
+_lock = threading.Lock()
+
+
+def load_tokenizer(path):
+    """
+    加载并缓存本地分词器（HuggingFace 格式目录或模型名），未安装 transformers 或加载失败时返回 None
+    """
+    if not path:
+        return None
+
+    with _lock:
+        if path in _tokenizers:
+            return _tokenizers[path]
+
+        tokenizer = None
+        if AutoTokenizer is None:
+            print("警告: 未安装 transformers，无法使用本地分词器统计 token 数 (pip install transformers)")
+        else:
+            try:
+                tokenizer = AutoTokenizer.from_pretrained(path, trust_remote_code=True)
+            except Exception as e:
+                print(f"警告: 加载分词器 {path} 失败: {e}")
+        _tokenizers[path] = tokenizer
+        return tokenizer
+
+
+def count_prompt_tokens(tokenizer, messages):
+    """
+    按对话模板统计输入 token 数，分词器没有对话模板时直接统计各条消息内容
+    """
+    try:
+        return len(tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True))
+    except Exception:
+        return sum(len(tokenizer.encode(str(message.get("content", "")), add_special_tokens=False))
+                   for message in messages)
+
+
+def apply_tokenizer_usage(response_data, messages, tokenizer_path):
+    """
+    服务端未返回 usage 时，用本地分词器统计输入和输出 token 数，替换按 chunk 数估算的结果
+    """
+    usage = response_data.get("usage")
+    if usage and usage.get("usage_source", "server") == "server":
+        return
+
+    tokenizer = load_tokenizer(tokenizer_path)
+    if tokenizer is None:
+        return
+
+    message = response_data["choices"][0].get("message", {}) if response_data.get("choices") else {}
+    output = (message.get("reasoning_content") or "") + (message.get("content") or "")
+    prompt_tokens = count_prompt_tokens(tokenizer, messages)
+    completion_tokens = len(tokenizer.encode(output, add_special_tokens=False))
+    response_data["usage"] = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "usage_source": "tokenizer"
+    }
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+#import send_reqs_with_pressure as pressure # ide run
+from zhejing import send_reqs_with_pressure as pressure
+from zhejing.metrics import request_tokens, format_latency_summary, format_token_summary, format_goodput_summary, \
+    slo_enabled
+from zhejing.results_writer import JsonlWriter, ResultsWriter
+from zhejing.stats import MetricsRegistry, MetricsReporter
+
+# 请求体中不属于采样参数的字段，回放时按当前配置重新生成
+_NON_SAMPLING_FIELDS = ("model", "messages", "stream", "stream_options")
+
+
+class TraceRecorder(JsonlWriter):
+    """
+    请求轨迹写入线程，每个发出的请求写为 JSONL 的一行:
+        {"offset": 相对记录开始的发送时间(秒), "filename": ..., "is_background": ..., "stream": ...,
+         "messages": [...], "params": {采样参数}, "expected_output_tokens": 实际输出 token 数（失败为 None）}
+    """
+
+    def __init__(self, file_path, buffer_size=1 << 20):
+        super().__init__(file_path, buffer_size)
+        self.start_time = time.time()
+        self.start()
+
+    def record(self, send_time, payload, result):
+        """
+        提交一个请求，send_time 为请求发出的时间，payload 为实际发送的请求体
+        """
+        completion_tokens = request_tokens(result)[1] if result["success"] else None
+        self.write({
+            "offset": round(send_time - self.start_time, 6),
+            "filename": result["filename"],
+            "is_background": result["is_background"],
+            "stream": payload["stream"],
+            "messages": payload["messages"],
+            "params": {key: value for key, value in payload.items() if key not in _NON_SAMPLING_FIELDS},
+            "expected_output_tokens": completion_tokens
+        })
+
+
+def load_trace(file_path):
+    """
+    读取轨迹文件，按发送时间排序返回；无法解析或缺少必要字段的行被跳过
+    """
+    entries = []
+    skipped = 0
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                if not isinstance(entry.get("offset"), (int, float)) or not isinstance(entry.get("messages"), list):
+                    raise ValueError
+            except ValueError:
+                skipped += 1
+                continue
+            entries.append(entry)
+
+    if skipped:
+        print(f"警告: 轨迹文件中有 {skipped} 行无法解析，已跳过")
+    entries.sort(key=lambda entry: entry["offset"])
+    return entries
+
+
+def build_replay_payload(entry, config):
+    """
+    由轨迹记录构建请求体: 消息和采样参数取自轨迹，模型名取当前配置；
+    match_output_length 开启时按记录的输出 token 数设置 max_tokens 并开启 ignore_eos，使输出长度与原请求一致
+    """
+    payload = {
+        "model": config["model_name"],
+        "messages": entry["messages"],
+        "stream": entry.get("stream", config["is_stream"]),
+        **entry.get("params", {})
+    }
+    if payload["stream"] and config.get("stream_usage", True):
+        payload["stream_options"] = {"include_usage": True}
+
+    expected = entry.get("expected_output_tokens")
+    if config["trace"].get("match_output_length", True) and expected:
+        payload["max_tokens"] = expected
+        payload["ignore_eos"] = True
+    return payload
+
+
+def report_replay_progress(snapshot, previous, interval):
+    elapsed = time.time() - pressure.test_metrics.start_time
+    print(f"[回放] {pressure.format_background_progress(snapshot, previous, interval, elapsed)}")
+
+
+async def replay_request(session, config, entry, results_writer, slots):
+    """
+    发送单个回放请求并记录结果，结束后释放在途名额
+    """
+    from zhejing.async_engine import async_send_request
+
+    try:
+        payload = build_replay_payload(entry, config)
+        result = await async_send_request(session, (None, entry.get("filename", "")), config, payload=payload)
+        pressure.test_metrics.local().record_result(result)
+        results_writer.write(result)
+    finally:
+        slots.release()
+
+
+async def replay_dispatcher(config, entries, results_writer):
+    """
+    按轨迹的发送时间（除以 time_scale）发送请求，不等待之前的请求返回；
+    在途请求达到 max_outstanding 时等待，等待时间计入调度滞后
+    """
+    from zhejing.async_engine import aiohttp, raise_nofile_limit
+
+    time_scale = config["trace"].get("time_scale", 1.0)
+    max_outstanding = config["arrival"].get("max_outstanding", 10000)
+    raise_nofile_limit(max_outstanding + 1024)
+
+    connector = aiohttp.TCPConnector(limit=config.get("pool_size") or max_outstanding,
+                                     force_close=not config.get("keep_alive", True))
+    timeout = aiohttp.ClientTimeout(total=config["timeout"])
+    slots = asyncio.Semaphore(max_outstanding)
+    stats = pressure.test_metrics.local()
+    tasks = set()
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        first_offset = entries[0]["offset"] if entries else 0
+        start = time.monotonic()
+        for entry in entries:
+            offset = (entry["offset"] - first_offset) / time_scale
+            delay = start + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if slots.locked():
+                stats.increment("capped_requests")
+            await slots.acquire()
+
+            stats.record("schedule_lag", time.monotonic() - start - offset)
+            task = asyncio.create_task(replay_request(session, config, entry, results_writer, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            await asyncio.sleep(0)
+
+        # 回放的每个请求都等待完成
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_replay(config, results_dir):
+    """
+    轨迹回放: 按轨迹记录的相对发送时间重新发送每个请求（time_scale 倍速），结果写入 all_results_*.jsonl
+    """
+    trace_file = config["trace"]["replay"]
+    entries = load_trace(trace_file)
+    if not entries:
+        print(f"轨迹文件 {trace_file} 中没有可回放的请求")
+        return
+
+    time_scale = config["trace"].get("time_scale", 1.0)
+    span = entries[-1]["offset"] - entries[0]["offset"]
+    print(f"回放轨迹: {trace_file}, 请求数: {len(entries)}, 原始时长: {span:.2f}秒, "
+          f"倍速: {time_scale}x, 预计时长: {span / time_scale:.2f}秒")
+    print(f"模型名称: {config['model_name']}")
+    print(f"按记录的输出长度回放: {'开启' if config['trace'].get('match_output_length', True) else '关闭'}")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = os.path.join(results_dir, f"all_results_{timestamp}.jsonl")
+    results_writer = ResultsWriter(results_file, {
+        "config": config,
+        "timestamp": datetime.now().isoformat(),
+        "total_files": len(entries),
+        "trace": trace_file
+    })
+
+    pressure.test_metrics = MetricsRegistry()
+    metrics_server = pressure.start_metrics_server(config, lambda: {"test": pressure.test_metrics.snapshot()})
+    reporter = MetricsReporter(pressure.test_metrics, report_replay_progress, config.get("report_interval", 10))
+    reporter.start()
+
+    run_start = time.time()
+    try:
+        asyncio.run(replay_dispatcher(config, entries, results_writer))
+    except KeyboardInterrupt:
+        print("轨迹回放被中断")
+    reporter.stop()
+    if metrics_server:
+        metrics_server.stop()
+
+    elapsed = time.time() - run_start
+    snapshot = pressure.test_metrics.snapshot()
+    counters = snapshot.counters
+    latency_stats = {name: snapshot.histograms[name].summary() for name in ("e2e", "ttft", "tpot", "itl", "schedule_lag")}
+    token_stats = snapshot.token_summary(elapsed)
+    goodput_stats = snapshot.goodput_summary(elapsed, config["slo"]) if slo_enabled(config.get("slo")) else None
+    results_writer.close({
+        "successful_requests": counters["successful_requests"],
+        "failed_requests": counters["failed_requests"],
+        "success_rate": counters["successful_requests"] / len(entries) * 100,
+        "latency_stats": latency_stats,
+        "token_stats": token_stats,
+        "goodput_stats": goodput_stats,
+        "time_scale": time_scale,
+        "capped_requests": counters["capped_requests"]
+    })
+
+    print("\n" + "=" * 50)
+    print("轨迹回放完成!")
+    print(f"总请求数: {len(entries)}")
+    print(f"成功请求: {counters['successful_requests']}")
+    print(f"失败请求: {counters['failed_requests']}")
+    print(f"成功率: {counters['successful_requests'] / len(entries) * 100:.1f}%")
+    print(f"QPS: {counters['total_requests'] / elapsed:.2f} (轨迹原始 QPS x 倍速: "
+          f"{len(entries) / span * time_scale if span > 0 else 0:.2f})")
+    for line in format_latency_summary(latency_stats):
+        print(line)
+    for line in format_token_summary(token_stats):
+        print(line)
+    if goodput_stats:
+        for line in format_goodput_summary(goodput_stats):
+            print(line)
+    print(f"受在途上限限制的请求数: {counters['capped_requests']}")
+    print(f"\n所有结果已保存到: {results_file}")